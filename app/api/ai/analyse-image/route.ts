@@ -2,7 +2,8 @@ import { type NextRequest, NextResponse } from "next/server"
 import { writeFile, mkdir } from "fs/promises"
 import { existsSync } from "fs"
 import path from "path"
-import { spawn } from "child_process"
+import { spawn, type ChildProcessWithoutNullStreams } from "child_process"
+import { createInterface } from "readline"
 
 export async function POST(request: NextRequest) {
   try {
@@ -25,16 +26,17 @@ export async function POST(request: NextRequest) {
     const filename = `${Date.now()}-${file.name}`
     const filepath = path.join(uploadsDir, filename)
 
-    await writeFile(filepath, buffer)
-
-    // Run AI analysis using the Kaggle-trained model
-    const analysisResult = await analyzeImageWithKaggleModel(filepath)
+    // Archive the upload while the model analyses the bytes straight from memory
+    const [analysisResult] = await Promise.all([
+      analyzeImageWithKaggleModel(buffer, filepath),
+      writeFile(filepath, buffer),
+    ])
 
     return NextResponse.json({
       success: true,
       analysis: analysisResult,
       filename: filename,
-      model_version: "Kaggle Pothole Detector v2.0",
+      model_version: analysisResult?.prediction?.model_version ?? "Kaggle Pothole Detector v2.0",
     })
   } catch (error) {
     console.error("Error analyzing image:", error)
@@ -48,39 +50,145 @@ export async function POST(request: NextRequest) {
   }
 }
 
-function analyzeImageWithKaggleModel(imagePath: string): Promise<any> {
-  return new Promise((resolve, reject) => {
-    const pythonScript = path.join(process.cwd(), "scripts", "predict_image_kaggle.py")
-    const pythonProcess = spawn("python", [pythonScript, imagePath])
+type PendingAnalysis = {
+  worker: ChildProcessWithoutNullStreams
+  resolve: (value: any) => void
+  reject: (reason: Error) => void
+  timer: NodeJS.Timeout
+}
 
-    let result = ""
-    let error = ""
+const ANALYSIS_TIMEOUT_MS = 30000
+const PING_TIMEOUT_MS = 5000
 
-    pythonProcess.stdout.on("data", (data) => {
-      result += data.toString()
-    })
+// One long-lived predictor process keeps the model warm between uploads
+let kaggleWorker: ChildProcessWithoutNullStreams | null = null
+const pendingAnalyses = new Map<string, PendingAnalysis>()
+let nextRequestId = 0
+// Workers with a health check in flight, so a burst of timeouts pings once
+const checkingWorkers = new Set<ChildProcessWithoutNullStreams>()
 
-    pythonProcess.stderr.on("data", (data) => {
-      error += data.toString()
-    })
+class AnalysisTimeoutError extends Error {}
 
-    pythonProcess.on("close", (code) => {
-      if (code === 0) {
-        try {
-          const analysis = JSON.parse(result)
-          resolve(analysis)
-        } catch (e) {
-          reject(new Error(`Failed to parse AI analysis result: ${result}`))
-        }
-      } else {
-        reject(new Error(`Python script failed with code ${code}: ${error}`))
-      }
-    })
+function failPendingAnalyses(worker: ChildProcessWithoutNullStreams, reason: Error) {
+  for (const [id, pending] of pendingAnalyses) {
+    if (pending.worker !== worker) {
+      continue
+    }
+    clearTimeout(pending.timer)
+    pending.reject(reason)
+    pendingAnalyses.delete(id)
+  }
+}
+
+function getKaggleWorker(): ChildProcessWithoutNullStreams {
+  if (kaggleWorker && kaggleWorker.exitCode === null) {
+    return kaggleWorker
+  }
+
+  const pythonScript = path.join(process.cwd(), "scripts", "predict_image_kaggle.py")
+  const worker = spawn("python", [pythonScript, "--serve"])
+  let error = ""
+
+  createInterface({ input: worker.stdout }).on("line", (line) => {
+    let response: any
+    try {
+      response = JSON.parse(line)
+    } catch (e) {
+      console.error(`Failed to parse AI analysis result: ${line}`)
+      return
+    }
+
+    const pending = response.id !== undefined ? pendingAnalyses.get(response.id) : undefined
+    if (!pending) {
+      // Includes late answers to requests that already timed out
+      return
+    }
+
+    pendingAnalyses.delete(response.id)
+    clearTimeout(pending.timer)
+    delete response.id
+    pending.resolve(response)
+  })
+
+  worker.stderr.on("data", (data) => {
+    // Keep only the tail of the worker's diagnostics for error reporting
+    error = (error + data.toString()).slice(-4000)
+  })
+
+  worker.on("close", (code) => {
+    if (kaggleWorker === worker) {
+      kaggleWorker = null
+    }
+    failPendingAnalyses(worker, new Error(`Python script failed with code ${code}: ${error}`))
+  })
 
-    // Set timeout for long-running predictions
-    setTimeout(() => {
-      pythonProcess.kill()
-      reject(new Error("AI analysis timed out"))
-    }, 30000) // 30 second timeout
+  // A python binary that cannot be launched, or a write to a worker that has
+  // already died, emits 'error'; without a handler it would take down the server
+  worker.on("error", (err) => {
+    if (kaggleWorker === worker) {
+      kaggleWorker = null
+    }
+    failPendingAnalyses(worker, new Error(`Failed to run Python script: ${err.message}`))
+  })
+
+  worker.stdin.on("error", (err) => {
+    if (kaggleWorker === worker) {
+      kaggleWorker = null
+    }
+    failPendingAnalyses(worker, new Error(`Failed to send image to Python script: ${err.message}`))
+  })
+
+  kaggleWorker = worker
+  return worker
+}
+
+function sendRequest(worker: ChildProcessWithoutNullStreams, request: object, timeoutMs: number): Promise<any> {
+  return new Promise((resolve, reject) => {
+    const id = String(nextRequestId++)
+    const timer = setTimeout(() => {
+      // Only this request fails; the worker keeps serving the others
+      pendingAnalyses.delete(id)
+      reject(new AnalysisTimeoutError("AI analysis timed out"))
+    }, timeoutMs)
+
+    pendingAnalyses.set(id, { worker, resolve, reject, timer })
+    worker.stdin.write(JSON.stringify({ ...request, id }) + "\n")
   })
 }
+
+async function checkWorkerHealth(worker: ChildProcessWithoutNullStreams) {
+  if (checkingWorkers.has(worker) || worker.exitCode !== null) {
+    return
+  }
+  checkingWorkers.add(worker)
+  try {
+    // The worker answers pings from its request loop, ahead of queued images
+    await sendRequest(worker, { cmd: "ping" }, PING_TIMEOUT_MS)
+  } catch (e) {
+    // Unresponsive: the next request starts a fresh worker, and the close
+    // handler fails whatever was still waiting on this one
+    console.error("AI worker did not answer a health check, restarting it")
+    if (kaggleWorker === worker) {
+      kaggleWorker = null
+    }
+    worker.kill()
+  } finally {
+    checkingWorkers.delete(worker)
+  }
+}
+
+async function analyzeImageWithKaggleModel(image: Buffer, imagePath: string): Promise<any> {
+  const worker = getKaggleWorker()
+  try {
+    return await sendRequest(
+      worker,
+      { image_b64: image.toString("base64"), report_id: imagePath },
+      ANALYSIS_TIMEOUT_MS,
+    )
+  } catch (error) {
+    if (error instanceof AnalysisTimeoutError) {
+      void checkWorkerHealth(worker)
+    }
+    throw error
+  }
+}
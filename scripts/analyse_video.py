@@ -0,0 +1,281 @@
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import contextlib
+
+import numpy as np
+
+from inference_backends import BACKENDS
+from model_registry import ModelRegistry
+from near_duplicate_index import dhash
+from bulk_predict import list_images
+from predict_image_kaggle import KagglePotholeDetector, resolve_model_path, import_cv2
+
+def iter_sampled_frames(source, sample_fps=2.0, sequence_fps=30.0):
+    """
+    Yield (frame_index, timestamp_s, bgr_frame) for the sampled frames of a
+    video file or a directory of frame images.
+
+    Frames between samples are only grabbed, not retrieved, so the decoder
+    skips the colour conversion and copy for them.
+    """
+    cv2 = import_cv2()
+
+    if os.path.isdir(source):
+        frame_paths = list_images(source)
+        step = max(1, round(sequence_fps / sample_fps))
+        for index in range(0, len(frame_paths), step):
+            frame = cv2.imread(frame_paths[index])
+            if frame is not None:
+                yield index, index / sequence_fps, frame
+        return
+
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video: {source}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or sequence_fps
+    step = max(1, round(fps / sample_fps))
+    index = 0
+    try:
+        while True:
+            if index % step:
+                if not capture.grab():
+                    break
+            else:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                yield index, index / fps, frame
+            index += 1
+    finally:
+        capture.release()
+
+def source_info(source, sequence_fps=30.0):
+    """Frame rate and duration of a video file or frame directory"""
+    if os.path.isdir(source):
+        frames = len(list_images(source))
+        return {'fps': sequence_fps, 'frames': frames, 'duration_s': frames / sequence_fps}
+
+    cv2 = import_cv2()
+    capture = cv2.VideoCapture(source)
+    fps = capture.get(cv2.CAP_PROP_FPS) or sequence_fps
+    frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    capture.release()
+    return {'fps': fps, 'frames': frames, 'duration_s': frames / fps if fps else 0.0}
+
+def produce_batches(detector, frames, output, batch_size=32, skip_distance=4):
+    """
+    Decode thread: preprocess sampled frames and queue them in batches.
+
+    Each entry is (frame_index, timestamp_s, image), with image None when
+    the frame's dHash is within skip_distance bits of the last frame sent
+    for scoring; the consumer reuses that frame's score instead.
+    """
+    batch = []
+    last_hash = None
+    try:
+        for index, timestamp, frame in frames:
+            image = detector.preprocess_image(frame)
+            frame_hash = dhash(image)
+            if last_hash is not None and bin(frame_hash ^ last_hash).count('1') <= skip_distance:
+                image = None
+            else:
+                last_hash = frame_hash
+            batch.append((index, timestamp, image))
+            if sum(entry[2] is not None for entry in batch) >= batch_size:
+                output.put(batch)
+                batch = []
+        if batch:
+            output.put(batch)
+    except Exception as e:
+        output.put(e)
+    output.put(None)
+
+def score_frames(detector, frames, batch_size=32, skip_distance=4, prefetch=2):
+    """
+    Score sampled frames with decoding and inference pipelined.
+
+    A decode thread fills a bounded queue while this thread runs the model,
+    so both stay busy without buffering the whole video. Returns a list of
+    per-frame records in frame order.
+    """
+    batches = queue.Queue(maxsize=prefetch)
+    producer = threading.Thread(target=produce_batches,
+                                args=(detector, frames, batches, batch_size, skip_distance),
+                                name="video-decode", daemon=True)
+    producer.start()
+
+    records = []
+    last_probability = None
+    while True:
+        batch = batches.get()
+        if batch is None:
+            break
+        if isinstance(batch, Exception):
+            raise batch
+
+        images = [image for _, _, image in batch if image is not None]
+        scores = iter(())
+        if images:
+            probabilities, _, _ = detector.predict_probabilities(images)
+            scores = iter(np.asarray(probabilities)[:, 1])
+
+        for index, timestamp, image in batch:
+            scored = image is not None
+            if scored:
+                last_probability = float(next(scores))
+            records.append({
+                'frame': index,
+                'time_s': round(timestamp, 3),
+                'pothole_probability': last_probability,
+                'scored': scored
+            })
+
+    producer.join()
+    return records
+
+def build_timeline(records, segment_seconds=5.0, threshold=0.7, max_gap_s=1.0):
+    """
+    Summarise per-frame scores into fixed-length segments and pothole events.
+
+    An event is a run of frames at or above threshold; runs separated by
+    at most max_gap_s are merged, so one pothole seen over several
+    samples is reported once.
+    """
+    segments = {}
+    for record in records:
+        probability = record['pothole_probability'] or 0.0
+        key = int(record['time_s'] // segment_seconds)
+        segment = segments.setdefault(key, {
+            'start_s': key * segment_seconds,
+            'end_s': (key + 1) * segment_seconds,
+            'frames': 0,
+            'scored_frames': 0,
+            'pothole_frames': 0,
+            'max_probability': 0.0,
+            'probability_sum': 0.0
+        })
+        segment['frames'] += 1
+        segment['scored_frames'] += record['scored']
+        segment['pothole_frames'] += probability >= threshold
+        segment['max_probability'] = max(segment['max_probability'], probability)
+        segment['probability_sum'] += probability
+
+    timeline = []
+    for key in sorted(segments):
+        segment = segments[key]
+        segment['mean_probability'] = segment.pop('probability_sum') / segment['frames']
+        segment['has_pothole'] = segment['pothole_frames'] > 0
+        timeline.append(segment)
+
+    events = []
+    for record in records:
+        probability = record['pothole_probability'] or 0.0
+        if probability < threshold:
+            continue
+        if events and record['time_s'] - events[-1]['end_s'] <= max_gap_s:
+            event = events[-1]
+            event['end_s'] = record['time_s']
+            event['frames'] += 1
+            if probability > event['peak_probability']:
+                event['peak_probability'] = probability
+                event['peak_frame'] = record['frame']
+                event['peak_time_s'] = record['time_s']
+        else:
+            events.append({
+                'start_s': record['time_s'],
+                'end_s': record['time_s'],
+                'frames': 1,
+                'peak_probability': probability,
+                'peak_frame': record['frame'],
+                'peak_time_s': record['time_s']
+            })
+
+    return timeline, events
+
+def main():
+    parser = argparse.ArgumentParser(description="Pothole timeline for dashcam video or frame sequences")
+    parser.add_argument('source', help="Video file, or directory of frame images in order")
+    parser.add_argument('--output', help="JSON report file (default: stdout)")
+    parser.add_argument('--sample-fps', type=float, default=2.0, help="Frames per second of footage to analyse")
+    parser.add_argument('--sequence-fps', type=float, default=30.0,
+                        help="Frame rate of a frame directory (or of a video that does not report one)")
+    parser.add_argument('--skip-distance', type=int, default=4,
+                        help="Reuse the last score for frames within this many dHash bits of it (-1 disables)")
+    parser.add_argument('--segment-seconds', type=float, default=5.0)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--confidence-threshold', type=float, default=0.7)
+    parser.add_argument('--include-frames', action='store_true', help="Add per-frame scores to the report")
+    parser.add_argument('--models-dir', default='models')
+    parser.add_argument('--model', help="Model file to use (.h5 or INT8 .tflite)")
+    parser.add_argument('--registry', default=None,
+                        help="Model registry (default: <models-dir>/registry), used when --model is not given")
+    parser.add_argument('--backend', choices=sorted(BACKENDS),
+                        help="Inference engine (default: chosen from the model file)")
+    parser.add_argument('--screener', help="Screening model for a two-stage cascade")
+    parser.add_argument('--screening-band', type=float, nargs=2, default=(0.1, 0.9), metavar=('LOW', 'HIGH'))
+    args = parser.parse_args()
+
+    if not os.path.exists(args.source):
+        print(json.dumps({"error": "Source not found", "source": args.source}))
+        sys.exit(1)
+
+    registry = ModelRegistry(args.registry or os.path.join(args.models_dir, 'registry'))
+    use_registry = args.model is None and registry.current() is not None
+    if not use_registry:
+        model_path, error_result = resolve_model_path(args.models_dir, args.model)
+        if model_path is None:
+            print(json.dumps(error_result))
+            sys.exit(1)
+
+    detector = KagglePotholeDetector(backend=args.backend)
+    with contextlib.redirect_stdout(sys.stderr):
+        if use_registry:
+            loaded = detector.load_from_registry(registry, warmup_batch_sizes=[args.batch_size])
+        else:
+            loaded = detector.load_model(model_path, warmup_batch_sizes=[args.batch_size])
+        if not loaded:
+            sys.exit(1)
+        if args.screener and not detector.load_screener(args.screener, args.screening_band):
+            sys.exit(1)
+
+    info = source_info(args.source, args.sequence_fps)
+    started = time.perf_counter()
+    frames = iter_sampled_frames(args.source, args.sample_fps, args.sequence_fps)
+    records = score_frames(detector, frames, args.batch_size, args.skip_distance)
+    processing_s = time.perf_counter() - started
+
+    timeline, events = build_timeline(records, args.segment_seconds, args.confidence_threshold)
+    scored = sum(record['scored'] for record in records)
+    report = {
+        'source': args.source,
+        'model_version': detector.model_version,
+        'fps': info['fps'],
+        'duration_s': info['duration_s'],
+        'sample_fps': args.sample_fps,
+        'frames_sampled': len(records),
+        'frames_scored': scored,
+        'frames_skipped': len(records) - scored,
+        'processing_s': processing_s,
+        'realtime_factor': info['duration_s'] / processing_s if processing_s else None,
+        'confidence_threshold': args.confidence_threshold,
+        'segments': timeline,
+        'events': events
+    }
+    if args.include_frames:
+        report['frames'] = records
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Analysed {len(records)} frames ({report['realtime_factor']:.1f}x real time), "
+              f"{len(events)} pothole events; report saved to {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
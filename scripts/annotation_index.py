@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+
+BOX_COLUMNS = ['xmin', 'ymin', 'xmax', 'ymax']
+
+def dict_to_columns(annotations):
+    """
+    Convert {filename: [{'class', 'bbox'}, ...]} into the plain-list column
+    form used by from_parts().
+    """
+    columns = {'filenames': [], 'image_ids': [], 'classes': [], 'boxes': []}
+    for image_id, (filename, anns) in enumerate(annotations.items()):
+        columns['filenames'].append(filename)
+        for ann in anns:
+            bbox = ann['bbox']
+            columns['image_ids'].append(image_id)
+            columns['classes'].append(ann['class'])
+            columns['boxes'].extend((bbox['xmin'], bbox['ymin'], bbox['xmax'], bbox['ymax']))
+    return columns
+
+def window_overlap(windows, boxes):
+    """
+    Largest fraction of each (xmin, ymin, xmax, ymax) window covered by any
+    single box, for (C, 4) windows against (M, 4) boxes in one broadcast.
+    """
+    windows = np.asarray(windows, dtype=np.int64).reshape(-1, 4)
+    boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+    if len(boxes) == 0:
+        return np.zeros(len(windows))
+
+    windows, boxes = windows[:, None, :], boxes[None, :, :]
+    width = np.minimum(windows[..., 2], boxes[..., 2]) - np.maximum(windows[..., 0], boxes[..., 0])
+    height = np.minimum(windows[..., 3], boxes[..., 3]) - np.maximum(windows[..., 1], boxes[..., 1])
+    intersection = np.clip(width, 0, None) * np.clip(height, 0, None)
+    area = (windows[..., 2] - windows[..., 0]) * (windows[..., 3] - windows[..., 1])
+    return (intersection / area).max(axis=1)
+
+class AnnotationIndex:
+    """
+    Columnar bounding-box annotations.
+
+    Boxes are stored as parallel arrays sorted by image: int32 image_ids and
+    class_ids plus an int32 (N, 4) array of xmin, ymin, xmax, ymax. The boxes
+    of image i are rows offsets[i]:offsets[i + 1], and images without boxes
+    keep an empty range. Filenames and class names are stored once each.
+    """
+
+    def __init__(self, filenames, class_names, image_ids, class_ids, boxes):
+        image_ids = np.asarray(image_ids, dtype=np.int32)
+        order = np.argsort(image_ids, kind='stable')
+        self.filenames = list(filenames)
+        self.class_names = list(class_names)
+        self.image_ids = image_ids[order]
+        self.class_ids = np.asarray(class_ids, dtype=np.int32)[order]
+        self.boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)[order]
+        self.offsets = np.zeros(len(self.filenames) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.image_ids, minlength=len(self.filenames)), out=self.offsets[1:])
+
+    @classmethod
+    def from_frame(cls, df, filename_column='filename', class_column='class', default_class='pothole'):
+        """Build from a DataFrame with one row per box and xmin/ymin/xmax/ymax columns"""
+        image_ids, filenames = pd.factorize(df[filename_column])
+        if class_column in df:
+            class_ids, class_names = pd.factorize(df[class_column].astype(str))
+        else:
+            class_ids, class_names = np.zeros(len(df), dtype=np.int32), [default_class]
+        # astype truncates towards zero, like int() on each value
+        boxes = df[BOX_COLUMNS].to_numpy(dtype=np.float64).astype(np.int32)
+        return cls(filenames, class_names, image_ids, class_ids, boxes)
+
+    @classmethod
+    def from_parts(cls, parts):
+        """
+        Merge column dicts from dict_to_columns().
+
+        A filename found in several parts keeps only the boxes of the last
+        one, matching dict.update() over the per-file results.
+        """
+        owner = {}
+        for part_index, part in enumerate(parts):
+            for filename in part['filenames']:
+                owner[filename] = part_index
+
+        filenames, keep_image, image_ids, classes, boxes = [], [], [], [], []
+        for part_index, part in enumerate(parts):
+            base = len(filenames)
+            filenames.extend(part['filenames'])
+            keep_image.extend(owner[filename] == part_index for filename in part['filenames'])
+            image_ids.extend(base + image_id for image_id in part['image_ids'])
+            classes.extend(part['classes'])
+            boxes.extend(part['boxes'])
+
+        keep_image = np.array(keep_image, dtype=bool)
+        image_ids = np.array(image_ids, dtype=np.int64)
+        keep_box = keep_image[image_ids]
+        new_ids = np.cumsum(keep_image) - 1
+        class_ids, class_names = pd.factorize(np.array(classes, dtype=object)[keep_box])
+        return cls(
+            [filename for filename, keep in zip(filenames, keep_image.tolist()) if keep],
+            class_names,
+            new_ids[image_ids[keep_box]],
+            class_ids,
+            np.array(boxes, dtype=np.int32).reshape(-1, 4)[keep_box]
+        )
+
+    @classmethod
+    def concatenate(cls, indexes):
+        """
+        Merge AnnotationIndex objects without leaving the arrays.
+
+        Like from_parts(), a filename found in several indexes keeps only the
+        boxes of the last one, and class names are numbered in order of first
+        appearance among the boxes kept.
+        """
+        if not indexes:
+            return cls([], [], [], [], [])
+
+        owner = {}
+        for index_number, index in enumerate(indexes):
+            for filename in index.filenames:
+                owner[filename] = index_number
+
+        filenames, keep_image, image_ids, class_ids, class_lookup = [], [], [], [], {}
+        for index_number, index in enumerate(indexes):
+            image_ids.append(index.image_ids.astype(np.int64) + len(filenames))
+            filenames.extend(index.filenames)
+            keep_image.extend(owner[filename] == index_number for filename in index.filenames)
+            # Map this index's class ids onto one shared name table
+            names = np.array([class_lookup.setdefault(name, len(class_lookup)) for name in index.class_names] or [0],
+                             dtype=np.int64)
+            class_ids.append(names[index.class_ids])
+
+        class_names = list(class_lookup)
+        keep_image = np.array(keep_image, dtype=bool)
+        image_ids = np.concatenate(image_ids)
+        keep_box = keep_image[image_ids]
+        new_ids = np.cumsum(keep_image) - 1
+        kept_class_ids, kept_classes = pd.factorize(np.concatenate(class_ids)[keep_box])
+        return cls(
+            [filename for filename, keep in zip(filenames, keep_image.tolist()) if keep],
+            [class_names[class_id] for class_id in kept_classes.tolist()],
+            new_ids[image_ids[keep_box]],
+            kept_class_ids,
+            np.concatenate([index.boxes for index in indexes])[keep_box]
+        )
+
+    def __len__(self):
+        return len(self.filenames)
+
+    @property
+    def num_boxes(self):
+        return len(self.boxes)
+
+    def image_boxes(self, image_id):
+        """(M, 4) xmin, ymin, xmax, ymax boxes of one image"""
+        return self.boxes[self.offsets[image_id]:self.offsets[image_id + 1]]
+
+    def image_class_ids(self, image_id):
+        return self.class_ids[self.offsets[image_id]:self.offsets[image_id + 1]]
+
+    def areas(self):
+        """Box areas as int64"""
+        boxes = self.boxes.astype(np.int64)
+        return (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+    def class_counts(self):
+        """{class name: number of boxes}"""
+        counts = np.bincount(self.class_ids, minlength=len(self.class_names))
+        return {name: int(count) for name, count in zip(self.class_names, counts) if count}
@@ -0,0 +1,146 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+class MicroBatchScheduler:
+    """
+    Collect concurrent prediction requests into batched forward passes.
+
+    Requests are queued until either max_batch_size images are waiting or
+    max_wait_ms has passed since the oldest one arrived; the batch is then
+    run through the model once and each caller receives its own prediction.
+    With a LatencyMetrics, per-request queue waits and per-batch forward
+    passes are also recorded as histograms.
+    """
+
+    def __init__(self, detector, max_batch_size=16, max_wait_ms=10, metrics=None):
+        self.detector = detector
+        self.metrics = metrics
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.closed = False
+
+        # Statistics
+        self.requests = 0
+        self.batches = 0
+        self.max_queue_depth = 0
+        self.batch_size_counts = {}
+        self.total_queue_wait = 0.0
+        self.total_predict_time = 0.0
+
+        self.worker = threading.Thread(target=self._run, name="micro-batch-scheduler", daemon=True)
+        self.worker.start()
+
+    def submit(self, image, confidence_threshold=0.7):
+        """Queue one preprocessed image, returning a Future for its prediction dict"""
+        if self.closed:
+            raise RuntimeError("Scheduler is closed")
+
+        future = Future()
+        self.queue.put((image, confidence_threshold, future, time.monotonic()))
+
+        with self.lock:
+            self.requests += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return future
+
+    def predict(self, image, confidence_threshold=0.7):
+        """Blocking convenience wrapper around submit()"""
+        return self.submit(image, confidence_threshold).result()
+
+    def _collect_batch(self):
+        """Wait for the first request, then gather more until the batch is full or the deadline passes"""
+        first = self.queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = first[3] + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Finish the current batch, then stop
+                self.queue.put(None)
+                break
+            batch.append(item)
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                break
+
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                # A failing batch fails its own requests but never stops the scheduler
+                for item in batch:
+                    if not item[2].done():
+                        item[2].set_exception(e)
+
+    def _run_batch(self, batch):
+        # Claim the futures so callers can no longer cancel them mid-batch
+        batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        started = time.monotonic()
+        probabilities, stages, model_version = self.detector.predict_probabilities(
+            [item[0] for item in batch]
+        )
+        finished = time.monotonic()
+
+        predictions = []
+        for i, (item, row) in enumerate(zip(batch, probabilities)):
+            prediction = self.detector.build_prediction(row, item[1], model_version)
+            if stages is not None:
+                prediction['stage'] = str(stages[i])
+            predictions.append(prediction)
+        for item, prediction in zip(batch, predictions):
+            item[2].set_result(prediction)
+
+        with self.lock:
+            self.batches += 1
+            self.batch_size_counts[len(batch)] = self.batch_size_counts.get(len(batch), 0) + 1
+            self.total_queue_wait += sum(started - item[3] for item in batch)
+            self.total_predict_time += finished - started
+
+        if self.metrics is not None:
+            for item in batch:
+                self.metrics.observe('queue_wait', started - item[3])
+            self.metrics.observe('batch_predict', finished - started)
+
+    def stats(self):
+        """Queue depth and batch-size statistics for latency/throughput tuning"""
+        with self.lock:
+            scored = sum(size * count for size, count in self.batch_size_counts.items())
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'requests': self.requests,
+                'batches': self.batches,
+                'queue_depth': self.queue.qsize(),
+                'max_queue_depth': self.max_queue_depth,
+                'mean_batch_size': scored / self.batches if self.batches else 0.0,
+                'batch_size_counts': {str(size): count for size, count in sorted(self.batch_size_counts.items())},
+                'mean_queue_wait_ms': 1000.0 * self.total_queue_wait / scored if scored else 0.0,
+                'mean_predict_ms': 1000.0 * self.total_predict_time / self.batches if self.batches else 0.0
+            }
+
+    def close(self):
+        """Stop accepting work and wait for queued requests to finish"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.worker.join()
@@ -0,0 +1,312 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+
+import numpy as np
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_RESOLUTIONS = ['640x480', '1280x720', '1920x1080', '4032x3024']
+
+def parse_resolution(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+def synthetic_road_image(width, height, seed, with_pothole=True):
+    """
+    Deterministic JPEG of a road scene: textured asphalt, lane markings and
+    optionally a dark pothole. The same arguments always give the same bytes.
+    """
+    import cv2
+
+    rng = np.random.RandomState(seed)
+    # Asphalt texture: grey base with noise and a few cracks
+    img = np.full((height, width, 3), 95, dtype=np.uint8)
+    img = np.clip(img + rng.normal(0, 18, (height, width, 1)), 0, 255).astype(np.uint8)
+    for _ in range(6):
+        start = (int(rng.randint(0, width)), int(rng.randint(0, height)))
+        end = (int(rng.randint(0, width)), int(rng.randint(0, height)))
+        cv2.line(img, start, end, (60, 60, 60), max(1, width // 800))
+
+    # Dashed centre line and solid edge lines
+    thickness = max(2, width // 120)
+    for y in range(0, height, height // 6):
+        cv2.line(img, (width // 2, y), (width // 2, y + height // 12), (230, 230, 230), thickness)
+    cv2.line(img, (width // 10, 0), (width // 10, height), (220, 220, 220), thickness)
+    cv2.line(img, (9 * width // 10, 0), (9 * width // 10, height), (220, 220, 220), thickness)
+
+    if with_pothole:
+        center = (int(rng.randint(width // 4, 3 * width // 4)), int(rng.randint(height // 3, 5 * height // 6)))
+        axes = (int(width * rng.uniform(0.05, 0.15)), int(height * rng.uniform(0.04, 0.1)))
+        cv2.ellipse(img, center, axes, float(rng.uniform(0, 180)), 0, 360, (35, 35, 40), -1)
+
+    ok, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return encoded.tobytes()
+
+def synthetic_images(resolutions, count, seed=0):
+    """{resolution: [jpeg_bytes, ...]} alternating pothole and clean road images"""
+    return {
+        resolution: [
+            synthetic_road_image(*parse_resolution(resolution), seed=seed + i, with_pothole=i % 2 == 0)
+            for i in range(count)
+        ]
+        for resolution in resolutions
+    }
+
+def latency_summary(samples):
+    samples = np.array(samples) * 1000.0
+    return {
+        'samples': len(samples),
+        'mean_ms': float(samples.mean()),
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p95_ms': float(np.percentile(samples, 95)),
+        'p99_ms': float(np.percentile(samples, 99))
+    }
+
+def measure_cold_start(model_path, backend, image_bytes, runs=3):
+    """Wall time of fresh predict_image_kaggle.py processes, with their startup phases"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        image_path = os.path.join(tmp, 'cold_start.jpg')
+        with open(image_path, 'wb') as f:
+            f.write(image_bytes)
+
+        command = [sys.executable, os.path.join(SCRIPTS_DIR, 'predict_image_kaggle.py'), image_path,
+                   '--model', model_path, '--report-startup', '--cache-size', '0']
+        if backend:
+            command += ['--backend', backend]
+
+        for _ in range(runs):
+            started = time.perf_counter()
+            completed = subprocess.run(command, capture_output=True, text=True)
+            wall = time.perf_counter() - started
+            if completed.returncode != 0:
+                raise RuntimeError(f"Cold start run failed: {completed.stdout}{completed.stderr}")
+            # The JSON result follows the "Model loaded" line
+            output = json.loads(completed.stdout[completed.stdout.index('{'):])
+            results.append(dict(output.get('startup', {}), wall_s=wall))
+
+    summary = {'runs': runs}
+    for key in results[0]:
+        summary[key] = float(np.median([result[key] for result in results]))
+    return summary
+
+def measure_config(args):
+    """
+    Latency and throughput for one TF thread setting, run in its own process.
+
+    TensorFlow fixes its thread pools when it initialises, so every thread
+    setting needs a fresh interpreter; run() invokes this through the
+    'measure' command.
+    """
+    if args.intra_threads or args.inter_threads:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(args.intra_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(args.inter_threads)
+
+    from predict_image_kaggle import KagglePotholeDetector
+
+    detector = KagglePotholeDetector(backend=args.backend)
+    with contextlib.redirect_stdout(sys.stderr):
+        if not detector.load_model(args.model):
+            raise RuntimeError(f"Could not load {args.model}")
+
+    images = synthetic_images(args.resolutions, args.images, args.seed)
+
+    latency = {}
+    for resolution, encoded in images.items():
+        # Warm-up passes are not measured
+        for image_bytes in encoded[:args.warmup]:
+            detector.predict_image_bytes(image_bytes)
+        samples = []
+        for i in range(args.iterations):
+            started = time.perf_counter()
+            detector.predict_image_bytes(encoded[i % len(encoded)])
+            samples.append(time.perf_counter() - started)
+        latency[resolution] = latency_summary(samples)
+
+    # Throughput measures the forward pass on already decoded inputs
+    inputs = [detector.decode_image(image_bytes) for image_bytes in images[args.resolutions[0]]]
+    throughput = {}
+    for batch_size in args.batch_sizes:
+        batch = [inputs[i % len(inputs)] for i in range(batch_size)]
+        detector.predict_batch(batch)
+        batches = 0
+        started = time.perf_counter()
+        while batches < 3 or time.perf_counter() - started < args.min_seconds:
+            detector.predict_batch(batch)
+            batches += 1
+        elapsed = time.perf_counter() - started
+        throughput[str(batch_size)] = {
+            'images_per_s': batches * batch_size / elapsed,
+            'batch_ms': 1000.0 * elapsed / batches
+        }
+
+    return {
+        'intra_threads': args.intra_threads,
+        'inter_threads': args.inter_threads,
+        'latency': latency,
+        'throughput': throughput
+    }
+
+def environment_info(model_path, backend):
+    info = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'model': model_path,
+        'model_size_bytes': os.path.getsize(model_path) if os.path.isfile(model_path) else None,
+        'backend': backend
+    }
+    try:
+        info['git_commit'] = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=SCRIPTS_DIR
+        ).stdout.strip() or None
+    except OSError:
+        info['git_commit'] = None
+    return info
+
+def run(args):
+    from predict_image_kaggle import resolve_model_path
+
+    model_path, error_result = resolve_model_path(args.models_dir, args.model)
+    if model_path is None:
+        print(json.dumps(error_result))
+        sys.exit(1)
+
+    report = {
+        'created_at': time.time(),
+        'settings': {
+            'resolutions': args.resolutions,
+            'images': args.images,
+            'iterations': args.iterations,
+            'batch_sizes': args.batch_sizes,
+            'threads': args.threads,
+            'seed': args.seed
+        },
+        'environment': environment_info(model_path, args.backend)
+    }
+
+    print("Measuring cold start...", file=sys.stderr)
+    cold_image = synthetic_road_image(*parse_resolution(args.resolutions[0]), seed=args.seed)
+    report['cold_start'] = measure_cold_start(model_path, args.backend, cold_image, args.cold_runs)
+
+    report['configs'] = []
+    for threads in args.threads:
+        print(f"Measuring with {threads or 'default'} TF threads...", file=sys.stderr)
+        command = [sys.executable, os.path.abspath(__file__), 'measure',
+                   '--model', model_path,
+                   '--intra-threads', str(threads), '--inter-threads', str(min(threads, 2)),
+                   '--resolutions', *args.resolutions,
+                   '--images', str(args.images), '--iterations', str(args.iterations),
+                   '--warmup', str(args.warmup), '--min-seconds', str(args.min_seconds),
+                   '--seed', str(args.seed),
+                   '--batch-sizes', *[str(size) for size in args.batch_sizes]]
+        if args.backend:
+            command += ['--backend', args.backend]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(completed.stderr, file=sys.stderr)
+            sys.exit(1)
+        report['configs'].append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark results saved to {args.output}", file=sys.stderr)
+
+def comparable_metrics(report):
+    """Flatten a report into {name: (value, higher_is_better)}"""
+    metrics = {
+        'cold_start.wall_s': (report['cold_start']['wall_s'], False)
+    }
+    for config in report['configs']:
+        prefix = f"threads={config['intra_threads']}"
+        for resolution, summary in config['latency'].items():
+            for percentile in ('p50_ms', 'p95_ms', 'p99_ms'):
+                metrics[f"{prefix}.latency.{resolution}.{percentile}"] = (summary[percentile], False)
+        for batch_size, summary in config['throughput'].items():
+            metrics[f"{prefix}.throughput.batch{batch_size}"] = (summary['images_per_s'], True)
+    return metrics
+
+def compare(args):
+    """Print the change of every shared metric; exit 1 when any regresses past the tolerance"""
+    with open(args.baseline, 'r') as f:
+        baseline = comparable_metrics(json.load(f))
+    with open(args.candidate, 'r') as f:
+        candidate = comparable_metrics(json.load(f))
+
+    regressions = []
+    for name in sorted(set(baseline) & set(candidate)):
+        base, higher_is_better = baseline[name]
+        value = candidate[name][0]
+        change = (value - base) / base if base else 0.0
+        tolerance = args.throughput_tolerance if higher_is_better else args.latency_tolerance
+        regressed = change < -tolerance if higher_is_better else change > tolerance
+        print(f"{'REGRESSION' if regressed else 'ok':<10} {name:<50} {base:>12.3f} -> {value:>12.3f} ({change:+.1%})")
+        if regressed:
+            regressions.append(name)
+
+    missing = sorted(set(baseline) - set(candidate))
+    if missing:
+        print(f"Not measured in candidate: {', '.join(missing)}")
+
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed beyond tolerance")
+        sys.exit(1)
+    print("No regressions")
+
+def add_workload_arguments(parser):
+    parser.add_argument('--backend', help="Inference engine (default: chosen from the model file)")
+    parser.add_argument('--resolutions', nargs='+', default=DEFAULT_RESOLUTIONS,
+                        help="Synthetic image sizes as WIDTHxHEIGHT")
+    parser.add_argument('--images', type=int, default=8, help="Distinct synthetic images per resolution")
+    parser.add_argument('--iterations', type=int, default=50, help="Timed single-image requests per resolution")
+    parser.add_argument('--warmup', type=int, default=3, help="Untimed requests before measuring")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    parser.add_argument('--min-seconds', type=float, default=2.0, help="Minimum duration of each throughput run")
+    parser.add_argument('--seed', type=int, default=0)
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproducible inference benchmark for KagglePotholeDetector")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Run the benchmark and write a JSON report")
+    run_parser.add_argument('--output', default='benchmarks/inference.json')
+    run_parser.add_argument('--models-dir', default='models')
+    run_parser.add_argument('--model', help="Model file to benchmark")
+    run_parser.add_argument('--threads', type=int, nargs='+', default=[0],
+                            help="TF intra-op thread counts to compare (0 = TensorFlow default)")
+    run_parser.add_argument('--cold-runs', type=int, default=3)
+    add_workload_arguments(run_parser)
+
+    measure_parser = subparsers.add_parser('measure', help=argparse.SUPPRESS)
+    measure_parser.add_argument('--model', required=True)
+    measure_parser.add_argument('--intra-threads', type=int, default=0)
+    measure_parser.add_argument('--inter-threads', type=int, default=0)
+    add_workload_arguments(measure_parser)
+
+    compare_parser = subparsers.add_parser('compare', help="Compare two reports, failing on regressions")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.add_argument('--latency-tolerance', type=float, default=0.10,
+                                help="Allowed relative latency increase")
+    compare_parser.add_argument('--throughput-tolerance', type=float, default=0.10,
+                                help="Allowed relative throughput decrease")
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        run(args)
+    elif args.command == 'measure':
+        print(json.dumps(measure_config(args)))
+    else:
+        compare(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+import os
+import sys
+import csv
+import json
+import argparse
+import zlib
+import hashlib
+import contextlib
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from inference_backends import BACKENDS
+from model_registry import ModelRegistry
+from prediction_ledger import PredictionLedger
+from predict_image_kaggle import KagglePotholeDetector, resolve_model_path, analyse_prediction
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+# Header names recognised for the image path column of a CSV manifest
+MANIFEST_PATH_COLUMNS = ('image_path', 'path', 'filename', 'file', 'image')
+
+def list_images(source):
+    """List images from a directory (recursively) or a manifest file, in a stable order"""
+    source = Path(source)
+
+    if source.is_dir():
+        return sorted(
+            str(path) for path in source.rglob('*')
+            if path.suffix.lower() in IMAGE_EXTENSIONS
+        )
+    return read_manifest(source)
+
+def read_manifest(manifest_path):
+    """
+    Image paths from a CSV manifest.
+
+    Each row names one image in its first column; further columns are
+    ignored, and fields containing commas must be quoted. Blank lines and
+    lines starting with '#' are skipped. An optional header row is detected
+    either by a column named one of MANIFEST_PATH_COLUMNS, which then selects
+    the path column, or by a first field without an image extension.
+    Relative paths are resolved against the manifest's directory.
+    """
+    manifest_path = Path(manifest_path)
+    image_paths = []
+    column = 0
+    with open(manifest_path, 'r', newline='') as f:
+        lines = (line for line in f if line.strip() and not line.lstrip().startswith('#'))
+        for row_number, row in enumerate(csv.reader(lines)):
+            if row_number == 0:
+                names = [name.strip().lower() for name in row]
+                header_columns = [names.index(name) for name in MANIFEST_PATH_COLUMNS if name in names]
+                if header_columns:
+                    column = header_columns[0]
+                    continue
+                if not row[0].strip().lower().endswith(IMAGE_EXTENSIONS):
+                    print(f"Skipping manifest header row: {row}", file=sys.stderr)
+                    continue
+
+            if column >= len(row) or not row[column].strip():
+                continue
+            path = Path(row[column].strip())
+            if not path.is_absolute():
+                path = manifest_path.parent / path
+            image_paths.append(str(path))
+    return image_paths
+
+def parse_shard(shard):
+    """Parse an 'i/N' shard spec into (index, count)"""
+    try:
+        index, count = (int(part) for part in shard.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid shard '{shard}', expected i/N")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Invalid shard '{shard}', need 0 <= i < N")
+    return index, count
+
+def source_root(source):
+    """Directory that image paths of a source are resolved against: the directory itself, or the manifest's"""
+    source = Path(source)
+    return source if source.is_dir() else source.parent
+
+def shard_key(image_path, root):
+    """
+    Image path relative to root with forward slashes, so hosts that mount the
+    source at different places, or pass it as a relative path, hash the same
+    string. Paths outside root keep their normalised absolute form.
+    """
+    path = Path(os.path.abspath(image_path))
+    try:
+        return path.relative_to(os.path.abspath(root)).as_posix()
+    except ValueError:
+        return path.as_posix()
+
+def in_shard(image_path, shard_index, shard_count, root='.'):
+    """Stable assignment of an image to a shard, identical across processes and hosts"""
+    return zlib.crc32(shard_key(image_path, root).encode('utf-8')) % shard_count == shard_index
+
+class BulkCheckpoint:
+    """
+    Append-only checkpoint recording which images have been written.
+
+    Each line records the images of one flushed batch together with the
+    output position after the flush, so a crash between writing results and
+    recording them can be rolled back on resume instead of duplicating rows.
+    """
+
+    def __init__(self, checkpoint_path):
+        self.checkpoint_path = Path(checkpoint_path)
+        self.completed = set()
+        self.position = None
+
+        if self.checkpoint_path.exists():
+            with open(self.checkpoint_path, 'r+b') as f:
+                valid_end = 0
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        entry = None
+                    if entry is None or not line.endswith(b"\n"):
+                        # Torn final line from a crash; cut it so new entries start on a fresh line
+                        f.truncate(valid_end)
+                        break
+                    self.completed.update(entry['images'])
+                    self.position = entry['position']
+                    valid_end += len(line)
+
+    def record(self, image_paths, position):
+        with open(self.checkpoint_path, 'a') as f:
+            f.write(json.dumps({'images': image_paths, 'position': position}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.completed.update(image_paths)
+        self.position = position
+
+class NDJSONResultWriter:
+    """Stream results as one JSON object per line"""
+
+    def __init__(self, output_path, position=None):
+        self.output_path = Path(output_path)
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.output_path, 'a+b')
+        # Drop anything written after the last checkpointed flush
+        self.file.truncate(position or 0)
+        self.file.seek(0, os.SEEK_END)
+
+    def write(self, rows):
+        for row in rows:
+            self.file.write((json.dumps(row) + "\n").encode('utf-8'))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+class ParquetResultWriter:
+    """Write each flushed batch as its own part file inside an output directory"""
+
+    def __init__(self, output_path, position=None):
+        import pandas as pd  # Only needed for Parquet output
+        import pyarrow as pa
+        self.pd = pd
+        # Fixed column types, so a part whose rows are all None (such as a
+        # batch without errors) still reads back together with the others
+        self.schema = pa.schema([
+            ('image_path', pa.string()),
+            ('error', pa.string()),
+            ('model_version', pa.string()),
+            ('stage', pa.string()),
+            ('class', pa.string()),
+            ('confidence', pa.float64()),
+            ('is_pothole', pa.bool_()),
+            ('is_reliable', pa.bool_()),
+            ('raw_prediction', pa.list_(pa.float64())),
+            ('confidence_threshold', pa.float64()),
+            ('severity', pa.int64()),
+            ('action_priority', pa.string()),
+            ('estimated_size', pa.string())
+        ])
+        self.output_path = Path(output_path)
+        self.output_path.mkdir(parents=True, exist_ok=True)
+        self.part = position or 0
+        # Remove parts written after the last checkpointed flush
+        for part_file in self.output_path.glob('part-*.parquet'):
+            if int(part_file.stem.split('-')[-1]) >= self.part:
+                part_file.unlink()
+
+    def write(self, rows):
+        flat_rows = [flatten_result(row) for row in rows]
+        part_file = self.output_path / f"part-{self.part:06d}.parquet"
+        frame = self.pd.DataFrame(flat_rows, columns=self.schema.names)
+        frame.to_parquet(part_file, index=False, schema=self.schema)
+        self.part += 1
+        return self.part
+
+    def close(self):
+        pass
+
+def flatten_result(row):
+    """Flatten an analysis row into scalar columns for tabular output"""
+    prediction = row.get('prediction') or {}
+    return {
+        'image_path': row['image_path'],
+        'error': row.get('error'),
+        'model_version': prediction.get('model_version'),
+        'stage': prediction.get('stage'),
+        'class': prediction.get('class'),
+        'confidence': prediction.get('confidence'),
+        'is_pothole': prediction.get('is_pothole'),
+        'is_reliable': prediction.get('is_reliable'),
+        'raw_prediction': prediction.get('raw_prediction'),
+        'confidence_threshold': prediction.get('confidence_threshold'),
+        'severity': row.get('severity'),
+        'action_priority': row.get('action_priority'),
+        'estimated_size': row.get('estimated_size')
+    }
+
+def load_image_with_digest(detector, image_path):
+    """Decode an image and return it with the SHA-256 of its bytes, for the prediction ledger"""
+    image_bytes = detector.read_image_bytes(image_path)
+    if image_bytes is None:
+        return None, None
+    return detector.decode_image(image_bytes), hashlib.sha256(image_bytes).hexdigest()
+
+def iter_decoded_batches(detector, image_paths, batch_size, executor):
+    """
+    Yield (paths, images, digests) batches, decoding the next batch while
+    the current one is scored. Digests are only computed when the detector
+    has a ledger, and are None otherwise.
+    """
+    batches = [image_paths[i:i + batch_size] for i in range(0, len(image_paths), batch_size)]
+    if not batches:
+        return
+
+    def load(path):
+        if detector.ledger is not None:
+            return load_image_with_digest(detector, path)
+        return detector.load_image(path), None
+
+    pending = [executor.submit(load, path) for path in batches[0]]
+    for index, batch in enumerate(batches):
+        loaded = [future.result() for future in pending]
+        if index + 1 < len(batches):
+            pending = [executor.submit(load, path) for path in batches[index + 1]]
+        yield batch, [image for image, _ in loaded], [digest for _, digest in loaded]
+
+def run_bulk(detector, image_paths, writer, checkpoint, batch_size=32,
+             decode_workers=8, confidence_threshold=0.7):
+    """Score all images in batches, writing and checkpointing after every batch"""
+    processed = 0
+    failed = 0
+
+    with ThreadPoolExecutor(max_workers=decode_workers) as executor:
+        for batch_paths, decoded, digests in iter_decoded_batches(detector, image_paths, batch_size, executor):
+            valid = [i for i, img in enumerate(decoded) if img is not None]
+            predictions = detector.predict_batch([decoded[i] for i in valid], confidence_threshold)
+            by_index = dict(zip(valid, predictions))
+            for i in valid:
+                detector.record_in_ledger(digests[i], by_index[i], batch_paths[i])
+
+            rows = []
+            for i, image_path in enumerate(batch_paths):
+                if i in by_index:
+                    row = analyse_prediction(by_index[i])
+                else:
+                    row = {"error": "Could not load image"}
+                    failed += 1
+                row['image_path'] = image_path
+                rows.append(row)
+
+            position = writer.write(rows)
+            checkpoint.record(batch_paths, position)
+            processed += len(batch_paths)
+            print(f"Processed {processed}/{len(image_paths)} images", file=sys.stderr)
+
+    return {'processed': processed, 'failed': failed}
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk pothole analysis over a directory or manifest")
+    parser.add_argument('source', help="Image directory or CSV manifest (image path in the first column)")
+    parser.add_argument('--output', required=True,
+                        help="Output .ndjson file, or .parquet directory of part files")
+    parser.add_argument('--shard', type=parse_shard, default=(0, 1), help="Shard to process, as i/N")
+    parser.add_argument('--checkpoint', help="Checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument('--screener', help="Screening model for a two-stage cascade")
+    parser.add_argument('--screening-band', type=float, nargs=2, default=(0.1, 0.9), metavar=('LOW', 'HIGH'))
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--decode-workers', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--confidence-threshold', type=float, default=0.7)
+    parser.add_argument('--ledger', help="SQLite prediction ledger recording every prediction for later re-scoring")
+    parser.add_argument('--models-dir', default='models')
+    parser.add_argument('--model', help="Model file to use (.h5 or INT8 .tflite)")
+    parser.add_argument('--registry', default=None,
+                        help="Model registry (default: <models-dir>/registry), used when --model is not given")
+    parser.add_argument('--backend', choices=sorted(BACKENDS),
+                        help="Inference engine (default: chosen from the model file)")
+    args = parser.parse_args()
+
+    shard_index, shard_count = args.shard
+    root = source_root(args.source)
+    image_paths = [
+        path for path in list_images(args.source)
+        if in_shard(path, shard_index, shard_count, root)
+    ]
+
+    checkpoint = BulkCheckpoint(args.checkpoint or f"{args.output.rstrip('/')}.checkpoint")
+    remaining = [path for path in image_paths if path not in checkpoint.completed]
+    print(f"Shard {shard_index}/{shard_count}: {len(image_paths)} images, "
+          f"{len(image_paths) - len(remaining)} already done", file=sys.stderr)
+
+    if not remaining:
+        return
+
+    registry = ModelRegistry(args.registry or os.path.join(args.models_dir, 'registry'))
+    use_registry = args.model is None and registry.current() is not None
+    if not use_registry:
+        model_path, error_result = resolve_model_path(args.models_dir, args.model)
+        if model_path is None:
+            print(json.dumps(error_result))
+            sys.exit(1)
+
+    ledger = PredictionLedger(args.ledger) if args.ledger else None
+    detector = KagglePotholeDetector(backend=args.backend, ledger=ledger)
+    with contextlib.redirect_stdout(sys.stderr):
+        if use_registry:
+            loaded = detector.load_from_registry(registry)
+        else:
+            loaded = detector.load_model(model_path)
+        if not loaded:
+            sys.exit(1)
+        if args.screener and not detector.load_screener(args.screener, args.screening_band):
+            sys.exit(1)
+
+    if args.output.endswith('.parquet'):
+        writer = ParquetResultWriter(args.output, checkpoint.position)
+    else:
+        writer = NDJSONResultWriter(args.output, checkpoint.position)
+
+    try:
+        summary = run_bulk(
+            detector, remaining, writer, checkpoint,
+            batch_size=args.batch_size,
+            decode_workers=args.decode_workers,
+            confidence_threshold=args.confidence_threshold
+        )
+    finally:
+        writer.close()
+        if ledger is not None:
+            ledger.close()
+
+    print(json.dumps(summary), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import shutil
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+SHARD_FORMAT_VERSION = 2
+SHARD_INDEX = 'index.json'
+LABELS_FILE = 'labels.npy'
+GENERATION_PREFIX = 'generation-'
+# Label order matches the trainer's class_names
+CLASSIFICATION_CLASSES = ['no_pothole', 'pothole']
+
+def decode_sample(path, image_size):
+    """Read one crop as RGB uint8 at image_size (width, height), or None if unreadable"""
+    image = cv2.imread(str(path))
+    if image is None:
+        return None
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    return cv2.resize(image, image_size)
+
+def write_shards(samples, output_path, class_names=CLASSIFICATION_CLASSES, image_size=(224, 224),
+                 shard_size=1024, workers=None):
+    """
+    Decode (path, label) samples into fixed-shape uint8 .npy shards.
+
+    Writes images-NNNNN.npy files of shape (n, height, width, 3) in RGB and
+    one labels.npy vector into a new generation-* directory, then points
+    index.json at it with an atomic replace. Files of the previous
+    generation are never modified, so readers see either the old dataset or
+    the new one, and the old generation is only deleted after the switch.
+    Returns the number of samples written.
+    """
+    output_path = Path(output_path)
+    output_path.mkdir(parents=True, exist_ok=True)
+    width, height = image_size
+    generation = f"{GENERATION_PREFIX}{time.time_ns()}-{os.getpid()}"
+    generation_path = output_path / generation
+    generation_path.mkdir()
+
+    shards, labels = [], []
+    try:
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 4) as executor:
+            for start in range(0, len(samples), shard_size):
+                chunk = samples[start:start + shard_size]
+                images = list(executor.map(lambda sample: decode_sample(sample[0], image_size), chunk))
+                valid = [i for i, image in enumerate(images) if image is not None]
+                if len(valid) < len(chunk):
+                    print(f"Skipped {len(chunk) - len(valid)} unreadable images")
+                if not valid:
+                    continue
+
+                filename = f"images-{len(shards):05d}.npy"
+                shard = np.lib.format.open_memmap(generation_path / filename, mode='w+', dtype=np.uint8,
+                                                  shape=(len(valid), height, width, 3))
+                for row, i in enumerate(valid):
+                    shard[row] = images[i]
+                shard.flush()
+                del shard
+                shards.append({'file': filename, 'count': len(valid)})
+                labels.extend(chunk[i][1] for i in valid)
+
+        np.save(generation_path / LABELS_FILE, np.asarray(labels, dtype=np.uint8))
+        tmp_path = output_path / f".{SHARD_INDEX}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'version': SHARD_FORMAT_VERSION,
+                'generation': generation,
+                'image_shape': [height, width, 3],
+                'class_names': list(class_names),
+                'count': len(labels),
+                'shards': shards
+            }, f, indent=2)
+        os.replace(tmp_path, output_path / SHARD_INDEX)
+    except BaseException:
+        shutil.rmtree(generation_path, ignore_errors=True)
+        raise
+
+    # Earlier generations, and the flat layout of format version 1; readers
+    # that still have them mapped keep their data until they close it
+    for stale in output_path.iterdir():
+        if stale.name.startswith(GENERATION_PREFIX) and stale.name != generation:
+            shutil.rmtree(stale, ignore_errors=True)
+        elif stale.name == LABELS_FILE or (stale.name.startswith('images-') and stale.suffix == '.npy'):
+            stale.unlink()
+
+    print(f"Wrote {len(labels)} images to {len(shards)} shards in {generation_path}")
+    return len(labels)
+
+class ClassificationShards:
+    """
+    Read-only dataset over shards written by write_shards().
+
+    Every shard is memory-mapped, so opening the dataset reads nothing; take()
+    gathers the requested rows straight from the page cache into one float
+    array, converting each chunk on the way instead of copying the uint8
+    data first.
+    """
+
+    def __init__(self, shard_path, attempts=3):
+        self.shard_path = Path(shard_path)
+        for attempt in range(attempts):
+            with open(self.shard_path / SHARD_INDEX, 'r') as f:
+                index = json.load(f)
+            if index.get('version') != SHARD_FORMAT_VERSION:
+                raise ValueError(f"Unsupported shard format version {index.get('version')} in {shard_path}")
+
+            generation_path = self.shard_path / index['generation']
+            try:
+                self.shards = [np.load(generation_path / shard['file'], mmap_mode='r') for shard in index['shards']]
+                self.labels = np.load(generation_path / LABELS_FILE).astype(np.int64)
+                break
+            except FileNotFoundError:
+                # A rebuild switched generations between reading the index and the shards
+                if attempt == attempts - 1:
+                    raise
+
+        self.image_shape = tuple(index['image_shape'])
+        self.class_names = index['class_names']
+        self.offsets = np.cumsum([0] + [len(shard) for shard in self.shards])
+
+    @staticmethod
+    def exists(shard_path):
+        """True if shard_path holds a dataset in the current format"""
+        try:
+            with open(Path(shard_path) / SHARD_INDEX, 'r') as f:
+                return json.load(f).get('version') == SHARD_FORMAT_VERSION
+        except (OSError, ValueError):
+            return False
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def take(self, indices, chunk_size=256):
+        """Images at indices as float32 in [0, 1], in the order given"""
+        indices = np.asarray(indices, dtype=np.int64)
+        output = np.empty((len(indices),) + self.image_shape, dtype=np.float32)
+        shard_ids = np.searchsorted(self.offsets, indices, side='right') - 1
+
+        for shard_id, shard in enumerate(self.shards):
+            positions = np.nonzero(shard_ids == shard_id)[0]
+            # Ascending rows read each shard front to back
+            positions = positions[np.argsort(indices[positions], kind='stable')]
+            rows = indices[positions] - self.offsets[shard_id]
+            for start in range(0, len(rows), chunk_size):
+                chunk = slice(start, start + chunk_size)
+                output[positions[chunk]] = shard[rows[chunk]].astype(np.float32) / 255.0
+        return output
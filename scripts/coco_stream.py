@@ -0,0 +1,185 @@
+import re
+import sys
+import json
+from array import array
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+# Characters that may continue a number the decoder has stopped short of
+NUMBER_TAIL = re.compile(r'[0-9.eE+\-]*')
+_decoder = json.JSONDecoder()
+
+class JsonStream:
+    """
+    Incremental JSON reader over a text file.
+
+    Keeps only an unread window of the file in memory and decodes one
+    value at a time with the C decoder, so walking a huge array costs one
+    element of memory rather than the whole document.
+    """
+
+    def __init__(self, f, chunk_size=1 << 20):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+
+    def fill(self):
+        """Append the next chunk, dropping what has been consumed; False at end of file"""
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character, without consuming it"""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON input")
+
+    def expect(self, *characters):
+        """Consume one of the given structural characters and return it"""
+        character = self.peek()
+        if character not in characters:
+            raise ValueError(f"Expected one of {characters} but found {character!r}")
+        self.pos += 1
+        return character
+
+    def value(self):
+        """Decode the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # The decoder accepts a number cut short by the window ('12.' reads
+            # as 12), so one that may run on to the window's end is read again
+            if NUMBER_TAIL.match(self.buffer, end).end() < len(self.buffer) or not self.fill():
+                self.pos = end
+                return value
+
+    def elements(self):
+        """
+        Yield the elements of the array starting at the current position.
+
+        This is the hot loop for large files, so it decodes with the
+        scanner directly and only leaves the current window to read more.
+        """
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+
+        scan_once = _decoder.scan_once
+        skip = WHITESPACE.match
+        while True:
+            buffer = self.buffer
+            self.pos = skip(buffer, self.pos).end()
+            try:
+                element, end = scan_once(buffer, self.pos)
+            except (StopIteration, json.JSONDecodeError):
+                if not self.fill():
+                    raise ValueError("Truncated or invalid JSON array")
+                continue
+            # The separator must be in the window too, or a number may be cut
+            # short: the scanner reads '12.' or '1e' at the window's end as 12 or 1
+            end = skip(buffer, end).end()
+            if end >= len(buffer) or (buffer[end] not in ',]'
+                                      and NUMBER_TAIL.match(buffer, end).end() >= len(buffer)):
+                if not self.fill():
+                    raise ValueError("Unexpected end of JSON input")
+                continue
+
+            separator = buffer[end]
+            if separator not in ',]':
+                raise ValueError(f"Expected ',' or ']' but found {separator!r}")
+            self.pos = end + 1
+            yield element
+            if separator == ']':
+                return
+
+def iter_top_level_arrays(path, keys, found=None, chunk_size=1 << 20):
+    """
+    Yield (key, element) for every element of the top-level arrays named
+    in keys, one element at a time; other values are skipped the same way.
+
+    Keys seen at the top level are added to the found set when given.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        stream = JsonStream(f, chunk_size)
+        stream.expect('{')
+        if stream.peek() == '}':
+            return
+
+        while True:
+            key = stream.value()
+            stream.expect(':')
+            if found is not None:
+                found.add(key)
+
+            if stream.peek() == '[':
+                for element in stream.elements():
+                    if key in keys:
+                        yield key, element
+            else:
+                stream.value()
+
+            if stream.expect(',', '}') == '}':
+                return
+
+def parse_coco(path, chunk_size=1 << 20):
+    """
+    Stream a COCO file into compact columns.
+
+    Returns a dict with 'images' ({image id: file name}), 'categories'
+    ({category id: name}) and per-annotation 'image_ids', 'category_ids'
+    (int64) and 'bbox' ((N, 4) float64 x, y, width, height) arrays, or None
+    if the file has no images/annotations sections. Annotation fields are
+    appended to typed arrays as they are read, so no per-annotation dicts
+    are kept.
+    """
+    images, categories = {}, {}
+    image_ids, category_ids, bbox = array('q'), array('q'), array('d')
+    found = set()
+
+    for key, element in iter_top_level_arrays(path, {'images', 'categories', 'annotations'}, found, chunk_size):
+        if key == 'annotations':
+            image_ids.append(element['image_id'])
+            category_ids.append(element['category_id'])
+            bbox.extend(element['bbox'][:4])
+        elif key == 'images':
+            images[element['id']] = element['file_name']
+        else:
+            categories[element['id']] = element['name']
+
+    if not ('images' in found and 'annotations' in found):
+        return None
+    return {
+        'images': images,
+        'categories': categories,
+        'image_ids': np.frombuffer(image_ids, dtype=np.int64),
+        'category_ids': np.frombuffer(category_ids, dtype=np.int64),
+        'bbox': np.frombuffer(bbox, dtype=np.float64).reshape(-1, 4)
+    }
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where unavailable"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
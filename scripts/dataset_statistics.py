@@ -0,0 +1,139 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from image_headers import read_image_size_from_file
+
+# Bin edges; values below the first or above the last edge get open-ended bins
+AREA_EDGES = [32 ** 2, 64 ** 2, 96 ** 2, 128 ** 2, 256 ** 2, 512 ** 2, 1024 ** 2]
+ASPECT_RATIO_EDGES = [0.25, 0.5, 0.67, 0.8, 1.25, 1.5, 2.0, 4.0]
+RELATIVE_AREA_EDGES = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5]
+BOXES_PER_IMAGE_EDGES = [1, 2, 3, 5, 10, 20, 50]
+# Relative size classes: fraction of the image area a box covers
+RELATIVE_SIZE_CLASSES = {'small': 0.01, 'medium': 0.1}
+
+class FixedHistogram:
+    """
+    Histogram over fixed edges that accumulates chunk by chunk.
+
+    Memory is one counter per bin whatever the number of values; the range
+    and mean are tracked alongside.
+    """
+
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.counts = np.zeros(len(self.edges) + 1, dtype=np.int64)
+        self.count = 0
+        self.sum = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+        self.counts += np.bincount(np.searchsorted(self.edges, values, side='right'), minlength=len(self.counts))
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def as_dict(self):
+        bounds = [None] + self.edges.tolist() + [None]
+        return {
+            'count': self.count,
+            'mean': self.sum / self.count if self.count else None,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+            'bins': [{'min': bounds[i], 'max': bounds[i + 1], 'count': int(count)}
+                     for i, count in enumerate(self.counts)]
+        }
+
+def read_image_sizes(paths, workers=None):
+    """(N, 2) int32 width/height from JPEG/PNG headers, -1 where unknown"""
+    def size_of(path):
+        try:
+            return read_image_size_from_file(path) or (-1, -1)
+        except OSError:
+            return (-1, -1)
+
+    with ThreadPoolExecutor(max_workers=workers or min(32, 4 * (os.cpu_count() or 1))) as executor:
+        sizes = list(executor.map(size_of, paths))
+    return np.array(sizes, dtype=np.int32).reshape(-1, 2)
+
+def box_statistics(annotations, image_sizes, chunk_size=1 << 16):
+    """
+    Box area, aspect ratio and relative size histograms over an AnnotationIndex.
+
+    Boxes are processed chunk_size rows at a time, so temporaries stay
+    bounded however many boxes there are. Relative sizes need the image
+    size and skip boxes whose image header could not be read.
+    """
+    areas = FixedHistogram(AREA_EDGES)
+    aspect_ratios = FixedHistogram(ASPECT_RATIO_EDGES)
+    relative_areas = FixedHistogram(RELATIVE_AREA_EDGES)
+    size_classes = dict.fromkeys(list(RELATIVE_SIZE_CLASSES) + ['large'], 0)
+    degenerate = 0
+    out_of_bounds = 0
+
+    small_limit, medium_limit = RELATIVE_SIZE_CLASSES['small'], RELATIVE_SIZE_CLASSES['medium']
+    for start in range(0, annotations.num_boxes, chunk_size):
+        boxes = annotations.boxes[start:start + chunk_size].astype(np.int64)
+        sizes = image_sizes[annotations.image_ids[start:start + chunk_size]].astype(np.int64)
+        width = boxes[:, 2] - boxes[:, 0]
+        height = boxes[:, 3] - boxes[:, 1]
+        valid = (width > 0) & (height > 0)
+        degenerate += int(np.count_nonzero(~valid))
+
+        known = valid & (sizes[:, 0] > 0) & (sizes[:, 1] > 0)
+        out_of_bounds += int(np.count_nonzero(known & (
+            (boxes[:, 0] < 0) | (boxes[:, 1] < 0) | (boxes[:, 2] > sizes[:, 0]) | (boxes[:, 3] > sizes[:, 1])
+        )))
+
+        area = (width * height)[valid]
+        areas.add(area)
+        aspect_ratios.add(width[valid] / height[valid])
+
+        relative = (width * height)[known] / (sizes[known, 0] * sizes[known, 1])
+        relative_areas.add(relative)
+        small, medium, large = np.bincount(np.searchsorted([small_limit, medium_limit], relative, side='right'),
+                                           minlength=3)
+        size_classes['small'] += int(small)
+        size_classes['medium'] += int(medium)
+        size_classes['large'] += int(large)
+
+    return {
+        'area_px': areas.as_dict(),
+        'aspect_ratio': aspect_ratios.as_dict(),
+        'relative_area': relative_areas.as_dict(),
+        'relative_size_classes': size_classes,
+        'relative_size_limits': RELATIVE_SIZE_CLASSES,
+        'degenerate_boxes': degenerate,
+        'out_of_bounds_boxes': out_of_bounds
+    }
+
+def summarise(values):
+    """Count, mean, min and max of a 1-D array"""
+    if len(values) == 0:
+        return {'count': 0, 'mean': None, 'min': None, 'max': None}
+    return {'count': len(values), 'mean': float(values.mean()), 'min': int(values.min()), 'max': int(values.max())}
+
+def image_statistics(image_sizes, boxes_per_image, top_resolutions=20):
+    """Resolution and boxes-per-image summary for the scanned images"""
+    known = (image_sizes[:, 0] > 0) & (image_sizes[:, 1] > 0)
+    per_image = FixedHistogram(BOXES_PER_IMAGE_EDGES)
+    per_image.add(boxes_per_image)
+
+    resolutions, counts = np.unique(image_sizes[known], axis=0, return_counts=True)
+    order = np.argsort(-counts, kind='stable')[:top_resolutions]
+    return {
+        'images': len(image_sizes),
+        'unreadable_headers': int(np.count_nonzero(~known)),
+        'width': summarise(image_sizes[known, 0]),
+        'height': summarise(image_sizes[known, 1]),
+        'resolutions': [{'width': int(resolutions[i][0]), 'height': int(resolutions[i][1]), 'images': int(counts[i])}
+                        for i in order],
+        'boxes_per_image': per_image.as_dict()
+    }
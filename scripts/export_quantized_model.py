@@ -0,0 +1,58 @@
+import os
+import json
+import argparse
+
+from train_pothole_model_kaggle import KagglePotholeDetector, split_dataset
+from tflite_model import TFLiteModel
+
+def main():
+    parser = argparse.ArgumentParser(description="Export an INT8 TFLite model with a parity report")
+    parser.add_argument('--model', default='models/kaggle_pothole_detector.h5',
+                        help="Trained float Keras model")
+    parser.add_argument('--dataset', default='data/kaggle_pothole_dataset/processed/classification',
+                        help="Processed classification dataset used for calibration and evaluation")
+    parser.add_argument('--shards', default='data/kaggle_pothole_dataset/processed/shards',
+                        help="Packed dataset used instead of --dataset when present")
+    parser.add_argument('--output', default='models/kaggle_pothole_detector_int8.tflite')
+    parser.add_argument('--calibration-samples', type=int, default=200)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.dataset) and not os.path.exists(args.shards):
+        print("Processed dataset not found!")
+        print("Please run 'python scripts/kaggle_dataset_loader.py' first")
+        return
+
+    detector = KagglePotholeDetector()
+    if not detector.load_model(args.model):
+        return
+
+    print("Loading processed Kaggle dataset...")
+    X, y = detector.load_training_data(args.dataset, args.shards)
+    if len(X) == 0:
+        print("No data loaded! Please check the processed dataset.")
+        return
+
+    # Same split as training, so the parity report uses the held-out test images
+    X_train, X_val, X_test, y_train, y_val, y_test = split_dataset(X, y)
+
+    print("Exporting INT8 model...")
+    tflite_path = detector.export_tflite_int8(
+        X_train, args.output, num_calibration_samples=args.calibration_samples
+    )
+    if tflite_path is None:
+        return
+
+    report = detector.quantization_parity_report(TFLiteModel(tflite_path), X_test, y_test)
+    report['float_model'] = args.model
+    report['quantized_model'] = tflite_path
+    report['float_size_bytes'] = os.path.getsize(args.model)
+    report['quantized_size_bytes'] = os.path.getsize(tflite_path)
+
+    report_path = tflite_path.replace('.tflite', '_parity.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"Parity report saved to {report_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import struct
+
+# JPEG start-of-frame markers carrying the image dimensions (not DHT/JPG/DAC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+def image_format(data):
+    """Identify JPEG/PNG from the first bytes, returning 'jpeg', 'png' or None"""
+    if data[:3] == b'\xff\xd8\xff':
+        return 'jpeg'
+    if data[:8] == PNG_SIGNATURE:
+        return 'png'
+    return None
+
+def read_image_size(data):
+    """
+    Read (width, height) from a JPEG or PNG header without decoding pixels.
+
+    Returns None for other formats or when the header is truncated.
+    """
+    fmt = image_format(data)
+
+    if fmt == 'png':
+        # IHDR is always the first chunk: length, type, width, height
+        if len(data) < 24 or data[12:16] != b'IHDR':
+            return None
+        width, height = struct.unpack('>II', data[16:24])
+        return width, height
+
+    if fmt == 'jpeg':
+        for marker, offset in jpeg_segments(data):
+            if marker in JPEG_SOF_MARKERS:
+                if offset + 9 > len(data):
+                    return None
+                height, width = struct.unpack('>HH', data[offset + 5:offset + 9])
+                return width, height
+
+    return None
+
+def jpeg_segments(data):
+    """
+    Yield (marker, offset) for the JPEG header segments up to the first
+    frame header or start of scan, stopping early at truncated or corrupt data.
+    """
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            return
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            # Fill byte
+            offset += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            # Markers without a length field
+            offset += 2
+            continue
+        yield marker, offset
+        if marker in JPEG_SOF_MARKERS or marker == 0xDA:
+            return
+        offset += 2 + struct.unpack('>H', data[offset + 2:offset + 4])[0]
+
+def read_jpeg_orientation(data):
+    """
+    EXIF orientation (1-8) of a JPEG, or 1 when there is none.
+
+    Orientations 5-8 are stored rotated by 90 degrees: decoders that apply
+    them, like cv2.imdecode, return an image with width and height swapped
+    relative to read_image_size().
+    """
+    if image_format(data) != 'jpeg':
+        return 1
+    for marker, offset in jpeg_segments(data):
+        if marker != 0xE1 or data[offset + 4:offset + 10] != b'Exif\x00\x00':
+            continue
+        tiff = offset + 10
+        byte_order = {b'II': '<', b'MM': '>'}.get(data[tiff:tiff + 2])
+        if byte_order is None or tiff + 8 > len(data):
+            return 1
+        ifd = tiff + struct.unpack(byte_order + 'I', data[tiff + 4:tiff + 8])[0]
+        if ifd + 2 > len(data):
+            return 1
+        entries = struct.unpack(byte_order + 'H', data[ifd:ifd + 2])[0]
+        for entry in range(ifd + 2, min(ifd + 2 + 12 * entries, len(data) - 11), 12):
+            tag, = struct.unpack(byte_order + 'H', data[entry:entry + 2])
+            if tag == 0x0112:
+                orientation, = struct.unpack(byte_order + 'H', data[entry + 8:entry + 10])
+                return orientation if 1 <= orientation <= 8 else 1
+        return 1
+    return 1
+
+def read_image_size_from_file(path, chunk_size=65536, max_bytes=1 << 20):
+    """Read (width, height) from an image file, reading only as much of the header as needed"""
+    with open(path, 'rb') as f:
+        data = f.read(chunk_size)
+        size = read_image_size(data)
+        # EXIF thumbnails can push the JPEG frame header past the first chunk
+        while size is None and image_format(data) == 'jpeg' and len(data) < max_bytes:
+            more = f.read(chunk_size)
+            if not more:
+                break
+            data += more
+            size = read_image_size(data)
+    return size
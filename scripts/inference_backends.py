@@ -0,0 +1,164 @@
+import os
+
+import numpy as np
+
+# TensorFlow is imported by the backends themselves, so choosing and
+# validating a backend (or failing early on a missing model) stays cheap.
+
+class KerasBackend:
+    """Plain keras.Model.predict()"""
+
+    def __init__(self, model_path, img_height=224, img_width=224):
+        from tensorflow import keras
+        self.model_path = model_path
+        self.model = keras.models.load_model(model_path)
+
+    def predict(self, images, verbose=0):
+        return self.model.predict(images, verbose=verbose)
+
+class XLABackend:
+    """
+    Call the Keras model through an XLA-compiled tf.function.
+
+    The function has a fixed input signature, and batches are padded up to
+    the next power of two so XLA only compiles a handful of shapes instead of
+    one per batch size seen in production.
+    """
+
+    def __init__(self, model_path, img_height=224, img_width=224):
+        import tensorflow as tf
+        from tensorflow import keras
+        self.tf = tf
+        self.model_path = model_path
+        self.model = keras.models.load_model(model_path)
+        self.forward = tf.function(
+            lambda images: self.model(images, training=False),
+            jit_compile=True,
+            input_signature=[tf.TensorSpec([None, img_height, img_width, 3], tf.float32)]
+        )
+
+    def predict(self, images, verbose=0):
+        images = np.asarray(images, dtype=np.float32)
+        batch_size = len(images)
+        padded_size = 1 << max(0, batch_size - 1).bit_length()
+        if padded_size != batch_size:
+            padding = np.zeros((padded_size - batch_size,) + images.shape[1:], dtype=np.float32)
+            images = np.concatenate([images, padding])
+        return self.forward(self.tf.constant(images)).numpy()[:batch_size]
+
+class ONNXBackend:
+    """
+    ONNX Runtime CPU session converted from the trained Keras model.
+
+    The converted model is cached next to the Keras file as <model>.onnx and
+    regenerated whenever the Keras file is newer. num_threads sizes the
+    intra-op pool; by default ONNX Runtime uses one thread per core.
+    """
+
+    def __init__(self, model_path, img_height=224, img_width=224, num_threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("The onnx backend needs onnxruntime: pip install onnxruntime tf2onnx")
+
+        if model_path.endswith('.onnx'):
+            onnx_path = model_path
+        else:
+            onnx_path = os.path.splitext(model_path)[0] + '.onnx'
+            if not os.path.exists(onnx_path) or os.path.getmtime(onnx_path) < os.path.getmtime(model_path):
+                self.convert(model_path, onnx_path, img_height, img_width)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+        self.model_path = onnx_path
+        self.session = ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    @staticmethod
+    def convert(model_path, onnx_path, img_height=224, img_width=224):
+        """Convert a Keras model file to ONNX"""
+        try:
+            import tf2onnx
+        except ImportError:
+            raise ImportError("Converting to ONNX needs tf2onnx: pip install tf2onnx")
+        import tensorflow as tf
+        from tensorflow import keras
+
+        model = keras.models.load_model(model_path)
+        signature = (tf.TensorSpec([None, img_height, img_width, 3], tf.float32, name='input'),)
+        tf2onnx.convert.from_keras(model, input_signature=signature, output_path=onnx_path)
+        print(f"Converted {model_path} to {onnx_path}")
+
+    def predict(self, images, verbose=0):
+        images = np.asarray(images, dtype=np.float32)
+        return self.session.run(None, {self.input_name: images})[0]
+
+class SavedModelBackend:
+    """TensorFlow SavedModel serving signature, the registry's artifact format"""
+
+    def __init__(self, model_path, img_height=224, img_width=224):
+        import tensorflow as tf
+        self.tf = tf
+        self.model_path = model_path
+        self.loaded = tf.saved_model.load(model_path)
+        self.signature = self.loaded.signatures['serving_default']
+        self.input_name = next(iter(self.signature.structured_input_signature[1]))
+
+    def predict(self, images, verbose=0):
+        images = self.tf.constant(np.asarray(images, dtype=np.float32))
+        outputs = self.signature(**{self.input_name: images})
+        return next(iter(outputs.values())).numpy()
+
+def TFLiteBackend(model_path, img_height=224, img_width=224, num_threads=None):
+    """TFLite interpreter, used for the INT8 export; the model file is memory-mapped"""
+    from tflite_model import TFLiteModel
+    return TFLiteModel(model_path, num_threads=num_threads)
+
+BACKENDS = {
+    'keras': KerasBackend,
+    'xla': XLABackend,
+    'onnx': ONNXBackend,
+    'tflite': TFLiteBackend,
+    'savedmodel': SavedModelBackend
+}
+
+def resolve_backend_name(name, model_path):
+    """Pick the engine the artifact needs when no backend is requested"""
+    if name is None:
+        if os.path.isdir(model_path):
+            name = 'savedmodel'
+        elif model_path.endswith('.tflite'):
+            name = 'tflite'
+        elif model_path.endswith('.onnx'):
+            name = 'onnx'
+        else:
+            name = 'keras'
+
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}', choose from {sorted(BACKENDS)}")
+    return name
+
+def import_backend_dependencies(name):
+    """Import the heavy runtime a backend needs, so the import cost can be measured on its own"""
+    try:
+        if name == 'onnx':
+            import onnxruntime  # noqa: F401
+        else:
+            import tensorflow  # noqa: F401
+    except ImportError:
+        pass  # The backend itself reports what is missing
+
+def create_backend(name, model_path, img_height=224, img_width=224, num_threads=None):
+    """
+    Create an inference backend; every backend exposes predict(images, verbose=0).
+
+    num_threads sizes the TFLite interpreter and the ONNX Runtime session;
+    TensorFlow takes its thread counts from the environment (see worker_pool.py).
+    """
+    name = resolve_backend_name(name, model_path)
+    if name in ('tflite', 'onnx'):
+        return BACKENDS[name](model_path, img_height=img_height, img_width=img_width, num_threads=num_threads)
+    return BACKENDS[name](model_path, img_height=img_height, img_width=img_width)
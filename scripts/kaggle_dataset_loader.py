@@ -1,5 +1,8 @@
 import os
 import json
+import time
+import zlib
+import hashlib
 import cv2
 import numpy as np
 import pandas as pd
@@ -7,14 +10,43 @@ from pathlib import Path
 import zipfile
 import requests
 from typing import Dict, List, Tuple, Optional
+from concurrent.futures import ProcessPoolExecutor
 import xml.etree.ElementTree as ET
 
+from image_headers import read_image_size_from_file
+from annotation_index import AnnotationIndex, dict_to_columns, window_overlap
+from classification_shards import CLASSIFICATION_CLASSES, ClassificationShards, write_shards
+from dataset_statistics import read_image_sizes, box_statistics, image_statistics
+from coco_stream import parse_coco, peak_rss_mb
+
+ANNOTATION_INDEX_VERSION = 4
+BUILD_MANIFEST_VERSION = 2
+# Below this many files, starting worker processes costs more than it saves
+MIN_FILES_PER_POOL = 64
+YOLO_CLASS_FILES = ('classes.txt', 'obj.names')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.JPG', '.JPEG', '.PNG')
+
+def sample_filename(prefix: str, filename: str, index: int) -> str:
+    """
+    Name of the index-th crop of a source image, e.g. pothole_img12_1f0c2a9e4b7d3c68_003.jpg
+
+    The stem keeps names readable; the hash of the full relative filename
+    keeps a/x.jpg, b/x.jpg and x.png apart, since all crops share one directory.
+    """
+    source = Path(filename)
+    digest = hashlib.sha1(filename.encode('utf-8')).hexdigest()[:16]
+    return f"{prefix}_{source.stem}_{digest}_{index:03d}{source.suffix}"
+
 class KagglePotholeDatasetLoader:
     def __init__(self, dataset_path: str = "data/kaggle_pothole_dataset"):
         self.dataset_path = Path(dataset_path)
         self.images_path = self.dataset_path / "images"
         self.annotations_path = self.dataset_path / "annotations"
         self.processed_path = self.dataset_path / "processed"
+        self.annotation_index_path = self.processed_path / "annotation_index.npz"
+        self.build_manifest_path = self.processed_path / "build_manifest.json"
+        self.build_summary = None
+        self.class_names = None
         
         # Create directories
         self.dataset_path.mkdir(parents=True, exist_ok=True)
@@ -37,16 +69,21 @@ class KagglePotholeDatasetLoader:
         print("pip install kaggle")
         print("kaggle datasets download -d chitholian/annotated-potholes-dataset")
         
-    def parse_annotations(self) -> Dict[str, List[Dict]]:
+    def parse_annotations(self, workers: Optional[int] = None, use_cache: bool = True) -> AnnotationIndex:
         """
         Parse annotation files (assuming PASCAL VOC format or similar)
+
+        Files are parsed in a process pool, and each file's result is kept
+        in processed/annotation_index.npz keyed by its path, size and mtime,
+        so a re-run only parses files that are new or have changed. The
+        results stay in arrays from parsing through caching to the merge,
+        and the peak RSS of the whole step is printed at the end.
         """
-        annotations = {}
-        
         # Check for different annotation formats
         annotation_files = list(self.annotations_path.glob("*.xml")) + \
                           list(self.annotations_path.glob("*.json")) + \
-                          list(self.annotations_path.glob("*.txt"))
+                          [path for path in self.annotations_path.glob("*.txt")
+                           if path.name not in YOLO_CLASS_FILES]
         
         if not annotation_files:
             print("No annotation files found. Checking for CSV files...")
@@ -54,16 +91,126 @@ class KagglePotholeDatasetLoader:
             if csv_files:
                 return self.parse_csv_annotations(csv_files[0])
         
+        class_names = self.yolo_class_names()
+        cached = self.load_annotation_index(class_names) if use_cache else {}
+        entries = {}
+        stale = []
         for ann_file in annotation_files:
-            if ann_file.suffix == '.xml':
-                annotations.update(self.parse_xml_annotation(ann_file))
-            elif ann_file.suffix == '.json':
-                annotations.update(self.parse_json_annotation(ann_file))
-            elif ann_file.suffix == '.txt':
-                annotations.update(self.parse_txt_annotation(ann_file))
+            key = ann_file.name
+            stat = ann_file.stat()
+            entry = cached.get(key)
+            if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                entries[key] = entry
+            else:
+                stale.append((ann_file, stat))
+        
+        if stale:
+            results = self.parse_annotation_files([ann_file for ann_file, _ in stale], workers)
+            for (ann_file, stat), result in zip(stale, results):
+                entries[ann_file.name] = {
+                    'size': stat.st_size,
+                    'mtime_ns': stat.st_mtime_ns,
+                    'index': result
+                }
+        print(f"Parsed {len(stale)} annotation files, {len(annotation_files) - len(stale)} unchanged")
         
+        if use_cache and (stale or len(entries) != len(cached)):
+            self.save_annotation_index(entries, class_names)
+        
+        annotations = AnnotationIndex.concatenate([entries[ann_file.name]['index'] for ann_file in annotation_files])
+        peak_rss = peak_rss_mb()
+        print(f"Annotations: {annotations.num_boxes} boxes on {len(annotations)} images"
+              + (f", peak RSS {peak_rss:.0f} MB" if peak_rss is not None else ""))
         return annotations
     
+    def parse_annotation_files(self, annotation_files: List[Path],
+                               workers: Optional[int] = None) -> List[AnnotationIndex]:
+        """Parse annotation files in a process pool, returning results in input order"""
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(annotation_files) < MIN_FILES_PER_POOL:
+            return [self.parse_annotation_file(ann_file) for ann_file in annotation_files]
+        
+        chunksize = max(1, min(256, len(annotation_files) // (workers * 8)))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(self.parse_annotation_file, annotation_files, chunksize=chunksize))
+    
+    def parse_annotation_file(self, ann_file: Path) -> AnnotationIndex:
+        """Parse one annotation file according to its extension"""
+        if ann_file.suffix == '.xml':
+            return AnnotationIndex.from_parts([dict_to_columns(self.parse_xml_annotation(ann_file))])
+        elif ann_file.suffix == '.json':
+            return self.parse_json_annotation(ann_file)
+        elif ann_file.suffix == '.txt':
+            return AnnotationIndex.from_parts([dict_to_columns(self.parse_txt_annotation(ann_file))])
+        return AnnotationIndex([], [], [], [], [])
+    
+    def load_annotation_index(self, class_names: List[str]) -> Dict[str, Dict]:
+        """Cached per-file parse results, or {} if there is no usable index"""
+        try:
+            with np.load(self.annotation_index_path) as data:
+                meta = json.loads(data['meta'].tobytes())
+                # YOLO results depend on the class names file as well as the label file
+                if meta.get('version') != ANNOTATION_INDEX_VERSION or meta.get('yolo_classes') != class_names:
+                    return {}
+                filenames = data['filenames'].tobytes().decode('utf-8').split('\0') if meta['images'] else []
+                image_ids, class_ids, boxes = data['image_ids'], data['class_ids'], data['boxes']
+        except (OSError, ValueError, KeyError):
+            return {}
+        
+        entries = {}
+        for name, entry in meta['files'].items():
+            image_start, image_end = entry['images']
+            box_start, box_end = entry['boxes']
+            entries[name] = {
+                'size': entry['size'],
+                'mtime_ns': entry['mtime_ns'],
+                'index': AnnotationIndex(
+                    filenames[image_start:image_end], entry['class_names'],
+                    image_ids[box_start:box_end] - image_start, class_ids[box_start:box_end], boxes[box_start:box_end]
+                )
+            }
+        return entries
+    
+    def save_annotation_index(self, entries: Dict[str, Dict], class_names: List[str]):
+        """
+        Atomically replace the annotation index.
+
+        Every file's arrays are stored back to back in one .npz, with the
+        ranges, class names and stat of each file in a JSON 'meta' entry.
+        """
+        files, filenames, image_ids, class_ids, boxes = {}, [], [], [], []
+        num_boxes = 0
+        for name, entry in entries.items():
+            index = entry['index']
+            files[name] = {
+                'size': entry['size'],
+                'mtime_ns': entry['mtime_ns'],
+                'class_names': index.class_names,
+                'images': [len(filenames), len(filenames) + len(index)],
+                'boxes': [num_boxes, num_boxes + index.num_boxes]
+            }
+            image_ids.append(index.image_ids + len(filenames))
+            filenames.extend(index.filenames)
+            class_ids.append(index.class_ids)
+            boxes.append(index.boxes)
+            num_boxes += index.num_boxes
+        
+        meta = {'version': ANNOTATION_INDEX_VERSION, 'yolo_classes': class_names, 'images': len(filenames),
+                'files': files}
+        tmp_path = self.annotation_index_path.with_name('.annotation_index.npz.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                meta=np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8),
+                filenames=np.frombuffer('\0'.join(filenames).encode('utf-8'), dtype=np.uint8),
+                image_ids=np.concatenate(image_ids or [np.zeros(0, dtype=np.int32)]),
+                class_ids=np.concatenate(class_ids or [np.zeros(0, dtype=np.int32)]),
+                boxes=np.concatenate(boxes or [np.zeros((0, 4), dtype=np.int32)])
+            )
+        os.replace(tmp_path, self.annotation_index_path)
+        # Left behind by versions that cached parse results as JSON
+        self.annotation_index_path.with_name('annotation_index.json').unlink(missing_ok=True)
+    
     def parse_xml_annotation(self, xml_file: Path) -> Dict[str, List[Dict]]:
         """Parse PASCAL VOC XML annotation"""
         tree = ET.parse(xml_file)
@@ -89,190 +236,477 @@ class KagglePotholeDatasetLoader:
         
         return {filename: annotations}
     
-    def parse_json_annotation(self, json_file: Path) -> Dict[str, List[Dict]]:
-        """Parse JSON annotation (COCO format or similar)"""
-        with open(json_file, 'r') as f:
-            data = json.load(f)
-        
-        annotations = {}
+    def parse_json_annotation(self, json_file: Path) -> AnnotationIndex:
+        """
+        Parse JSON annotation (COCO format or similar)
+
+        The file is streamed into typed columns instead of being loaded
+        whole, and categories are looked up by id. The parse time is
+        printed.
+        """
+        started = time.perf_counter()
+        coco = parse_coco(json_file)
         
         # Handle different JSON formats
-        if 'images' in data and 'annotations' in data:
-            # COCO format
-            image_id_to_filename = {img['id']: img['file_name'] for img in data['images']}
-            
-            for ann in data['annotations']:
-                image_id = ann['image_id']
-                filename = image_id_to_filename[image_id]
-                
-                if filename not in annotations:
-                    annotations[filename] = []
+        if coco is None:
+            return AnnotationIndex([], [], [], [], [])
+        
+        # COCO format: map ids once per distinct image/category, not per box
+        unique_images, image_ids = np.unique(coco['image_ids'], return_inverse=True)
+        unique_categories, class_ids = np.unique(coco['category_ids'], return_inverse=True)
+        missing = [i for i in unique_images.tolist() if i not in coco['images']]
+        if missing:
+            raise KeyError(f"{json_file.name}: annotations refer to unknown image ids {missing[:10]}")
+        unknown = [i for i in unique_categories.tolist() if i not in coco['categories']]
+        if unknown:
+            raise KeyError(f"{json_file.name}: annotations refer to unknown category ids {unknown[:10]}")
+        
+        bbox = coco['bbox']  # [x, y, width, height]
+        boxes = np.stack([
+            bbox[:, 0], bbox[:, 1], bbox[:, 0] + bbox[:, 2], bbox[:, 1] + bbox[:, 3]
+        ], axis=1).astype(np.int32)
+        index = AnnotationIndex(
+            [coco['images'][i] for i in unique_images.tolist()],
+            [coco['categories'][i] for i in unique_categories.tolist()],
+            image_ids, class_ids, boxes
+        )
+        
+        print(f"Parsed {json_file.name}: {index.num_boxes} boxes on {len(index)} images "
+              f"in {time.perf_counter() - started:.1f}s")
+        return index
+    
+    def parse_txt_annotation(self, txt_file: Path) -> Dict[str, List[Dict]]:
+        """
+        Parse a YOLO label file: one 'class x_center y_center width height'
+        line per box, normalised to the image size.
+
+        The image is the file with the same name stem in images/, and its
+        size comes from the JPEG/PNG header instead of decoding it.
+        """
+        image_path = self.find_image(txt_file.stem)
+        if image_path is None:
+            return {}
+        
+        size = read_image_size_from_file(image_path)
+        if size is None:
+            image = cv2.imread(str(image_path))
+            if image is None:
+                return {}
+            size = image.shape[1], image.shape[0]
+        width, height = size
+        
+        class_names = self.yolo_class_names()
+        annotations = []
+        
+        with open(txt_file, 'r') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 5:
+                    continue
                 
-                bbox = ann['bbox']  # [x, y, width, height]
+                class_id = int(fields[0])
+                x_center, y_center, box_width, box_height = (float(value) for value in fields[1:5])
                 annotation = {
-                    'class': data['categories'][ann['category_id'] - 1]['name'],
+                    'class': class_names[class_id] if class_id < len(class_names) else str(class_id),
                     'bbox': {
-                        'xmin': int(bbox[0]),
-                        'ymin': int(bbox[1]),
-                        'xmax': int(bbox[0] + bbox[2]),
-                        'ymax': int(bbox[1] + bbox[3])
+                        'xmin': max(0, int(round((x_center - box_width / 2) * width))),
+                        'ymin': max(0, int(round((y_center - box_height / 2) * height))),
+                        'xmax': min(width, int(round((x_center + box_width / 2) * width))),
+                        'ymax': min(height, int(round((y_center + box_height / 2) * height)))
                     }
                 }
-                annotations[filename].append(annotation)
+                annotations.append(annotation)
         
-        return annotations
+        return {image_path.name: annotations}
+    
+    def yolo_class_names(self) -> List[str]:
+        """Class names for YOLO ids, from classes.txt/obj.names if present"""
+        if self.class_names is None:
+            self.class_names = ['pothole']
+            for directory in (self.annotations_path, self.dataset_path):
+                for name in YOLO_CLASS_FILES:
+                    names_file = directory / name
+                    if names_file.exists():
+                        with open(names_file, 'r') as f:
+                            self.class_names = [line.strip() for line in f if line.strip()]
+                        return self.class_names
+        return self.class_names
     
-    def parse_csv_annotations(self, csv_file: Path) -> Dict[str, List[Dict]]:
+    def find_image(self, stem: str) -> Optional[Path]:
+        """Image in images/ with the given name stem"""
+        for extension in IMAGE_EXTENSIONS:
+            image_path = self.images_path / (stem + extension)
+            if image_path.exists():
+                return image_path
+        return None
+    
+    def parse_csv_annotations(self, csv_file: Path) -> AnnotationIndex:
         """Parse CSV annotation file"""
+        # Assuming CSV has columns: filename, class, xmin, ymin, xmax, ymax
         df = pd.read_csv(csv_file)
-        annotations = {}
-        
-        for _, row in df.iterrows():
-            filename = row['filename'] if 'filename' in row else row['image_name']
-            
-            if filename not in annotations:
-                annotations[filename] = []
-            
-            # Assuming CSV has columns: filename, class, xmin, ymin, xmax, ymax
-            annotation = {
-                'class': row['class'] if 'class' in row else 'pothole',
-                'bbox': {
-                    'xmin': int(row['xmin']),
-                    'ymin': int(row['ymin']),
-                    'xmax': int(row['xmax']),
-                    'ymax': int(row['ymax'])
-                }
-            }
-            annotations[filename].append(annotation)
-        
-        return annotations
+        filename_column = 'filename' if 'filename' in df.columns else 'image_name'
+        return AnnotationIndex.from_frame(df, filename_column=filename_column)
     
-    def create_classification_dataset(self, annotations: Dict[str, List[Dict]], 
-                                    output_size: Tuple[int, int] = (224, 224)):
+    def create_classification_dataset(self, annotations: AnnotationIndex, 
+                                    output_size: Tuple[int, int] = (224, 224),
+                                    workers: Optional[int] = None, seed: Optional[int] = 0,
+                                    negative_scales: Tuple[float, ...] = (2.0,), negatives_per_box: int = 2,
+                                    incremental: bool = True):
         """
         Create classification dataset from bounding box annotations
+
+        Each annotated image is one work unit in a process pool: it is
+        decoded once, and its pothole crops and negatives are written under
+        names built from the source filename and the box/sample index, so
+        the output does not depend on scheduling. Negative windows are
+        reproducible for a given seed (None for fresh randomness) and are
+        taken at each of negative_scales times output_size.
+
+        processed/build_manifest.json records every source image's content
+        hash, annotation hash and the crops it produced. With incremental,
+        only added or changed images are cropped again, and the crops of
+        removed images are deleted, as is any crop no entry lists (such as
+        those of older builds); the summary is kept in build_summary.
         """
+        started = time.perf_counter()
         classification_path = self.processed_path / "classification"
         pothole_path = classification_path / "pothole"
         no_pothole_path = classification_path / "no_pothole"
         
+        # Without the crops on disk the manifest describes nothing
+        manifest = self.load_build_manifest() if classification_path.exists() else {'settings': None, 'images': {}}
+        previous = manifest['images']
+        settings = {
+            'output_size': list(output_size),
+            'seed': seed,
+            'negative_scales': list(negative_scales),
+            'negatives_per_box': negatives_per_box
+        }
+        # Unseeded negatives differ on every run, so nothing can be reused
+        reusable = incremental and seed is not None and manifest['settings'] == settings
+        
         pothole_path.mkdir(parents=True, exist_ok=True)
         no_pothole_path.mkdir(parents=True, exist_ok=True)
         
-        pothole_count = 0
-        no_pothole_count = 0
-        
-        # Process images with potholes
-        for filename, anns in annotations.items():
-            image_path = self.images_path / filename
-            if not image_path.exists():
-                continue
-            
-            image = cv2.imread(str(image_path))
-            if image is None:
+        # Images without boxes produce no samples, so they are not decoded at all
+        images = {}
+        units = []
+        for image_id in range(len(annotations)):
+            if annotations.offsets[image_id + 1] == annotations.offsets[image_id]:
                 continue
+            filename = annotations.filenames[image_id]
+            boxes = annotations.image_boxes(image_id)
+            annotation_hash = hashlib.sha256(boxes.astype('<i4').tobytes()).hexdigest()
+            entry = previous.get(filename)
             
-            # Extract pothole regions
-            for i, ann in enumerate(anns):
-                bbox = ann['bbox']
-                pothole_region = image[bbox['ymin']:bbox['ymax'], 
-                                     bbox['xmin']:bbox['xmax']]
-                
-                if pothole_region.size > 0:
-                    # Resize and save pothole region
-                    pothole_resized = cv2.resize(pothole_region, output_size)
-                    output_filename = f"pothole_{pothole_count:06d}_{filename}"
-                    cv2.imwrite(str(pothole_path / output_filename), pothole_resized)
-                    pothole_count += 1
+            # Crops can only be reused while the boxes they were cut from are the same
+            same_boxes = reusable and entry is not None and entry['annotation_hash'] == annotation_hash
+            if same_boxes:
+                try:
+                    stat = (self.images_path / filename).stat()
+                except OSError:
+                    stat = None
+                if stat is not None and (entry['size'], entry['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+                    images[filename] = entry
+                    continue
             
-            # Create negative samples (regions without potholes)
-            self.create_negative_samples(image, anns, no_pothole_path, 
-                                       filename, output_size, no_pothole_count)
-            no_pothole_count += len(anns) * 2  # Create 2 negative samples per positive
+            units.append((filename, boxes, annotation_hash, entry if same_boxes else None, entry))
+        
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(units) < 2:
+            results = [self.extract_image_samples(filename, boxes, output_size, seed, negative_scales,
+                                                  negatives_per_box, annotation_hash, reusable_entry, entry)
+                       for filename, boxes, annotation_hash, reusable_entry, entry in units]
+        else:
+            # One OpenCV thread per process; the pool already uses every core
+            with ProcessPoolExecutor(max_workers=workers, initializer=cv2.setNumThreads, initargs=(1,)) as executor:
+                results = list(executor.map(
+                    self.extract_image_samples,
+                    [unit[0] for unit in units],
+                    [unit[1] for unit in units],
+                    [output_size] * len(units),
+                    [seed] * len(units),
+                    [negative_scales] * len(units),
+                    [negatives_per_box] * len(units),
+                    [unit[2] for unit in units],
+                    [unit[3] for unit in units],
+                    [unit[4] for unit in units],
+                    chunksize=max(1, min(16, len(units) // (workers * 4)))
+                ))
+        
+        summary = {'unchanged': len(images), 'added': 0, 'rebuilt': 0, 'removed': 0, 'unreadable': 0}
+        for (filename, _, _, _, entry), (result, cropped) in zip(units, results):
+            if result is None:
+                summary['unreadable'] += 1
+                continue
+            images[filename] = result
+            if not cropped:
+                summary['unchanged'] += 1
+            elif entry is None:
+                summary['added'] += 1
+            else:
+                summary['rebuilt'] += 1
+        
+        # Source images that are gone, unreadable or no longer annotated
+        for filename, entry in previous.items():
+            if filename not in images:
+                self.remove_crops(entry)
+                summary['removed'] += 1
+        
+        self.save_build_manifest({'settings': settings, 'images': images})
+        # Crops no entry lists: counter-named ones from builds before the
+        # manifest, or names from an older manifest version
+        summary['stray_crops_removed'] = self.remove_stray_crops(images)
+        
+        summary['pothole'] = sum(len(entry['pothole']) for entry in images.values())
+        summary['no_pothole'] = sum(len(entry['no_pothole']) for entry in images.values())
+        summary['seconds'] = time.perf_counter() - started
+        self.build_summary = summary
         
         print(f"Created classification dataset:")
-        print(f"  Pothole images: {pothole_count}")
-        print(f"  No pothole images: {no_pothole_count}")
+        print(f"  Pothole images: {summary['pothole']}")
+        print(f"  No pothole images: {summary['no_pothole']}")
+        print(f"  Source images: {summary['added']} added, {summary['rebuilt']} rebuilt, "
+              f"{summary['unchanged']} unchanged, {summary['removed']} removed "
+              f"in {summary['seconds']:.1f}s")
+        if summary['unreadable']:
+            print(f"  Skipped {summary['unreadable']} missing or unreadable source images")
+        if summary['stray_crops_removed']:
+            print(f"  Removed {summary['stray_crops_removed']} crops left over from earlier builds")
         
         return classification_path
     
-    def create_negative_samples(self, image: np.ndarray, annotations: List[Dict], 
+    def extract_image_samples(self, filename: str, boxes: np.ndarray,
+                              output_size: Tuple[int, int], seed: Optional[int] = None,
+                              negative_scales: Tuple[float, ...] = (2.0,),
+                              negatives_per_box: int = 2, annotation_hash: Optional[str] = None,
+                              reusable_entry: Optional[Dict] = None,
+                              previous_entry: Optional[Dict] = None) -> Tuple[Optional[Dict], bool]:
+        """
+        Decode one source image and write its pothole crops and negatives.
+
+        Returns (manifest entry, whether crops were written). When the file
+        content still matches reusable_entry (e.g. only its mtime changed)
+        the existing crops are kept; otherwise previous_entry's crops are
+        deleted first. The entry is None if the image is missing or cannot
+        be decoded.
+        """
+        classification_path = self.processed_path / "classification"
+        image_path = self.images_path / filename
+        try:
+            stat = image_path.stat()
+            with open(image_path, 'rb') as f:
+                content_hash = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return None, False
+        
+        if reusable_entry is not None and reusable_entry['content_sha256'] == content_hash:
+            return dict(reusable_entry, size=stat.st_size, mtime_ns=stat.st_mtime_ns), False
+        
+        if previous_entry is not None:
+            self.remove_crops(previous_entry)
+        
+        # The bytes just hashed are still in the page cache
+        image = cv2.imread(str(image_path))
+        if image is None:
+            return None, False
+        
+        # Extract pothole regions
+        pothole_files = []
+        for i, (xmin, ymin, xmax, ymax) in enumerate(boxes.tolist()):
+            pothole_region = image[ymin:ymax, xmin:xmax]
+            
+            if pothole_region.size > 0:
+                # Resize and save pothole region
+                pothole_resized = cv2.resize(pothole_region, output_size)
+                output_filename = sample_filename("pothole", filename, i)
+                cv2.imwrite(str(classification_path / "pothole" / output_filename), pothole_resized)
+                pothole_files.append(output_filename)
+        
+        # Create negative samples (regions without potholes), seeded per image so
+        # the result does not depend on which process handles it
+        rng = np.random.default_rng(None if seed is None else [seed, zlib.crc32(filename.encode('utf-8'))])
+        no_pothole_count = self.create_negative_samples(image, boxes, classification_path / "no_pothole",
+                                                        filename, output_size, rng,
+                                                        negative_scales, negatives_per_box)
+        return {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'content_sha256': content_hash,
+            'annotation_hash': annotation_hash,
+            'pothole': pothole_files,
+            'no_pothole': [sample_filename("no_pothole", filename, i) for i in range(no_pothole_count)]
+        }, True
+    
+    def remove_crops(self, entry: Dict):
+        """Delete the crops a manifest entry lists"""
+        classification_path = self.processed_path / "classification"
+        for class_name in ('pothole', 'no_pothole'):
+            for crop in entry[class_name]:
+                (classification_path / class_name / crop).unlink(missing_ok=True)
+    
+    def remove_stray_crops(self, images: Dict[str, Dict]) -> int:
+        """Delete crops in the classification directories that no manifest entry lists"""
+        classification_path = self.processed_path / "classification"
+        removed = 0
+        for class_name in ('pothole', 'no_pothole'):
+            listed = {crop for entry in images.values() for crop in entry[class_name]}
+            for path in (classification_path / class_name).iterdir():
+                if path.is_file() and path.name not in listed:
+                    path.unlink()
+                    removed += 1
+        return removed
+    
+    def load_build_manifest(self) -> Dict:
+        """The last build's settings and per-image entries, or an empty manifest"""
+        try:
+            with open(self.build_manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {'settings': None, 'images': {}}
+        if manifest.get('version') != BUILD_MANIFEST_VERSION:
+            return {'settings': None, 'images': {}}
+        return manifest
+    
+    def save_build_manifest(self, manifest: Dict):
+        """Atomically replace the build manifest"""
+        tmp_path = self.build_manifest_path.with_name('.build_manifest.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(dict(manifest, version=BUILD_MANIFEST_VERSION), f, separators=(',', ':'))
+        os.replace(tmp_path, self.build_manifest_path)
+    
+    def create_negative_samples(self, image: np.ndarray, pothole_boxes: np.ndarray, 
                               output_path: Path, filename: str, 
-                              output_size: Tuple[int, int], start_count: int):
-        """Create negative samples by extracting regions without potholes"""
+                              output_size: Tuple[int, int], rng: np.random.Generator,
+                              scales: Tuple[float, ...] = (2.0,), negatives_per_box: int = 2,
+                              threshold: float = 0.1) -> int:
+        """
+        Create negative samples by extracting regions without potholes, returning how many were written
+
+        negatives_per_box samples per pothole are spread over the window
+        scales; a scale without enough room hands its share to the others,
+        so the count falls short only when the image has no more free
+        windows.
+        """
         h, w = image.shape[:2]
+        needed = len(pothole_boxes) * negatives_per_box
         
-        # Get all pothole bounding boxes
-        pothole_boxes = [ann['bbox'] for ann in annotations]
+        free = []
+        for scale in scales:
+            window_size = (min(w, int(round(output_size[0] * scale))), min(h, int(round(output_size[1] * scale))))
+            free.append(self.free_windows((h, w), pothole_boxes, window_size, rng, threshold))
+        
+        # Round-robin share per scale, then top up from scales with windows to spare
+        taken = [min(len(range(i, needed, len(scales))), len(windows)) for i, windows in enumerate(free)]
+        shortfall = needed - sum(taken)
+        for i, windows in enumerate(free):
+            extra = min(shortfall, len(windows) - taken[i])
+            taken[i] += extra
+            shortfall -= extra
         
         samples_created = 0
-        max_attempts = 50
+        for windows, count in zip(free, taken):
+            for xmin, ymin, xmax, ymax in windows[:count].tolist():
+                region_resized = cv2.resize(image[ymin:ymax, xmin:xmax], output_size)
+                output_filename = sample_filename("no_pothole", filename, samples_created)
+                cv2.imwrite(str(output_path / output_filename), region_resized)
+                samples_created += 1
         
-        for attempt in range(max_attempts):
-            if samples_created >= len(annotations) * 2:
-                break
-            
-            # Random region
-            region_w, region_h = output_size[0] * 2, output_size[1] * 2
-            x = np.random.randint(0, max(1, w - region_w))
-            y = np.random.randint(0, max(1, h - region_h))
-            
-            candidate_box = {
-                'xmin': x, 'ymin': y,
-                'xmax': x + region_w, 'ymax': y + region_h
+        return samples_created
+    
+    def free_windows(self, image_shape: Tuple[int, int], pothole_boxes: np.ndarray,
+                     window_size: Tuple[int, int], rng: np.random.Generator,
+                     threshold: float = 0.1) -> np.ndarray:
+        """
+        All windows of window_size that no pothole covers by more than
+        threshold, in random order.
+
+        Candidates are every position on a grid with a stride of 1/8 of the
+        window and a random origin, tested against all boxes in one
+        broadcast.
+        """
+        h, w = image_shape
+        window_w, window_h = window_size
+        stride_x, stride_y = max(1, window_w // 8), max(1, window_h // 8)
+        xs = np.arange(rng.integers(0, stride_x), w - window_w + 1, stride_x)
+        ys = np.arange(rng.integers(0, stride_y), h - window_h + 1, stride_y)
+        xs = xs if len(xs) else np.zeros(1, dtype=np.int64)
+        ys = ys if len(ys) else np.zeros(1, dtype=np.int64)
+        
+        x, y = (grid.ravel() for grid in np.meshgrid(xs, ys))
+        windows = np.stack([x, y, x + window_w, y + window_h], axis=1)
+        windows = windows[window_overlap(windows, pothole_boxes) <= threshold]
+        return windows[rng.permutation(len(windows))]
+    
+    def boxes_overlap(self, box: Tuple[int, int, int, int], boxes: np.ndarray, threshold: float = 0.1) -> bool:
+        """Check if an (xmin, ymin, xmax, ymax) box overlaps any row of an (M, 4) boxes array"""
+        return bool(window_overlap([box], boxes)[0] > threshold)
+    
+    def write_classification_shards(self, image_size: Tuple[int, int] = (224, 224),
+                                    shard_size: int = 1024, workers: Optional[int] = None) -> Path:
+        """
+        Pack the classification crops into uint8 .npy shards under processed/shards
+
+        The trainer memory-maps these instead of decoding every JPEG on each run.
+        """
+        classification_path = self.processed_path / "classification"
+        shard_path = self.processed_path / "shards"
+        
+        samples = []
+        for label, class_name in enumerate(CLASSIFICATION_CLASSES):
+            class_images = sorted(path for path in (classification_path / class_name).glob("*")
+                                  if path.suffix.lower() in ('.jpg', '.jpeg', '.png'))
+            samples.extend((path, label) for path in class_images)
+        
+        write_shards(samples, shard_path, CLASSIFICATION_CLASSES, image_size, shard_size, workers)
+        return shard_path
+    
+    def write_statistics_report(self, annotations: AnnotationIndex, output_path: Optional[Path] = None,
+                                workers: Optional[int] = None) -> Dict:
+        """
+        Profile the annotated images and boxes into a JSON report
+
+        Image sizes are read from the JPEG/PNG headers without decoding, and
+        the box area, aspect ratio and relative size histograms are built
+        over the annotation columns in fixed-size chunks.
+        """
+        output_path = Path(output_path or self.processed_path / "dataset_stats.json")
+        started = time.perf_counter()
+        image_sizes = read_image_sizes([self.images_path / filename for filename in annotations.filenames], workers)
+        scanned = time.perf_counter()
+        
+        report = {
+            'dataset': str(self.dataset_path),
+            'images': image_statistics(image_sizes, np.diff(annotations.offsets)),
+            'boxes': dict(total=annotations.num_boxes, classes=annotations.class_counts(),
+                          **box_statistics(annotations, image_sizes)),
+            'timing': {
+                'header_scan_s': scanned - started,
+                'statistics_s': time.perf_counter() - scanned
             }
-            
-            # Check if this region overlaps with any pothole
-            if not self.boxes_overlap(candidate_box, pothole_boxes):
-                region = image[y:y+region_h, x:x+region_w]
-                if region.size > 0:
-                    region_resized = cv2.resize(region, output_size)
-                    output_filename = f"no_pothole_{start_count + samples_created:06d}_{filename}"
-                    cv2.imwrite(str(output_path / output_filename), region_resized)
-                    samples_created += 1
-    
-    def boxes_overlap(self, box1: Dict, box2_list: List[Dict], threshold: float = 0.1) -> bool:
-        """Check if box1 overlaps with any box in box2_list"""
-        for box2 in box2_list:
-            # Calculate intersection
-            x1 = max(box1['xmin'], box2['xmin'])
-            y1 = max(box1['ymin'], box2['ymin'])
-            x2 = min(box1['xmax'], box2['xmax'])
-            y2 = min(box1['ymax'], box2['ymax'])
-            
-            if x2 > x1 and y2 > y1:
-                intersection = (x2 - x1) * (y2 - y1)
-                box1_area = (box1['xmax'] - box1['xmin']) * (box1['ymax'] - box1['ymin'])
-                
-                if intersection / box1_area > threshold:
-                    return True
+        }
         
-        return False
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Statistics for {len(annotations)} images and {annotations.num_boxes} boxes "
+              f"saved to {output_path} ({time.perf_counter() - started:.1f}s)")
+        return report
     
-    def analyze_dataset(self, annotations: Dict[str, List[Dict]]):
+    def analyze_dataset(self, annotations: AnnotationIndex):
         """Analyze the dataset and print statistics"""
         total_images = len(annotations)
-        total_potholes = sum(len(anns) for anns in annotations.values())
+        total_potholes = annotations.num_boxes
         
         # Count by class
         class_counts = {}
-        size_distribution = {'small': 0, 'medium': 0, 'large': 0}
+        for class_name, count in annotations.class_counts().items():
+            class_counts[class_name.lower()] = class_counts.get(class_name.lower(), 0) + count
         
-        for filename, anns in annotations.items():
-            for ann in anns:
-                class_name = ann['class'].lower()
-                class_counts[class_name] = class_counts.get(class_name, 0) + 1
-                
-                # Estimate size based on bounding box area
-                bbox = ann['bbox']
-                area = (bbox['xmax'] - bbox['xmin']) * (bbox['ymax'] - bbox['ymin'])
-                
-                if area < 1000:
-                    size_distribution['small'] += 1
-                elif area < 5000:
-                    size_distribution['medium'] += 1
-                else:
-                    size_distribution['large'] += 1
+        # Estimate size based on bounding box area
+        small, medium, large = np.bincount(np.searchsorted([1000, 5000], annotations.areas(), side='right'),
+                                           minlength=3)
+        size_distribution = {'small': int(small), 'medium': int(medium), 'large': int(large)}
         
         print("Dataset Analysis:")
         print(f"  Total images: {total_images}")
@@ -309,12 +743,21 @@ def main():
     
     # Analyze dataset
     stats = loader.analyze_dataset(annotations)
+    loader.write_statistics_report(annotations)
     
     # Create classification dataset
     print("\nCreating classification dataset...")
     classification_path = loader.create_classification_dataset(annotations)
     
     print(f"\nClassification dataset created at: {classification_path}")
+    
+    # Pack the crops for fast training runs; unchanged crops need no repacking
+    summary = loader.build_summary
+    if summary['added'] or summary['rebuilt'] or summary['removed'] or summary['stray_crops_removed'] \
+            or not ClassificationShards.exists(loader.processed_path / "shards"):
+        print("\nWriting training shards...")
+        loader.write_classification_shards()
+    
     print("You can now use this dataset with the training script!")
 
 if __name__ == "__main__":
@@ -0,0 +1,132 @@
+import time
+import bisect
+import threading
+import contextlib
+
+# Upper bounds in seconds, from sub-millisecond cache hits to cold TF loads
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1,
+    0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+class StageTimings:
+    """
+    Monotonic per-stage durations of one request.
+
+    Stages are timed with time.perf_counter(); a stage entered more than
+    once (e.g. inference over several batches) accumulates.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def as_dict(self):
+        """The 'timings' block: <stage>_ms for every stage plus total_ms"""
+        timings = {f"{name}_ms": round(1000.0 * seconds, 3) for name, seconds in self.stages.items()}
+        timings['total_ms'] = round(1000.0 * self.total(), 3)
+        return timings
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram.
+
+    Observing is a bisect and two additions, so it is cheap enough for
+    every request; percentiles are interpolated within the bucket they fall
+    in, which is accurate to the bucket resolution.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q):
+        """Estimated q-th percentile (0-100) in seconds"""
+        if self.count == 0:
+            return 0.0
+        rank = q / 100.0 * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                upper = min(upper, self.max)
+                return lower + (upper - lower) * max(0.0, rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean_ms': 1000.0 * self.sum / self.count if self.count else 0.0,
+            'p50_ms': 1000.0 * self.percentile(50),
+            'p90_ms': 1000.0 * self.percentile(90),
+            'p99_ms': 1000.0 * self.percentile(99),
+            'max_ms': 1000.0 * self.max
+        }
+
+class LatencyMetrics:
+    """Thread-safe set of per-stage latency histograms"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram(self.buckets)
+            histogram.observe(seconds)
+
+    def observe_timings(self, timings):
+        """Record every stage of a StageTimings plus its total"""
+        for stage, seconds in timings.stages.items():
+            self.observe(stage, seconds)
+        self.observe('total', timings.total())
+
+    def snapshot(self):
+        """JSON metrics: count, mean and percentiles per stage"""
+        with self.lock:
+            return {stage: histogram.snapshot() for stage, histogram in sorted(self.histograms.items())}
+
+    def prometheus_text(self, name='pothole_predictor_stage_seconds'):
+        """Prometheus text exposition format, one histogram series per stage"""
+        lines = [
+            f"# HELP {name} Time spent in each stage of a prediction request.",
+            f"# TYPE {name} histogram"
+        ]
+        with self.lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,190 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import contextlib
+import threading
+from pathlib import Path
+
+class ModelRegistry:
+    """
+    Versioned model artifacts under models/registry with an atomic "current" pointer.
+
+    Layout:
+        models/registry/
+        ├── CURRENT                  # name of the serving version, e.g. v0003
+        └── versions/
+            └── v0003/
+                ├── saved_model/     # or model.h5 / model.tflite / model.onnx
+                └── metadata.json    # input size, class names, source, ...
+
+    Versions are written to a temporary directory and renamed into place,
+    and CURRENT is replaced with os.replace, so readers never see a
+    half-written version or pointer.
+    """
+
+    def __init__(self, root='models/registry'):
+        self.root = Path(root)
+        self.versions_path = self.root / 'versions'
+        self.pointer_path = self.root / 'CURRENT'
+
+    def list_versions(self):
+        if not self.versions_path.exists():
+            return []
+        return sorted(p.name for p in self.versions_path.iterdir() if p.is_dir() and not p.name.startswith('.'))
+
+    def next_version(self):
+        versions = self.list_versions()
+        last = int(versions[-1][1:]) if versions else 0
+        return f"v{last + 1:04d}"
+
+    def publish(self, model, metadata, make_current=True):
+        """
+        Add a new version from a Keras model object or an existing artifact path.
+
+        Keras models are exported as a SavedModel, which loads without
+        rebuilding the Python layer graph.
+        """
+        version = self.next_version()
+        staging = self.versions_path / f".{version}.tmp"
+        if staging.exists():
+            shutil.rmtree(staging)
+        staging.mkdir(parents=True)
+
+        if isinstance(model, (str, Path)):
+            source = Path(model)
+            if source.is_dir():
+                artifact = 'saved_model'
+                shutil.copytree(source, staging / artifact)
+            else:
+                artifact = 'model' + source.suffix
+                shutil.copy2(source, staging / artifact)
+            metadata = dict(metadata, source=str(source))
+        else:
+            import tensorflow as tf
+            artifact = 'saved_model'
+            tf.saved_model.save(model, str(staging / artifact))
+
+        metadata = dict(metadata)
+        if 'version' in metadata:
+            # Keep the model's own release label; 'version' is the registry version
+            metadata['release'] = metadata.pop('version')
+        metadata.update(version=version, artifact=artifact, published_at=time.time())
+        with open(staging / 'metadata.json', 'w') as f:
+            json.dump(metadata, f, indent=2)
+
+        os.replace(staging, self.versions_path / version)
+        print(f"Published model version {version}")
+
+        if make_current:
+            self.set_current(version)
+        return version
+
+    def set_current(self, version):
+        """Atomically point CURRENT at an existing version"""
+        if not (self.versions_path / version / 'metadata.json').exists():
+            raise ValueError(f"Unknown model version '{version}'")
+        tmp_path = self.pointer_path.with_name('.CURRENT.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(version + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.pointer_path)
+        print(f"Current model version is now {version}")
+
+    def current(self):
+        """Name of the current version, or None when nothing has been published"""
+        try:
+            with open(self.pointer_path, 'r') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def resolve(self, version=None):
+        """Return (artifact_path, metadata) for a version (default: current), or (None, None)"""
+        version = version or self.current()
+        if version is None:
+            return None, None
+        version_path = self.versions_path / version
+        with open(version_path / 'metadata.json', 'r') as f:
+            metadata = json.load(f)
+        return str(version_path / metadata['artifact']), metadata
+
+class RegistryWatcher:
+    """
+    Poll the registry's CURRENT pointer and hot-swap the detector's model.
+
+    The new version is loaded on this background thread while the old one
+    keeps serving; the swap itself only replaces references, so requests
+    already running finish on the model they started with.
+    """
+
+    def __init__(self, detector, registry, interval=5.0):
+        self.detector = detector
+        self.registry = registry
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="registry-watcher", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                version = self.registry.current()
+                if version is None or version == self.detector.model_version:
+                    continue
+                print(f"Model registry points at {version}, loading in the background...", file=sys.stderr)
+                # Keep stdout free for the serve protocol
+                with contextlib.redirect_stdout(sys.stderr):
+                    self.detector.load_from_registry(self.registry, version)
+            except Exception as e:
+                print(f"Model reload failed: {e}", file=sys.stderr)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the versioned model registry")
+    parser.add_argument('--root', default='models/registry')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    publish_parser = subparsers.add_parser('publish', help="Publish a model artifact as a new version")
+    publish_parser.add_argument('artifact', help=".h5/.tflite/.onnx file or SavedModel directory")
+    publish_parser.add_argument('--metadata', help="Metadata JSON (default: the artifact's _metadata.json)")
+    publish_parser.add_argument('--no-current', action='store_true', help="Do not make it the current version")
+
+    current_parser = subparsers.add_parser('set-current', help="Point CURRENT at a version")
+    current_parser.add_argument('version')
+
+    subparsers.add_parser('list', help="List versions")
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.root)
+
+    if args.command == 'publish':
+        metadata_path = args.metadata or os.path.splitext(args.artifact)[0] + '_metadata.json'
+        metadata = {}
+        if os.path.exists(metadata_path):
+            with open(metadata_path, 'r') as f:
+                metadata = json.load(f)
+        # The predictor needs these even for artifacts published without metadata
+        metadata.setdefault('img_height', 224)
+        metadata.setdefault('img_width', 224)
+        metadata.setdefault('class_names', ['no_pothole', 'pothole'])
+        registry.publish(args.artifact, metadata, make_current=not args.no_current)
+    elif args.command == 'set-current':
+        registry.set_current(args.version)
+    else:
+        current = registry.current()
+        for version in registry.list_versions():
+            print(f"{'*' if version == current else ' '} {version}")
+
+if __name__ == "__main__":
+    main()
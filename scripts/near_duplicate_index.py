@@ -0,0 +1,351 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+from itertools import combinations
+
+import numpy as np
+
+HASH_BITS = 64
+
+def dhash(image, hash_size=8):
+    """
+    64-bit difference hash of an image.
+
+    Accepts BGR/RGB uint8 or float images (such as the preprocessed model
+    input); the hash is unchanged by recompression and resizing and only
+    drifts a few bits under slight crops.
+    """
+    import cv2  # Deferred so importing the index stays cheap
+
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    small = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+def popcount64(values):
+    """Number of set bits in each element of a uint64 array"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return np.unpackbits(values.view(np.uint8)).reshape(len(values), 64).sum(axis=1)
+
+class NearDuplicateIndex:
+    """
+    Perceptual-hash index answering "has a near-identical photo been analysed?".
+
+    Lookups use multi-index hashing: the 64-bit hash is split into blocks,
+    each block keyed into its own table, and by the pigeonhole principle any
+    hash within max_distance bits shares at least one block within
+    max_distance // num_blocks bits of the query. Only those buckets are
+    probed and their candidates are checked with a vectorised popcount, so a
+    lookup touches a tiny fraction of the index even at millions of entries.
+
+    Each entry keeps the model's class probabilities, so a match can be
+    turned back into a full prediction without running the model.
+    """
+
+    def __init__(self, max_distance=6, num_blocks=4):
+        if HASH_BITS % num_blocks:
+            raise ValueError("num_blocks must divide 64")
+        self.max_distance = max_distance
+        self.num_blocks = num_blocks
+        self.block_bits = HASH_BITS // num_blocks
+        self.block_mask = (1 << self.block_bits) - 1
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.saved = 0  # Entries [0, saved) are already in the database
+
+        self.size = 0
+        self.hashes = np.zeros(1024, dtype=np.uint64)
+        self.probabilities = None
+        self.model_indices = np.zeros(1024, dtype=np.int32)
+        self.record_ids = []
+        self.model_ids = []
+        self.tables = [{} for _ in range(num_blocks)]
+
+    @property
+    def unsaved(self):
+        """Entries added since the last save()"""
+        return self.size - self.saved
+
+    def _blocks(self, hash_value):
+        return [(hash_value >> (i * self.block_bits)) & self.block_mask for i in range(self.num_blocks)]
+
+    def _neighbours(self, block, radius):
+        """All block values within radius bits of block"""
+        yield block
+        for r in range(1, radius + 1):
+            for positions in combinations(range(self.block_bits), r):
+                flipped = block
+                for position in positions:
+                    flipped ^= 1 << position
+                yield flipped
+
+    def _grow(self, num_classes):
+        if self.probabilities is None:
+            self.probabilities = np.zeros((len(self.hashes), num_classes), dtype=np.float32)
+        if self.size < len(self.hashes):
+            return
+        capacity = 2 * len(self.hashes)
+        self.hashes = np.resize(self.hashes, capacity)
+        self.model_indices = np.resize(self.model_indices, capacity)
+        self.probabilities = np.resize(self.probabilities, (capacity, self.probabilities.shape[1]))
+
+    def add(self, hash_value, probabilities, model_id, record_id=None):
+        """Index one analysed image"""
+        with self.lock:
+            self._grow(len(probabilities))
+            entry = self.size
+            if model_id not in self.model_ids:
+                self.model_ids.append(model_id)
+
+            self.hashes[entry] = hash_value
+            self.probabilities[entry] = probabilities
+            self.model_indices[entry] = self.model_ids.index(model_id)
+            self.record_ids.append(record_id)
+            for table, block in zip(self.tables, self._blocks(hash_value)):
+                table.setdefault(block, []).append(entry)
+            self.size += 1
+            return entry
+
+    def lookup(self, hash_value, model_id, max_distance=None):
+        """
+        Find the closest indexed image scored by the same model.
+
+        Returns a dict with record_id, distance, similarity and probabilities,
+        or None when nothing is within max_distance bits.
+        """
+        max_distance = self.max_distance if max_distance is None else max_distance
+        radius = max_distance // self.num_blocks
+
+        with self.lock:
+            if model_id not in self.model_ids or self.size == 0:
+                return None
+            model_index = self.model_ids.index(model_id)
+
+            candidates = []
+            for table, block in zip(self.tables, self._blocks(hash_value)):
+                for neighbour in self._neighbours(block, radius):
+                    bucket = table.get(neighbour)
+                    if bucket:
+                        candidates.extend(bucket)
+            if not candidates:
+                return None
+
+            candidates = np.unique(np.array(candidates, dtype=np.int64))
+            candidates = candidates[self.model_indices[candidates] == model_index]
+            if len(candidates) == 0:
+                return None
+
+            distances = popcount64(self.hashes[candidates] ^ np.uint64(hash_value))
+            best = int(np.argmin(distances))
+            distance = int(distances[best])
+            if distance > max_distance:
+                return None
+
+            entry = int(candidates[best])
+            return {
+                'record_id': self.record_ids[entry],
+                'distance': distance,
+                'similarity': 1.0 - distance / HASH_BITS,
+                'probabilities': self.probabilities[entry].tolist()
+            }
+
+    def _build_tables(self):
+        """Bucket every entry by each block of its hash, grouping a whole block column at once"""
+        for table in self.tables:
+            table.clear()
+        if self.size == 0:
+            return
+
+        hashes = self.hashes[:self.size]
+        # The narrowest type that holds a block lets numpy radix-sort 16-bit blocks
+        block_type = np.min_scalar_type(self.block_mask)
+        for i, table in enumerate(self.tables):
+            blocks = ((hashes >> np.uint64(i * self.block_bits)) & np.uint64(self.block_mask)).astype(block_type)
+            order = np.argsort(blocks, kind='stable')
+            blocks = blocks[order]
+            starts = np.flatnonzero(np.concatenate(([True], blocks[1:] != blocks[:-1])))
+            values = blocks[starts]
+            entries = order.tolist()
+            bounds = starts.tolist() + [len(entries)]
+            table.update((value, entries[bounds[j]:bounds[j + 1]]) for j, value in enumerate(values.tolist()))
+
+    def _restore(self, hashes, probabilities, model_indices, model_ids, record_ids):
+        """Replace the entries with loaded arrays and rebuild the lookup tables"""
+        self.size = len(hashes)
+        capacity = max(1024, 2 * self.size)
+        self.hashes = np.resize(np.asarray(hashes, dtype=np.uint64), capacity)
+        self.model_indices = np.resize(np.asarray(model_indices, dtype=np.int32), capacity)
+        if self.size:
+            self.probabilities = np.resize(probabilities.astype(np.float32), (capacity, probabilities.shape[1]))
+        self.model_ids = list(model_ids)
+        self.record_ids = list(record_ids)
+        self._build_tables()
+
+    def save(self, path):
+        """
+        Append the entries added since the last save to the <path>.db SQLite file.
+
+        Each save adds one segment row holding the new entries' hashes, model
+        indices and probabilities as array blobs and their record ids as
+        JSON, in a single transaction. Its cost follows the number of new
+        entries rather than the size of the index, and a process killed
+        mid-save leaves every earlier segment intact.
+        """
+        with self.save_lock:
+            with self.lock:
+                start, end = self.saved, self.size
+                if self.probabilities is not None:
+                    probabilities = self.probabilities[start:end].astype('<f4')
+                else:
+                    probabilities = np.zeros((0, 0), dtype='<f4')
+                hashes = self.hashes[start:end].astype('<u8')
+                model_indices = self.model_indices[start:end].astype('<i4')
+                record_ids = self.record_ids[start:end]
+                model_ids = list(self.model_ids)
+
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            db = sqlite3.connect(path + '.db')
+            try:
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA synchronous=NORMAL")
+                self._create_schema(db)
+                with db:
+                    stored, = db.execute("SELECT COALESCE(MAX(first_entry + count), 0) FROM segments").fetchone()
+                    if stored != start:
+                        raise ValueError(f"{path}.db holds {stored} entries but {start} of this index were saved; "
+                                         "save() only appends to the file the index was loaded from")
+                    db.executemany("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                                   [('max_distance', self.max_distance), ('num_blocks', self.num_blocks)])
+                    db.executemany("INSERT OR IGNORE INTO models (model_index, model_id) VALUES (?, ?)",
+                                   list(enumerate(model_ids)))
+                    if end > start:
+                        db.execute(
+                            "INSERT INTO segments (first_entry, count, num_classes, hashes, model_indices, "
+                            "probabilities, record_ids) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (start, end - start, probabilities.shape[1], hashes.tobytes(),
+                             model_indices.tobytes(), probabilities.tobytes(), json.dumps(record_ids))
+                        )
+            finally:
+                db.close()
+
+            # Every entry now lives in the database; drop the npz/JSON files older versions wrote
+            for legacy in (path + '.npz', path + '.json'):
+                if os.path.exists(legacy):
+                    os.remove(legacy)
+            with self.lock:
+                self.saved = end
+
+    @staticmethod
+    def _create_schema(db):
+        db.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value)")
+        db.execute("CREATE TABLE IF NOT EXISTS models (model_index INTEGER PRIMARY KEY, model_id TEXT NOT NULL)")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS segments (first_entry INTEGER PRIMARY KEY, count INTEGER NOT NULL, "
+            "num_classes INTEGER NOT NULL, hashes BLOB NOT NULL, model_indices BLOB NOT NULL, "
+            "probabilities BLOB NOT NULL, record_ids TEXT NOT NULL)"
+        )
+
+    @classmethod
+    def load(cls, path, max_distance=None):
+        """Load an index written by save(), or return an empty one if none exists"""
+        if not os.path.exists(path + '.db'):
+            if os.path.exists(path + '.npz'):
+                return cls._load_legacy(path, max_distance)
+            return cls(max_distance=max_distance if max_distance is not None else 6)
+
+        db = sqlite3.connect(path + '.db')
+        try:
+            settings = dict(db.execute("SELECT key, value FROM settings"))
+            model_ids = [row[0] for row in db.execute("SELECT model_id FROM models ORDER BY model_index")]
+            segments = db.execute(
+                "SELECT count, num_classes, hashes, model_indices, probabilities, record_ids "
+                "FROM segments ORDER BY first_entry"
+            ).fetchall()
+        finally:
+            db.close()
+
+        index = cls(
+            max_distance=max_distance if max_distance is not None else int(settings['max_distance']),
+            num_blocks=int(settings['num_blocks'])
+        )
+        if segments:
+            record_ids = []
+            for segment in segments:
+                record_ids.extend(json.loads(segment[5]))
+            index._restore(
+                np.frombuffer(b''.join(segment[2] for segment in segments), dtype='<u8'),
+                np.concatenate([np.frombuffer(segment[4], dtype='<f4').reshape(segment[0], segment[1])
+                                for segment in segments]),
+                np.frombuffer(b''.join(segment[3] for segment in segments), dtype='<i4'),
+                model_ids, record_ids
+            )
+        index.saved = index.size
+        return index
+
+    @classmethod
+    def _load_legacy(cls, path, max_distance=None):
+        """Load the <path>.npz and JSON sidecar of older versions; the next save() moves them to <path>.db"""
+        with open(path + '.json', 'r') as f:
+            meta = json.load(f)
+        index = cls(
+            max_distance=max_distance if max_distance is not None else meta['max_distance'],
+            num_blocks=meta['num_blocks']
+        )
+        with np.load(path + '.npz') as arrays:
+            # A save killed between its two renames could leave a sidecar ahead of the arrays
+            size = min(len(arrays['hashes']), len(meta['record_ids']))
+            index._restore(arrays['hashes'][:size], arrays['probabilities'][:size], arrays['model_indices'][:size],
+                           meta['model_ids'], meta['record_ids'][:size])
+        return index
+
+class IndexSaver:
+    """
+    Save a NearDuplicateIndex in the background while it is being served.
+
+    New entries are appended once every_inserts of them have accumulated or
+    interval seconds after the first unsaved one, so a worker that is killed
+    rather than shut down loses at most that much of what it learned. Each
+    save only writes the new entries, so saving often stays cheap however
+    large the index grows.
+    """
+
+    def __init__(self, index, path, every_inserts=1000, interval=60.0, poll_interval=1.0):
+        self.index = index
+        self.path = path
+        self.every_inserts = every_inserts
+        self.interval = interval
+        self.poll_interval = min(poll_interval, interval)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="near-duplicate-saver", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        unsaved_since = None
+        while not self.stop_event.wait(self.poll_interval):
+            if self.index.unsaved == 0:
+                unsaved_since = None
+                continue
+            if unsaved_since is None:
+                unsaved_since = time.monotonic()
+            if self.index.unsaved >= self.every_inserts or time.monotonic() - unsaved_since >= self.interval:
+                try:
+                    self.index.save(self.path)
+                    unsaved_since = None
+                except OSError as e:
+                    print(f"Saving near-duplicate index failed: {e}", file=sys.stderr)
+
+    def stop(self):
+        """Stop the thread and write whatever is still unsaved"""
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        if self.index.unsaved:
+            self.index.save(self.path)
@@ -1,132 +1,902 @@
+import time
+_module_started = time.perf_counter()
+
 import sys
 import json
 import os
+import contextlib
+import base64
+import hashlib
+import signal
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import tensorflow as tf
-from tensorflow import keras
-import cv2
+
+from batch_scheduler import MicroBatchScheduler
+from inference_backends import BACKENDS, create_backend, resolve_backend_name, import_backend_dependencies
+from prediction_cache import PredictionCache, model_identity
+from near_duplicate_index import NearDuplicateIndex, IndexSaver, dhash
+from image_headers import image_format, read_image_size, read_jpeg_orientation
+from model_registry import ModelRegistry, RegistryWatcher
+from latency_metrics import LatencyMetrics, StageTimings
+from worker_pool import InferenceWorkerPool, WorkerPoolBackend
+from prediction_ledger import PredictionLedger
+
+# Thresholds of the severity/priority rules, shared with the vectorised
+# re-scoring in prediction_ledger.py so a tweak applies to both
+RULE_THRESHOLDS = {
+    'severity_bounds': [0.65, 0.75, 0.85, 0.95],  # Each confidence bound exceeded adds a severity level
+    'boost_confidence': 0.95,  # Reliable detections above this gain a severity level...
+    'keep_confidence': 0.85,  # ...above this keep it, and otherwise lose one
+    'confidence_levels': [[0.95, "Excellent"], [0.85, "Very High"], [0.75, "High"], [0.65, "Medium"], [0.55, "Low"]],
+    'priority_severity': [[4, "Emergency"], [3, "High"], [2, "Medium"]],
+    'size_confidence': [[0.9, "Large"], [0.75, "Medium"]],
+    'high_confidence_recommendation': 0.8
+}
+
+# TensorFlow and OpenCV are imported when a model is loaded, so usage errors
+# and the "Model not found" path answer without paying for them.
+cv2 = None
+MODULE_IMPORT_SECONDS = time.perf_counter() - _module_started
+
+def import_cv2():
+    """Import OpenCV on first use"""
+    global cv2
+    if cv2 is None:
+        import cv2 as opencv
+        cv2 = opencv
+    return cv2
 
 class KagglePotholeDetector:
-    def __init__(self, img_height=224, img_width=224):
+    def __init__(self, img_height=224, img_width=224, backend=None, cache=None,
+                 near_duplicates=None, num_threads=None, ledger=None):
         self.img_height = img_height
         self.img_width = img_width
         self.model = None
+        self.model_id = None
+        self.model_version = None  # Stamped on every prediction
+        self.model_lock = threading.Lock()  # Guards hot swaps of model/model_id/model_version
+        self.screener = None  # Optional cheap first stage, see load_screener()
+        self.screener_id = None
+        self.screening_band = (0.1, 0.9)
+        self.backend = backend  # None picks the engine from the model file extension
+        self.num_threads = num_threads  # TFLite/ONNX Runtime threads (None: their default)
+        self.cache = cache  # Optional PredictionCache for repeated uploads
+        self.near_duplicates = near_duplicates  # Optional NearDuplicateIndex for re-uploaded photos
+        self.ledger = ledger  # Optional PredictionLedger keeping every prediction's raw output
         self.class_names = ['no_pothole', 'pothole']
+        self.startup_timings = {'module_import_s': MODULE_IMPORT_SECONDS}
     
-    def load_model(self, model_path):
-        """Load a saved model"""
+    def load_model(self, model_path, warmup_batch_sizes=None, model_version=None):
+        """
+        Load a saved model with the configured inference backend.
+        
+        Startup is split into an import phase (TensorFlow/ONNX Runtime and
+        OpenCV), a load phase and an optional warm-up phase that runs dummy
+        batches so graph tracing is not paid by the first real request. Each
+        phase's duration is recorded in self.startup_timings.
+        
+        The new model is fully loaded and warmed before it replaces the
+        current one, so this is also how a running detector swaps versions.
+        """
         try:
-            self.model = keras.models.load_model(model_path)
-            print(f"Model loaded from {model_path}")
+            backend_name = resolve_backend_name(self.backend, model_path)
+            
+            started = time.perf_counter()
+            import_backend_dependencies(backend_name)
+            import_cv2()
+            self.startup_timings['import_s'] = time.perf_counter() - started
+            
+            started = time.perf_counter()
+            model = create_backend(backend_name, model_path, self.img_height, self.img_width,
+                                   num_threads=self.num_threads)
+            model_id = model_identity(model_path)
+            self.startup_timings['load_s'] = time.perf_counter() - started
+            print(f"Model loaded from {model_path} ({type(model).__name__})")
+            
+            if warmup_batch_sizes:
+                self.warmup(warmup_batch_sizes, model)
+            
+            with self.model_lock:
+                self.model = model
+                self.model_id = model_id
+                self.model_version = model_version or os.path.basename(model_path.rstrip(os.sep))
         except Exception as e:
             print(f"Error loading model: {e}")
             return False
         return True
     
-    def predict_with_confidence(self, image_path, confidence_threshold=0.7):
-        """Enhanced prediction with confidence analysis"""
+    def load_from_registry(self, registry, version=None, warmup_batch_sizes=None):
+        """Load a version (default: current) from a ModelRegistry, using its metadata"""
+        model_path, metadata = registry.resolve(version)
+        if model_path is None:
+            print("Model registry has no current version")
+            return False
+        
+        input_size = (metadata.get('img_height', self.img_height), metadata.get('img_width', self.img_width))
+        if self.model is None:
+            self.img_height, self.img_width = input_size
+            self.class_names = metadata.get('class_names', self.class_names)
+        elif input_size != (self.img_height, self.img_width) or \
+                metadata.get('class_names', self.class_names) != self.class_names:
+            print(f"Model version {metadata['version']} changes the input size or classes; restart to use it")
+            return False
+        
+        return self.load_model(model_path, warmup_batch_sizes, model_version=metadata['version'])
+    
+    def use_worker_pool(self, pool):
+        """
+        Answer predictions through a started InferenceWorkerPool.
+        
+        The workers hold the model; this process keeps decoding, caching and
+        near-duplicate lookups, and takes the model identity, version, input
+        size and class names the workers reported.
+        """
+        import_cv2()  # Decoding still happens here
+        info = pool.model_info
+        self.img_height, self.img_width = info['img_height'], info['img_width']
+        self.class_names = info['class_names']
+        self.screener_id = info['screener_id']
+        with self.model_lock:
+            self.model = WorkerPoolBackend(pool)
+            self.model_id = info['model_id']
+            self.model_version = info['model_version']
+        # Worker 0's import/load/warm-up phases; they all start in parallel
+        self.startup_timings.update((phase, seconds) for phase, seconds in info['startup'].items()
+                                    if phase != 'module_import_s')
+        self.startup_timings['worker_pool_s'] = info['startup_s']
+    
+    def result_identity(self):
+        """Identity of everything that determines a prediction, for the cache and near-duplicate index"""
+        if self.screener_id is not None:
+            return f"{self.model_id}+{self.screener_id}"
+        return self.model_id
+    
+    def model_snapshot(self):
+        """The model and its version, read together so a concurrent swap cannot split them"""
+        with self.model_lock:
+            return self.model, self.model_version
+    
+    def warmup(self, batch_sizes=(1,), model=None):
+        """Run dummy batches through the model so tracing happens before real traffic"""
+        model = model or self.model
+        started = time.perf_counter()
+        for batch_size in batch_sizes:
+            dummy = np.zeros((batch_size, self.img_height, self.img_width, 3), dtype=np.float32)
+            model.predict(dummy, verbose=0)
+        self.startup_timings['warmup_s'] = time.perf_counter() - started
+    
+    def preprocess_image(self, img):
+        """Convert a BGR image from OpenCV into a normalised model input"""
+        import_cv2()
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        img = cv2.resize(img, (self.img_width, self.img_height))
+        return img.astype('float32') / 255.0
+    
+    def build_prediction(self, probabilities, confidence_threshold=0.7, model_version=None):
+        """Turn one row of model output into the prediction dict"""
+        predicted_class = int(np.argmax(probabilities))  # Convert to Python int
+        confidence = float(probabilities[predicted_class])  # Convert to Python float
+        
+        # Determine reliability
+        is_reliable = bool(confidence >= confidence_threshold)  # Convert to Python bool
+        
+        # Enhanced severity scoring for potholes: 1 to 5 by confidence
+        severity = 0
+        if predicted_class == 1:  # pothole detected
+            severity = 1 + sum(confidence > bound for bound in RULE_THRESHOLDS['severity_bounds'])
+        
+        return {
+            'class': self.class_names[predicted_class],
+            'confidence': confidence,
+            'is_pothole': bool(predicted_class == 1),  # Convert to Python bool
+            'is_reliable': is_reliable,
+            'severity': int(severity),  # Convert to Python int
+            'raw_prediction': [float(x) for x in probabilities],  # Convert all to Python float
+            'confidence_threshold': float(confidence_threshold),
+            'model_version': model_version or self.model_version
+        }
+    
+    def load_screener(self, screener_path, screening_band=(0.1, 0.9)):
+        """
+        Load a screening model to run as the first stage of a cascade.
+        
+        Images whose screening pothole probability falls inside screening_band
+        are re-scored by the full model; the rest are answered by the screener.
+        """
+        try:
+            self.screener = create_backend(None, screener_path, self.img_height, self.img_width,
+                                           num_threads=self.num_threads)
+            self.screener_id = model_identity(screener_path)
+            self.screening_band = tuple(screening_band)
+            print(f"Screening model loaded from {screener_path}")
+        except Exception as e:
+            print(f"Error loading screening model: {e}")
+            return False
+        return True
+    
+    def predict_probabilities(self, images):
+        """
+        Model output rows for a batch, the cascade stage behind each row and
+        the model version that produced them.
+        
+        Without a screener every row comes from the full model and the stages
+        are None. With one, the whole batch is screened first and only the
+        uncertain images go through the full model, in a single call.
+        """
+        model, model_version = self.model_snapshot()
+        batch = np.stack(images)
+        if self.screener is None:
+            return model.predict(batch, verbose=0), None, model_version
+        
+        probabilities = np.array(self.screener.predict(batch, verbose=0))
+        low, high = self.screening_band
+        uncertain = (probabilities[:, 1] > low) & (probabilities[:, 1] < high)
+        if np.any(uncertain):
+            probabilities[uncertain] = model.predict(batch[uncertain], verbose=0)
+        return probabilities, np.where(uncertain, 'full', 'screening'), model_version
+    
+    def predict_batch(self, images, confidence_threshold=0.7):
+        """Run one forward pass over a list of preprocessed images"""
         if self.model is None:
             print("Model not loaded!")
             return None
         
+        if len(images) == 0:
+            return []
+        
+        probabilities, stages, model_version = self.predict_probabilities(images)
+        predictions = [self.build_prediction(row, confidence_threshold, model_version)
+                       for row in probabilities]
+        if stages is not None:
+            for prediction, stage in zip(predictions, stages):
+                prediction['stage'] = str(stage)
+        return predictions
+    
+    def read_image_bytes(self, image_path):
+        """Read the raw encoded image, returning None if the file cannot be read"""
         try:
-            # Load and preprocess image
-            img = cv2.imread(image_path)
+            with open(image_path, 'rb') as f:
+                return f.read()
+        except OSError:
+            print(f"Could not load image: {image_path}")
+            return None
+    
+    def reduced_decode_flag(self, image_bytes):
+        """
+        Pick the OpenCV decode mode for encoded bytes.
+        
+        JPEG can be decoded directly at 1/2, 1/4 or 1/8 scale by libjpeg, so
+        a 12 MP phone photo never materialises at full resolution when the
+        model only needs 224 px. The largest reduction that still leaves the
+        short side at least the model input size is used.
+        """
+        import_cv2()
+        if image_format(image_bytes) != 'jpeg':
+            return cv2.IMREAD_COLOR
+        
+        size = read_image_size(image_bytes)
+        if size is None:
+            return cv2.IMREAD_COLOR
+        
+        short_side = min(size)
+        needed = max(self.img_height, self.img_width)
+        for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                             (4, cv2.IMREAD_REDUCED_COLOR_4),
+                             (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if short_side // factor >= needed:
+                return flag
+        return cv2.IMREAD_COLOR
+    
+    def decode_image(self, image_bytes, timings=None):
+        """Decode encoded image bytes and preprocess them, returning None if they are not an image"""
+        timings = timings or StageTimings()
+        with timings.stage('decode'):
+            buffer = np.frombuffer(image_bytes, dtype=np.uint8)
+            img = cv2.imdecode(buffer, self.reduced_decode_flag(image_bytes))
+        if img is None:
+            return None
+        with timings.stage('preprocess'):
+            return self.preprocess_image(img)
+    
+    def load_image(self, image_path):
+        """Read an image from disk and preprocess it, returning None if it cannot be read"""
+        image_bytes = self.read_image_bytes(image_path)
+        if image_bytes is None:
+            return None
+        img = self.decode_image(image_bytes)
+        if img is None:
+            print(f"Could not load image: {image_path}")
+        return img
+    
+    def predict_image_bytes(self, image_bytes, confidence_threshold=0.7, scheduler=None,
+                            record_id=None, timings=None):
+        """
+        Predict from encoded image bytes, answering repeated uploads from the cache.
+        
+        When a MicroBatchScheduler is given the forward pass is batched with
+        other concurrent requests; identical concurrent uploads share one pass.
+        With a near-duplicate index, a photo close to one analysed before reuses
+        that result and links to it through 'near_duplicate_of'.
+        
+        Stage durations (decode, preprocess, near_duplicate, inference) are
+        added to timings when a StageTimings is given.
+        """
+        timings = timings or StageTimings()
+        
+        def predict():
+            img = self.decode_image(image_bytes, timings)
             if img is None:
-                print(f"Could not load image: {image_path}")
+                print("Could not decode image")
                 return None
-                
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            img = cv2.resize(img, (self.img_width, self.img_height))
-            img = img.astype('float32') / 255.0
-            img = np.expand_dims(img, axis=0)
-            
-            # Make prediction
-            prediction = self.model.predict(img, verbose=0)
-            predicted_class = int(np.argmax(prediction[0]))  # Convert to Python int
-            confidence = float(prediction[0][predicted_class])  # Convert to Python float
             
-            # Determine reliability
-            is_reliable = bool(confidence >= confidence_threshold)  # Convert to Python bool
+            image_hash = None
+            if self.near_duplicates is not None:
+                with timings.stage('near_duplicate'):
+                    image_hash = dhash(img)
+                    match = self.near_duplicates.lookup(image_hash, self.result_identity())
+                if match is not None:
+                    prediction = self.build_prediction(match['probabilities'], confidence_threshold)
+                    prediction['near_duplicate_of'] = match['record_id']
+                    prediction['near_duplicate_similarity'] = match['similarity']
+                    return prediction
             
-            # Enhanced severity scoring for potholes
-            severity = 0
-            if predicted_class == 1:  # pothole detected
-                if confidence > 0.95:
-                    severity = 5
-                elif confidence > 0.85:
-                    severity = 4
-                elif confidence > 0.75:
-                    severity = 3
-                elif confidence > 0.65:
-                    severity = 2
+            # With a scheduler this includes the wait for the batch to fill
+            with timings.stage('inference'):
+                if scheduler is not None:
+                    prediction = scheduler.predict(img, confidence_threshold)
                 else:
-                    severity = 1
+                    prediction = self.predict_batch([img], confidence_threshold)[0]
+            
+            if image_hash is not None:
+                self.near_duplicates.add(image_hash, prediction['raw_prediction'], self.result_identity(), record_id)
+            return prediction
+        
+        digest = None
+        if self.cache is not None or self.ledger is not None:
+            digest = hashlib.sha256(image_bytes).hexdigest()
+        
+        if self.cache is None:
+            prediction = predict()
+        else:
+            key = self.cache.make_key(image_bytes, self.result_identity(), confidence_threshold, digest)
+            prediction = self.cache.get_or_compute(key, predict)
+        
+        self.record_in_ledger(digest, prediction, record_id)
+        return prediction
+    
+    def record_in_ledger(self, digest, prediction, record_id=None):
+        """Append a prediction to the ledger, if one is attached"""
+        if self.ledger is not None and prediction is not None:
+            self.ledger.record(digest, prediction, self.result_identity(), record_id,
+                               get_action_priority(prediction))
+    
+    def decode_for_tiling(self, image_bytes, max_side):
+        """
+        Decode an image for tiled inference with its long side at most max_side.
+        
+        Returns (rgb_image, original_size) or (None, None), both in the
+        orientation imdecode returns after applying EXIF rotation. JPEGs are
+        decoded at the largest libjpeg reduction that still leaves max_side
+        pixels.
+        """
+        import_cv2()
+        size = read_image_size(image_bytes)
+        flag = cv2.IMREAD_COLOR
+        if size is not None and image_format(image_bytes) == 'jpeg':
+            for factor, reduced_flag in ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                                         (4, cv2.IMREAD_REDUCED_COLOR_4),
+                                         (2, cv2.IMREAD_REDUCED_COLOR_2)):
+                if max(size) // factor >= max_side:
+                    flag = reduced_flag
+                    break
+        
+        img = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), flag)
+        if img is None:
+            return None, None
+        if size is not None and read_jpeg_orientation(image_bytes) >= 5:
+            # imdecode applied the EXIF rotation, so the header size is transposed
+            size = size[::-1]
+        original_size = size or (img.shape[1], img.shape[0])
+        
+        height, width = img.shape[:2]
+        scale = min(1.0, max_side / max(height, width))
+        # Never shrink below one tile
+        scale = max(scale, self.img_height / height, self.img_width / width)
+        if scale != 1.0:
+            img = cv2.resize(img, (max(self.img_width, round(width * scale)),
+                                   max(self.img_height, round(height * scale))),
+                             interpolation=cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR)
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB), original_size
+    
+    @staticmethod
+    def tile_offsets(length, tile, stride):
+        """Tile start offsets covering [0, length), with the last tile flush to the edge"""
+        offsets = list(range(0, length - tile + 1, stride))
+        if offsets[-1] != length - tile:
+            offsets.append(length - tile)
+        return offsets
+    
+    def predict_tiled(self, image_bytes, confidence_threshold=0.7, max_side=896, overlap=0.25,
+                      tile_threshold=0.5, batch_size=32, scheduler=None, timings=None, record_id=None):
+        """
+        Score overlapping model-sized tiles of the full-resolution image.
+        
+        Tiles are zero-copy strided views of the decoded image and are scored
+        together with the whole (resized) image in a few batched predict calls.
+        The prediction gains a 'tiled' block with a coarse pothole heatmap, the
+        bounding region of positive tiles in original pixel coordinates and an
+        area-based size estimate. When only tiles find a pothole, the headline
+        prediction comes from the strongest tile so small potholes in wide
+        street shots are not lost.
+        """
+        if self.model is None:
+            print("Model not loaded!")
+            return None
+        
+        timings = timings or StageTimings()
+        with timings.stage('decode'):
+            img, original_size = self.decode_for_tiling(image_bytes, max_side)
+        if img is None:
+            print("Could not decode image")
+            return None
+        
+        height, width = img.shape[:2]
+        tile_h, tile_w = self.img_height, self.img_width
+        stride_y = max(1, int(tile_h * (1.0 - overlap)))
+        stride_x = max(1, int(tile_w * (1.0 - overlap)))
+        ys = self.tile_offsets(height, tile_h, stride_y)
+        xs = self.tile_offsets(width, tile_w, stride_x)
+        
+        # (rows, cols, tile_h, tile_w, 3) views into img; nothing is copied here
+        windows = np.lib.stride_tricks.sliding_window_view(img, (tile_h, tile_w, 3))[:, :, 0]
+        positions = [(y, x) for y in ys for x in xs]
+        
+        with timings.stage('preprocess'):
+            whole_image = cv2.resize(img, (tile_w, tile_h))
+            inputs = [whole_image] + [windows[y, x] for y, x in positions]
+        
+        model, model_version = self.model_snapshot()
+        with timings.stage('inference'):
+            if scheduler is not None:
+                futures = [scheduler.submit(item.astype('float32') / 255.0, confidence_threshold)
+                           for item in inputs]
+                results = [future.result() for future in futures]
+                probabilities = np.array([result['raw_prediction'] for result in results])
+                model_version = results[0]['model_version']
+            else:
+                probabilities = []
+                for i in range(0, len(inputs), batch_size):
+                    # Only the current batch is materialised as float32
+                    batch = np.stack(inputs[i:i + batch_size]).astype('float32') / 255.0
+                    probabilities.extend(model.predict(batch, verbose=0))
+                probabilities = np.array(probabilities)
+        
+        prediction = self.build_prediction(probabilities[0], confidence_threshold, model_version)
+        tile_scores = probabilities[1:, 1]
+        heatmap = tile_scores.reshape(len(ys), len(xs))
+        positive = tile_scores >= tile_threshold
+        
+        scale_x = original_size[0] / width
+        scale_y = original_size[1] / height
+        bounding_box = None
+        area_fraction = 0.0
+        if np.any(positive):
+            # Coverage of the union of positive tiles, on an 8x coarser grid
+            mask = np.zeros((height // 8 + 1, width // 8 + 1), dtype=bool)
+            for (y, x) in np.array(positions)[positive]:
+                mask[y // 8:(y + tile_h) // 8, x // 8:(x + tile_w) // 8] = True
+            area_fraction = float(mask.mean())
             
-            return {
-                'class': self.class_names[predicted_class],
-                'confidence': confidence,
-                'is_pothole': bool(predicted_class == 1),  # Convert to Python bool
-                'is_reliable': is_reliable,
-                'severity': int(severity),  # Convert to Python int
-                'raw_prediction': [float(x) for x in prediction[0]],  # Convert all to Python float
-                'confidence_threshold': float(confidence_threshold)
+            boxes = np.array(positions)[positive]
+            bounding_box = {
+                'xmin': int(boxes[:, 1].min() * scale_x),
+                'ymin': int(boxes[:, 0].min() * scale_y),
+                'xmax': int((boxes[:, 1].max() + tile_w) * scale_x),
+                'ymax': int((boxes[:, 0].max() + tile_h) * scale_y)
             }
             
+            if not prediction['is_pothole']:
+                prediction = self.build_prediction(probabilities[1 + int(np.argmax(tile_scores))],
+                                                   confidence_threshold, model_version)
+        
+        if area_fraction > 0.25:
+            estimated_size = "Large"
+        elif area_fraction > 0.08:
+            estimated_size = "Medium"
+        elif area_fraction > 0:
+            estimated_size = "Small"
+        else:
+            estimated_size = "N/A"
+        
+        prediction['tiled'] = {
+            'tile_size': [tile_w, tile_h],
+            'stride': [stride_x, stride_y],
+            'analysed_size': [width, height],
+            'original_size': list(original_size),
+            'heatmap': [[float(score) for score in row] for row in heatmap],
+            'positive_tiles': int(np.sum(positive)),
+            'total_tiles': len(positions),
+            'bounding_box': bounding_box,
+            'area_fraction': area_fraction,
+            'estimated_size': estimated_size
+        }
+        if self.ledger is not None:
+            self.record_in_ledger(hashlib.sha256(image_bytes).hexdigest(), prediction, record_id)
+        return prediction
+    
+    def predict_with_confidence(self, image_path, confidence_threshold=0.7, timings=None):
+        """Enhanced prediction with confidence analysis"""
+        if self.model is None:
+            print("Model not loaded!")
+            return None
+        
+        timings = timings or StageTimings()
+        try:
+            # Load image
+            with timings.stage('read'):
+                image_bytes = self.read_image_bytes(image_path)
+            if image_bytes is None:
+                return None
+            
+            # Make prediction
+            return self.predict_image_bytes(image_bytes, confidence_threshold, record_id=image_path,
+                                            timings=timings)
+            
         except Exception as e:
             print(f"Error predicting image {image_path}: {e}")
             return None
 
+def resolve_model_path(models_dir='models', model_path=None):
+    """Find the trained model, returning (model_path, error_result)"""
+    if model_path is not None:
+        if os.path.exists(model_path):
+            return model_path, None
+        return None, {"error": "Model not found.", "model_path": model_path}
+    
+    model_path = os.path.join(models_dir, 'kaggle_pothole_detector.h5')
+    
+    if not os.path.exists(model_path):
+        # Try alternative model path
+        alt_model_path = os.path.join(models_dir, 'kaggle_pothole_detector_best.h5')
+        if os.path.exists(alt_model_path):
+            return alt_model_path, None
+        return None, {
+            "error": "Model not found. Please train the model first.",
+            "model_path": model_path,
+            "alternative_path": alt_model_path,
+            "available_files": os.listdir(models_dir) if os.path.exists(models_dir) else []
+        }
+    
+    return model_path, None
+
+def analyse_prediction(prediction):
+    """Build the full analysis result returned to the API route"""
+    if prediction is None:
+        return {"error": "Failed to analyze image"}
+    
+    # Enhanced analysis with Kaggle-specific insights
+    return {
+        "prediction": prediction,
+        "severity": get_enhanced_severity(prediction),
+        "recommendations": get_enhanced_recommendations(prediction),
+        "confidence_level": get_confidence_level(prediction['confidence']),
+        "reliability": "High" if prediction['is_reliable'] else "Low",
+        "action_priority": get_action_priority(prediction),
+        "estimated_size": estimate_pothole_size(prediction)
+    }
+
+def serve(detector, confidence_threshold=0.7, max_batch_size=16, max_wait_ms=10,
+          input_stream=None, output_stream=None, timings=False, scheduler=None):
+    """
+    Serve predictions over a JSON-lines protocol on stdin/stdout.
+    
+    Each request line is a JSON object such as
+    {"id": "42", "image_path": "uploads/photo.jpg"} and gets exactly one
+    response line carrying the same "id" plus the usual analysis result.
+    Instead of a path, "image_b64" may carry the base64-encoded upload so the
+    image is decoded straight from memory, and "tiled": true requests tiled
+    full-resolution inference.
+    Requests are handled concurrently and micro-batched, so responses may
+    arrive out of order. {"cmd": "stats"} returns the batching and cache
+    statistics.
+    Every request's stage latencies are recorded in histograms;
+    {"cmd": "metrics"} returns their percentiles as JSON and
+    {"cmd": "metrics", "format": "prometheus"} returns Prometheus text. A
+    request with "timings": true (or every request, with timings=True) also
+    gets its own 'timings' block; its serialisation time only reaches the
+    histograms, since it is measured after the block is written.
+    An InferenceWorkerPool can be passed as the scheduler to score images in
+    several pinned worker processes instead of this one.
+    Diagnostic output is sent to stderr so stdout only ever carries responses.
+    """
+    input_stream = input_stream or sys.stdin
+    output_stream = output_stream or sys.stdout
+    output_lock = threading.Lock()
+    metrics = LatencyMetrics()
+    if scheduler is None:
+        scheduler = MicroBatchScheduler(detector, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms,
+                                        metrics=metrics)
+    else:
+        scheduler.metrics = metrics
+    
+    def respond(payload, request_timings=None):
+        if request_timings is None:
+            line = json.dumps(payload)
+        else:
+            with request_timings.stage('serialize'):
+                line = json.dumps(payload)
+        with output_lock:
+            output_stream.write(line + "\n")
+            output_stream.flush()
+    
+    def handle(request):
+        request_id = request.get('id')
+        request_timings = StageTimings()
+        try:
+            with contextlib.redirect_stdout(sys.stderr):
+                with request_timings.stage('read'):
+                    if request.get('image_b64'):
+                        image_bytes = base64.b64decode(request['image_b64'])
+                    else:
+                        image_bytes = detector.read_image_bytes(request['image_path'])
+                prediction = None
+                if image_bytes is not None and request.get('tiled'):
+                    prediction = detector.predict_tiled(
+                        image_bytes,
+                        request.get('confidence_threshold', confidence_threshold),
+                        scheduler=scheduler,
+                        timings=request_timings,
+                        record_id=request.get('report_id', request.get('image_path'))
+                    )
+                elif image_bytes is not None:
+                    prediction = detector.predict_image_bytes(
+                        image_bytes,
+                        request.get('confidence_threshold', confidence_threshold),
+                        scheduler=scheduler,
+                        record_id=request.get('report_id', request.get('image_path')),
+                        timings=request_timings
+                    )
+            with request_timings.stage('analyse'):
+                result = analyse_prediction(prediction)
+        except Exception as e:
+            result = {"error": str(e)}
+        
+        result["id"] = request_id
+        if timings or request.get('timings'):
+            result["timings"] = request_timings.as_dict()
+        respond(result, request_timings)
+        metrics.observe_timings(request_timings)
+    
+    respond({"status": "ready", "startup": detector.startup_timings})
+    
+    # Enough request threads to keep a full batch decoding while one is scored
+    with ThreadPoolExecutor(max_workers=2 * scheduler.max_batch_size) as executor:
+        for line in input_stream:
+            line = line.strip()
+            if not line:
+                continue
+            
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                respond({"error": f"Invalid request: {e}"})
+                continue
+            
+            request_id = request.get('id')
+            
+            if request.get('cmd') == 'ping':
+                respond({"id": request_id, "status": "ready"})
+                continue
+            if request.get('cmd') == 'stats':
+                stats = {"scheduler": scheduler.stats()}
+                if detector.cache is not None:
+                    stats["cache"] = detector.cache.stats()
+                if detector.near_duplicates is not None:
+                    stats["near_duplicate_index_size"] = detector.near_duplicates.size
+                stats["latency"] = metrics.snapshot()
+                respond({"id": request_id, "stats": stats})
+                continue
+            if request.get('cmd') == 'metrics':
+                if request.get('format') == 'prometheus':
+                    respond({"id": request_id, "metrics": metrics.prometheus_text()})
+                else:
+                    respond({"id": request_id, "metrics": metrics.snapshot()})
+                continue
+            if request.get('cmd') == 'shutdown':
+                respond({"id": request_id, "status": "shutting down"})
+                break
+            
+            if not request.get('image_path') and not request.get('image_b64'):
+                respond({"id": request_id, "error": "Request must include image_path or image_b64"})
+                continue
+            
+            executor.submit(handle, request)
+    
+    scheduler.close()
+
 def main():
-    if len(sys.argv) != 2:
-        print(json.dumps({"error": "Usage: python predict_image_kaggle.py <image_path>"}))
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Kaggle pothole detector")
+    parser.add_argument('image_path', nargs='?', help="Image file, or - to read the image bytes from stdin")
+    parser.add_argument('--serve', action='store_true',
+                        help="Keep the model loaded and answer JSON-lines requests on stdin")
+    parser.add_argument('--model', help="Model file to use (.h5 or INT8 .tflite)")
+    parser.add_argument('--registry', default='models/registry',
+                        help="Model registry; its current version is used when --model is not given")
+    parser.add_argument('--watch-interval', type=float, default=5,
+                        help="Serve mode: seconds between registry checks for a new version (0 disables)")
+    parser.add_argument('--backend', choices=sorted(BACKENDS),
+                        help="Inference engine (default: chosen from the model file)")
+    parser.add_argument('--cache-size', type=int, default=10000,
+                        help="Entries in the in-memory prediction cache (0 disables it)")
+    parser.add_argument('--cache-db',
+                        help="SQLite file for a prediction cache that survives restarts")
+    parser.add_argument('--ledger',
+                        help="SQLite prediction ledger recording every prediction for later re-scoring")
+    parser.add_argument('--near-duplicate-index',
+                        help="Perceptual-hash index path, stored as <path>.db; near-duplicate photos reuse "
+                             "earlier results")
+    parser.add_argument('--near-duplicate-distance', type=int, default=6,
+                        help="Largest dHash Hamming distance (of 64 bits) treated as the same photo")
+    parser.add_argument('--near-duplicate-save-every', type=int, default=1000,
+                        help="Serve mode: save the near-duplicate index after this many new entries")
+    parser.add_argument('--near-duplicate-save-interval', type=float, default=60,
+                        help="Serve mode: longest time in seconds a new index entry stays unsaved")
+    parser.add_argument('--screener',
+                        help="Screening model for a two-stage cascade (see train_screening_model.py)")
+    parser.add_argument('--screening-band', type=float, nargs=2, default=(0.1, 0.9), metavar=('LOW', 'HIGH'),
+                        help="Screening pothole probabilities inside this band go to the full model")
+    parser.add_argument('--max-batch-size', type=int, default=16,
+                        help="Serve mode: largest micro-batch per forward pass")
+    parser.add_argument('--max-wait-ms', type=float, default=10,
+                        help="Serve mode: longest time a request waits for its batch to fill")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Serve mode: score images in this many worker processes (0: in this process)")
+    parser.add_argument('--worker-threads', type=int,
+                        help="Serve mode: TF/ONNX/TFLite threads per worker (default: CPUs per worker)")
+    parser.add_argument('--pin-workers', action='store_true',
+                        help="Serve mode: pin each worker to its own block of CPUs")
+    parser.add_argument('--tiled', action='store_true',
+                        help="Score overlapping full-resolution tiles for a heatmap and size estimate")
+    parser.add_argument('--warmup', action='store_true',
+                        help="Run dummy batches at load so the first request skips graph tracing")
+    parser.add_argument('--report-startup', action='store_true',
+                        help="Include import/load/warm-up timings in the JSON output")
+    parser.add_argument('--timings', action='store_true',
+                        help="Include per-stage request timings (read, decode, preprocess, inference, ...)")
+    args, unknown = parser.parse_known_args()
     
-    image_path = sys.argv[1]
+    if unknown or args.serve == bool(args.image_path):
+        print(json.dumps({"error": "Usage: python predict_image_kaggle.py <image_path | -> | --serve"}))
+        sys.exit(1)
+    serve_mode = args.serve
     
     try:
         # Initialize detector and load model
-        detector = KagglePotholeDetector()
-        model_path = os.path.join('models', 'kaggle_pothole_detector.h5')
-        
-        if not os.path.exists(model_path):
-            # Try alternative model path
-            alt_model_path = os.path.join('models', 'kaggle_pothole_detector_best.h5')
-            if os.path.exists(alt_model_path):
-                model_path = alt_model_path
-            else:
-                result = {
-                    "error": "Model not found. Please train the model first.",
-                    "model_path": model_path,
-                    "alternative_path": alt_model_path,
-                    "available_files": os.listdir('models') if os.path.exists('models') else []
-                }
-                print(json.dumps(result))
+        cache = None
+        if args.cache_size > 0 or args.cache_db:
+            cache = PredictionCache(max_entries=args.cache_size, disk_path=args.cache_db)
+        near_duplicates = None
+        if args.near_duplicate_index:
+            near_duplicates = NearDuplicateIndex.load(
+                args.near_duplicate_index, max_distance=args.near_duplicate_distance
+            )
+        ledger = PredictionLedger(args.ledger) if args.ledger else None
+        detector = KagglePotholeDetector(backend=args.backend, cache=cache,
+                                         near_duplicates=near_duplicates, ledger=ledger)
+        registry = ModelRegistry(args.registry)
+        use_registry = args.model is None and registry.current() is not None
+        if not use_registry:
+            model_path, error_result = resolve_model_path(model_path=args.model)
+            
+            if model_path is None:
+                print(json.dumps(error_result))
                 sys.exit(1)
         
-        success = detector.load_model(model_path)
+        warmup_batch_sizes = None
+        if args.warmup:
+            # Serve mode warms every power-of-two batch the scheduler can form
+            warmup_batch_sizes = [1]
+            while serve_mode and warmup_batch_sizes[-1] < args.max_batch_size:
+                warmup_batch_sizes.append(min(2 * warmup_batch_sizes[-1], args.max_batch_size))
+        
+        pool = None
+        if serve_mode and args.workers > 0:
+            # The workers load the model and screener; this process never imports TensorFlow
+            pool = InferenceWorkerPool(
+                detector,
+                model_path=None if use_registry else model_path,
+                registry=args.registry if use_registry else None,
+                num_workers=args.workers,
+                threads_per_worker=args.worker_threads,
+                pin_cpus=args.pin_workers,
+                backend=args.backend,
+                screener=args.screener,
+                screening_band=args.screening_band,
+                max_batch_size=args.max_batch_size,
+                warmup_batch_sizes=warmup_batch_sizes
+            )
+            try:
+                pool.start()
+                detector.use_worker_pool(pool)
+                success = True
+            except RuntimeError as e:
+                print(e, file=sys.stderr)
+                success = False
+        else:
+            # Keep stdout clean for the JSON-lines protocol in serve mode
+            with contextlib.redirect_stdout(sys.stderr if serve_mode else sys.stdout):
+                if use_registry:
+                    success = detector.load_from_registry(registry, warmup_batch_sizes=warmup_batch_sizes)
+                else:
+                    success = detector.load_model(model_path, warmup_batch_sizes)
+        if success and args.screener and pool is None:
+            with contextlib.redirect_stdout(sys.stderr if serve_mode else sys.stdout):
+                success = detector.load_screener(args.screener, args.screening_band)
         if not success:
             result = {"error": "Failed to load model"}
             print(json.dumps(result))
             sys.exit(1)
         
-        # Make enhanced prediction
-        prediction = detector.predict_with_confidence(image_path, confidence_threshold=0.7)
-        
-        if prediction is None:
-            result = {"error": "Failed to analyze image"}
+        if serve_mode:
+            watcher = None
+            if use_registry and args.watch_interval > 0 and pool is None:
+                # Worker pools load their version at start; restart them to pick up a new one
+                watcher = RegistryWatcher(detector, registry, args.watch_interval).start()
+            saver = None
+            if near_duplicates is not None:
+                # The route kills the worker on timeout or restart, so save as the index grows
+                saver = IndexSaver(near_duplicates, args.near_duplicate_index,
+                                   every_inserts=args.near_duplicate_save_every,
+                                   interval=args.near_duplicate_save_interval).start()
+            # Turn SIGTERM into SystemExit so the finally block below still
+            # saves the index and flushes the ledger's buffered rows
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+            try:
+                serve(detector, confidence_threshold=0.7,
+                      max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms,
+                      timings=args.timings, scheduler=pool)
+            finally:
+                if watcher is not None:
+                    watcher.stop()
+                if saver is not None:
+                    saver.stop()
+                if ledger is not None:
+                    ledger.close()
+            return
         else:
-            # Enhanced analysis with Kaggle-specific insights
-            result = {
-                "prediction": prediction,
-                "severity": get_enhanced_severity(prediction),
-                "recommendations": get_enhanced_recommendations(prediction),
-                "confidence_level": get_confidence_level(prediction['confidence']),
-                "reliability": "High" if prediction['is_reliable'] else "Low",
-                "action_priority": get_action_priority(prediction),
-                "estimated_size": estimate_pothole_size(prediction)
-            }
+            # Make enhanced prediction
+            timings = StageTimings()
+            with timings.stage('read'):
+                if args.image_path == '-':
+                    image_bytes = sys.stdin.buffer.read()
+                elif args.tiled:
+                    image_bytes = detector.read_image_bytes(args.image_path)
+            
+            if args.tiled:
+                prediction = None
+                if image_bytes is not None:
+                    prediction = detector.predict_tiled(image_bytes, confidence_threshold=0.7,
+                                                        timings=timings, record_id=args.image_path)
+            elif args.image_path == '-':
+                prediction = detector.predict_image_bytes(image_bytes, confidence_threshold=0.7,
+                                                          timings=timings)
+            else:
+                prediction = detector.predict_with_confidence(args.image_path, confidence_threshold=0.7,
+                                                              timings=timings)
+            with timings.stage('analyse'):
+                result = analyse_prediction(prediction)
         
+        if near_duplicates is not None and near_duplicates.unsaved:
+            near_duplicates.save(args.near_duplicate_index)
+        if ledger is not None:
+            ledger.close()
+        
+        if args.report_startup:
+            result['startup'] = detector.startup_timings
+        if args.timings:
+            result['timings'] = timings.as_dict()
         print(json.dumps(result, indent=2))
         
     except Exception as e:
@@ -144,9 +914,9 @@ def get_enhanced_severity(prediction):
     
     # Adjust based on confidence and reliability
     if prediction['is_reliable']:
-        if confidence > 0.95:
+        if confidence > RULE_THRESHOLDS['boost_confidence']:
             return min(5, base_severity + 1)  # Boost high-confidence predictions
-        elif confidence > 0.85:
+        elif confidence > RULE_THRESHOLDS['keep_confidence']:
             return base_severity
         else:
             return max(1, base_severity - 1)  # Reduce lower confidence
@@ -205,25 +975,17 @@ def get_enhanced_recommendations(prediction):
         ])
     
     # Additional technical recommendations
-    if confidence > 0.8:
+    if confidence > RULE_THRESHOLDS['high_confidence_recommendation']:
         recommendations.append("✅ High confidence detection - proceed with recommended actions")
     
     return recommendations
 
 def get_confidence_level(confidence):
     """Enhanced confidence level assessment"""
-    if confidence > 0.95:
-        return "Excellent"
-    elif confidence > 0.85:
-        return "Very High"
-    elif confidence > 0.75:
-        return "High"
-    elif confidence > 0.65:
-        return "Medium"
-    elif confidence > 0.55:
-        return "Low"
-    else:
-        return "Very Low"
+    for bound, level in RULE_THRESHOLDS['confidence_levels']:
+        if confidence > bound:
+            return level
+    return "Very Low"
 
 def get_action_priority(prediction):
     """Determine action priority based on prediction"""
@@ -234,29 +996,29 @@ def get_action_priority(prediction):
         return "Verification Required"
     
     severity = prediction['severity']
-    if severity >= 4:
-        return "Emergency"
-    elif severity >= 3:
-        return "High"
-    elif severity >= 2:
-        return "Medium"
-    else:
-        return "Low"
+    for minimum, priority in RULE_THRESHOLDS['priority_severity']:
+        if severity >= minimum:
+            return priority
+    return "Low"
 
 def estimate_pothole_size(prediction):
     """Estimate pothole size category based on confidence patterns"""
     if not prediction['is_pothole']:
         return "N/A"
     
+    # Tiled inference measures the area covered by positive tiles directly
+    if prediction.get('tiled') and prediction['tiled']['positive_tiles']:
+        return prediction['tiled']['estimated_size']
+    
     confidence = prediction['confidence']
     
-    # Based on Kaggle dataset patterns (this is an approximation)
-    if confidence > 0.9:
-        return "Large"  # High confidence often indicates clear, large potholes
-    elif confidence > 0.75:
-        return "Medium"
-    else:
-        return "Small"  # Lower confidence might indicate smaller or less clear potholes
+    # Based on Kaggle dataset patterns (this is an approximation): high
+    # confidence often indicates clear, large potholes, lower confidence
+    # smaller or less clear ones
+    for bound, size in RULE_THRESHOLDS['size_confidence']:
+        if confidence > bound:
+            return size
+    return "Small"
 
 if __name__ == "__main__":
     main()
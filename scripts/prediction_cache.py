@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+def model_identity(model_path):
+    """Identify a model file by path, size and modification time without hashing its weights"""
+    stat = os.stat(model_path)
+    identity = f"{os.path.abspath(model_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha1(identity.encode('utf-8')).hexdigest()[:16]
+
+class PredictionCache:
+    """
+    Content-addressed cache of prediction dicts.
+
+    Keys combine a SHA-256 of the raw image bytes with the model identity and
+    the confidence threshold, so a re-uploaded photo is answered without
+    running the model while a model or threshold change never returns a stale
+    result. A bounded in-memory LRU sits in front of an optional SQLite tier
+    that survives restarts.
+    """
+
+    def __init__(self, max_entries=10000, disk_path=None):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.inflight = {}
+
+        self.db = None
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self.db = sqlite3.connect(disk_path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions "
+                "(key TEXT PRIMARY KEY, prediction TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self.db.commit()
+
+    @staticmethod
+    def make_key(image_bytes, model_id, confidence_threshold, digest=None):
+        """Cache key; pass digest when the image's SHA-256 hex digest is already known"""
+        digest = digest or hashlib.sha256(image_bytes).hexdigest()
+        return f"{digest}:{model_id}:{float(confidence_threshold):.6f}"
+
+    def get(self, key):
+        """Return a cached prediction dict, or None on a miss"""
+        with self.lock:
+            prediction = self._lookup(key)
+            if prediction is None:
+                self.misses += 1
+            return prediction
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached prediction for key, computing and storing it on a miss.
+
+        Concurrent requests for the same key while it is being computed wait
+        for that result instead of running the model again.
+        """
+        with self.lock:
+            prediction = self._lookup(key)
+            if prediction is not None:
+                return prediction
+            pending = self.inflight.get(key)
+            owner = pending is None
+            if owner:
+                self.misses += 1
+                pending = self.inflight[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            prediction = pending.result()
+            return dict(prediction) if prediction is not None else None
+
+        try:
+            prediction = compute()
+            if prediction is not None:
+                self.put(key, prediction)
+            pending.set_result(prediction)
+            return prediction
+        except Exception as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+
+    def _lookup(self, key):
+        """Memory then disk lookup; the caller holds the lock"""
+        prediction = self.entries.get(key)
+        if prediction is not None:
+            self.entries.move_to_end(key)
+            self.memory_hits += 1
+            return dict(prediction)
+
+        if self.db is not None:
+            row = self.db.execute(
+                "SELECT prediction FROM predictions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                prediction = json.loads(row[0])
+                self._remember(key, prediction)
+                self.disk_hits += 1
+                return dict(prediction)
+
+        return None
+
+    def put(self, key, prediction):
+        with self.lock:
+            self._remember(key, dict(prediction))
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO predictions (key, prediction, created_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(prediction), time.time())
+                )
+                self.db.commit()
+
+    def _remember(self, key, prediction):
+        if self.max_entries <= 0:
+            return
+        self.entries[key] = prediction
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses + self.coalesced
+            return {
+                'memory_entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'hit_rate': (self.memory_hits + self.disk_hits + self.coalesced) / lookups if lookups else 0.0,
+                'disk_tier': self.db is not None
+            }
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
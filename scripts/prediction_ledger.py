@@ -0,0 +1,362 @@
+import os
+import sys
+import csv
+import json
+import time
+import sqlite3
+import argparse
+import threading
+
+import numpy as np
+
+LEDGER_COLUMNS = (
+    'image_sha256', 'record_id', 'model_version', 'model_id', 'prob_no_pothole', 'prob_pothole',
+    'confidence_threshold', 'stage', 'tiled_estimated_size', 'severity', 'action_priority', 'created_at'
+)
+
+class PredictionLedger:
+    """
+    Append-only SQLite (WAL) record of every prediction's raw model output.
+
+    Rows keep the image SHA-256, model version and class probabilities, so
+    the rules in predict_image_kaggle.py can be re-applied to the whole
+    archive with rescore() instead of re-running the model. Writes are
+    buffered and committed in batches, from the caller's thread when the
+    buffer fills and from a background thread every flush_interval seconds.
+    """
+
+    def __init__(self, path='data/prediction_ledger.db', batch_size=256, flush_interval=1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.written = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            "id INTEGER PRIMARY KEY, image_sha256 TEXT NOT NULL, record_id TEXT, "
+            "model_version TEXT, model_id TEXT, prob_no_pothole REAL NOT NULL, prob_pothole REAL NOT NULL, "
+            "confidence_threshold REAL NOT NULL, stage TEXT, tiled_estimated_size TEXT, "
+            "severity INTEGER, action_priority TEXT, created_at REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS predictions_image ON predictions (image_sha256)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS predictions_model_version ON predictions (model_version)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS predictions_created_at ON predictions (created_at)")
+        self.db.commit()
+
+        self.stop_event = threading.Event()
+        self.flusher = None
+        if flush_interval:
+            self.flusher = threading.Thread(target=self._flush_periodically, args=(flush_interval,),
+                                            name="ledger-flush", daemon=True)
+            self.flusher.start()
+
+    def record(self, image_sha256, prediction, model_id=None, record_id=None, action_priority=None):
+        """Queue one prediction dict (as built by KagglePotholeDetector) for writing"""
+        tiled = prediction.get('tiled')
+        row = (
+            image_sha256,
+            None if record_id is None else str(record_id),
+            prediction.get('model_version'),
+            model_id,
+            float(prediction['raw_prediction'][0]),
+            float(prediction['raw_prediction'][1]),
+            float(prediction['confidence_threshold']),
+            prediction.get('stage'),
+            tiled['estimated_size'] if tiled and tiled['positive_tiles'] else None,
+            prediction.get('severity'),
+            action_priority,
+            time.time()
+        )
+        with self.lock:
+            self.buffer.append(row)
+            full = len(self.buffer) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write buffered rows in a single transaction"""
+        with self.lock:
+            rows, self.buffer = self.buffer, []
+        if not rows:
+            return
+        with self.write_lock:
+            self.db.executemany(
+                f"INSERT INTO predictions ({', '.join(LEDGER_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(LEDGER_COLUMNS))})",
+                rows
+            )
+            self.db.commit()
+            self.written += len(rows)
+
+    def _flush_periodically(self, interval):
+        while not self.stop_event.wait(interval):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Prediction ledger flush failed: {e}", file=sys.stderr)
+
+    def load_arrays(self, model_version=None, since=None, identifiers=False):
+        """
+        Read the columns the rules need as NumPy arrays.
+
+        Returns a dict with 'probabilities' (N x 2), 'confidence_threshold',
+        'tiled_estimated_size' and the stored 'severity'/'action_priority'.
+        Numbers are read in one pass, tiled sizes only for the rows that
+        have one, and the 'id', 'image_sha256' and 'model_version' columns
+        only when identifiers is set, since building Python strings is most
+        of the cost on millions of rows.
+        """
+        self.flush()
+        conditions, parameters = [], []
+        if model_version is not None:
+            conditions.append("model_version = ?")
+            parameters.append(model_version)
+        if since is not None:
+            conditions.append("created_at >= ?")
+            parameters.append(since)
+
+        def select(columns, extra_condition=None):
+            clauses = conditions + ([extra_condition] if extra_condition else [])
+            query = f"SELECT {columns} FROM predictions"
+            if clauses:
+                query += " WHERE " + " AND ".join(clauses)
+            return self.db.execute(query + " ORDER BY id", parameters).fetchall()
+
+        with self.write_lock:
+            numbers = np.array(
+                select("id, prob_no_pothole, prob_pothole, confidence_threshold, COALESCE(severity, -1)"),
+                dtype=np.float64
+            ).reshape(-1, 5)
+            action_priority = np.array([row[0] for row in select("action_priority")], dtype=object)
+            tiled_rows = select("id, tiled_estimated_size", "tiled_estimated_size IS NOT NULL")
+            text = select("image_sha256, model_version") if identifiers else None
+
+        ids = numbers[:, 0].astype(np.int64)
+        tiled_estimated_size = np.full(len(ids), None, dtype=object)
+        if tiled_rows:
+            tiled_ids, sizes = zip(*tiled_rows)
+            tiled_estimated_size[np.searchsorted(ids, tiled_ids)] = sizes
+
+        arrays = {
+            'id': ids,
+            'probabilities': numbers[:, 1:3],
+            'confidence_threshold': numbers[:, 3],
+            'tiled_estimated_size': tiled_estimated_size,
+            'severity': numbers[:, 4].astype(np.int64),
+            'action_priority': action_priority
+        }
+        if identifiers:
+            arrays['image_sha256'] = np.array([row[0] for row in text], dtype=object)
+            arrays['model_version'] = np.array([row[1] for row in text], dtype=object)
+        return arrays
+
+    def close(self):
+        self.stop_event.set()
+        if self.flusher is not None:
+            self.flusher.join()
+        self.flush()
+        self.db.close()
+
+def recommendation_table():
+    """
+    Every distinct recommendation list, from the scalar rule itself.
+
+    The recommendations depend only on is_pothole, is_reliable, the base
+    severity and whether confidence clears the high-confidence bound, so
+    there are 1 + 2 * 5 * 2 cases; index 0 is "no pothole".
+    """
+    # Imported here because the predictor imports this module
+    from predict_image_kaggle import get_enhanced_recommendations
+
+    table = [get_enhanced_recommendations({'is_pothole': False})]
+    for severity in range(1, 6):
+        for is_reliable in (False, True):
+            for high_confidence in (False, True):
+                table.append(get_enhanced_recommendations({
+                    'is_pothole': True,
+                    'is_reliable': is_reliable,
+                    'severity': severity,
+                    'confidence': 1.0 if high_confidence else 0.0
+                }))
+    return table
+
+def rescore(probabilities, confidence_threshold, tiled_estimated_size=None, rules=None):
+    """
+    Vectorised equivalent of build_prediction plus analyse_prediction's rules.
+
+    probabilities is an N x 2 array of model outputs; rules overrides
+    entries of RULE_THRESHOLDS to try new thresholds. Returns arrays for
+    is_pothole, confidence, is_reliable, base severity, enhanced severity,
+    confidence level, action priority, estimated size and an index into
+    recommendation_table().
+    """
+    from predict_image_kaggle import RULE_THRESHOLDS
+
+    rules = dict(RULE_THRESHOLDS, **(rules or {}))
+    # float64 like the scalar rules, so values on a bound compare the same way
+    probabilities = np.asarray(probabilities, dtype=np.float64)
+    confidence_threshold = np.asarray(confidence_threshold, dtype=np.float64)
+
+    predicted = np.argmax(probabilities, axis=1)
+    confidence = probabilities[np.arange(len(probabilities)), predicted]
+    is_pothole = predicted == 1
+    is_reliable = confidence >= confidence_threshold
+
+    base_severity = np.ones(len(confidence), dtype=np.int64)
+    for bound in rules['severity_bounds']:
+        base_severity += confidence > bound
+    base_severity = np.where(is_pothole, base_severity, 0)
+
+    severity = np.select(
+        [~is_pothole,
+         is_reliable & (confidence > rules['boost_confidence']),
+         is_reliable & (confidence > rules['keep_confidence'])],
+        [0, np.minimum(5, base_severity + 1), base_severity],
+        default=np.maximum(1, base_severity - 1)
+    )
+
+    confidence_level = np.select(
+        [confidence > bound for bound, _ in rules['confidence_levels']],
+        [level for _, level in rules['confidence_levels']],
+        default="Very Low"
+    ).astype(object)
+
+    action_priority = np.select(
+        [~is_pothole, ~is_reliable] + [base_severity >= minimum for minimum, _ in rules['priority_severity']],
+        ["None", "Verification Required"] + [priority for _, priority in rules['priority_severity']],
+        default="Low"
+    ).astype(object)
+
+    estimated_size = np.select(
+        [~is_pothole] + [confidence > bound for bound, _ in rules['size_confidence']],
+        ["N/A"] + [size for _, size in rules['size_confidence']],
+        default="Small"
+    ).astype(object)
+    if tiled_estimated_size is not None:
+        # Tiled predictions keep their area-based size
+        tiled = np.array([size is not None for size in tiled_estimated_size], dtype=bool) & is_pothole
+        estimated_size[tiled] = np.asarray(tiled_estimated_size, dtype=object)[tiled]
+
+    high_confidence = confidence > rules['high_confidence_recommendation']
+    recommendation = np.where(
+        is_pothole,
+        1 + ((np.clip(base_severity, 1, 5) - 1) * 2 + is_reliable) * 2 + high_confidence,
+        0
+    )
+
+    return {
+        'is_pothole': is_pothole,
+        'confidence': confidence,
+        'is_reliable': is_reliable,
+        'base_severity': base_severity,
+        'severity': severity,
+        'confidence_level': confidence_level,
+        'action_priority': action_priority,
+        'estimated_size': estimated_size,
+        'recommendation': recommendation
+    }
+
+def value_counts(values):
+    keys, counts = np.unique(values.astype(str), return_counts=True)
+    return {str(key): int(count) for key, count in zip(keys, counts)}
+
+def write_rescored(path, arrays, scores, table):
+    """Write re-scored rows as CSV or Parquet"""
+    columns = {
+        'id': arrays['id'],
+        'image_sha256': arrays['image_sha256'],
+        'model_version': arrays['model_version'],
+        'confidence': scores['confidence'],
+        'severity': scores['severity'],
+        'confidence_level': scores['confidence_level'],
+        'action_priority': scores['action_priority'],
+        'estimated_size': scores['estimated_size'],
+        'recommendations': np.array([" | ".join(recommendations) for recommendations in table],
+                                    dtype=object)[scores['recommendation']]
+    }
+
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet output needs pyarrow: pip install pyarrow")
+        pq.write_table(pa.table({name: values.tolist() if values.dtype == object else values
+                                 for name, values in columns.items()}), path)
+        return
+
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(zip(*[values.tolist() for values in columns.values()]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-apply the severity rules to stored predictions")
+    parser.add_argument('--ledger', default='data/prediction_ledger.db')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rescore_parser = subparsers.add_parser('rescore', help="Recompute severity, priority and recommendations")
+    rescore_parser.add_argument('--model-version', help="Only rows from this model version")
+    rescore_parser.add_argument('--since', type=float, help="Only rows created at or after this Unix time")
+    rescore_parser.add_argument('--rules', help="JSON file overriding RULE_THRESHOLDS entries")
+    rescore_parser.add_argument('--confidence-threshold', type=float,
+                                help="Reliability threshold to apply instead of the stored one")
+    rescore_parser.add_argument('--output', help="Write re-scored rows to a .csv or .parquet file")
+
+    subparsers.add_parser('stats', help="Row counts per model version")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.ledger):
+        print(json.dumps({"error": "Ledger not found", "ledger": args.ledger}))
+        sys.exit(1)
+    ledger = PredictionLedger(args.ledger, flush_interval=0)
+
+    if args.command == 'stats':
+        rows = ledger.db.execute(
+            "SELECT model_version, COUNT(*), MIN(created_at), MAX(created_at) FROM predictions GROUP BY model_version"
+        ).fetchall()
+        print(json.dumps([{'model_version': version, 'rows': count, 'first': first, 'last': last}
+                          for version, count, first, last in rows], indent=2))
+        ledger.close()
+        return
+
+    rules = None
+    if args.rules:
+        with open(args.rules, 'r') as f:
+            rules = json.load(f)
+
+    started = time.perf_counter()
+    arrays = ledger.load_arrays(args.model_version, args.since, identifiers=bool(args.output))
+    loaded = time.perf_counter()
+    threshold = arrays['confidence_threshold'] if args.confidence_threshold is None else args.confidence_threshold
+    scores = rescore(arrays['probabilities'], threshold, arrays['tiled_estimated_size'], rules)
+    scored = time.perf_counter()
+
+    recorded = arrays['severity'] >= 0
+    summary = {
+        'rows': len(arrays['id']),
+        'load_s': loaded - started,
+        'rescore_s': scored - loaded,
+        'severity_counts': value_counts(scores['severity']),
+        'action_priority_counts': value_counts(scores['action_priority']),
+        'estimated_size_counts': value_counts(scores['estimated_size']),
+        # Compared with what was reported when each prediction was made
+        'base_severity_changed': int(np.sum(recorded & (scores['base_severity'] != arrays['severity']))),
+        'action_priority_changed': int(np.sum((arrays['action_priority'] != None) &  # noqa: E711
+                                              (arrays['action_priority'] != scores['action_priority'])))
+    }
+
+    if args.output:
+        write_rescored(args.output, arrays, scores, recommendation_table())
+        summary['output'] = args.output
+    ledger.close()
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
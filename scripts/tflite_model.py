@@ -0,0 +1,51 @@
+import numpy as np
+import tensorflow as tf
+
+class TFLiteModel:
+    """
+    Run a TFLite model behind the same predict() interface as a Keras model.
+
+    Quantized inputs and outputs are converted using the tensor's scale and
+    zero point, so callers keep passing float32 images normalised to [0, 1]
+    and receive float32 class probabilities.
+    """
+
+    def __init__(self, model_path, num_threads=None):
+        self.model_path = model_path
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads)
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+        self.batch_size = None
+
+    def _resize(self, batch_size):
+        """Resize the input tensor when the batch size changes"""
+        if batch_size == self.batch_size:
+            return
+        shape = list(self.input_details['shape'])
+        shape[0] = batch_size
+        self.interpreter.resize_tensor_input(self.input_details['index'], shape)
+        self.interpreter.allocate_tensors()
+        self.batch_size = batch_size
+
+    def _quantize(self, images):
+        dtype = self.input_details['dtype']
+        if dtype == np.float32:
+            return images.astype(np.float32)
+        scale, zero_point = self.input_details['quantization']
+        info = np.iinfo(dtype)
+        quantized = np.round(images / scale + zero_point)
+        return np.clip(quantized, info.min, info.max).astype(dtype)
+
+    def _dequantize(self, outputs):
+        if self.output_details['dtype'] == np.float32:
+            return outputs
+        scale, zero_point = self.output_details['quantization']
+        return (outputs.astype(np.float32) - zero_point) * scale
+
+    def predict(self, images, verbose=0):
+        """Predict class probabilities for a batch of preprocessed images"""
+        images = np.asarray(images, dtype=np.float32)
+        self._resize(len(images))
+        self.interpreter.set_tensor(self.input_details['index'], self._quantize(images))
+        self.interpreter.invoke()
+        return self._dequantize(self.interpreter.get_tensor(self.output_details['index']))
@@ -8,13 +8,18 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, confusion_matrix
 import matplotlib.pyplot as plt
 import json
+import time
 from pathlib import Path
+from model_registry import ModelRegistry
+from classification_shards import ClassificationShards
+from prediction_ledger import rescore
 
 class KagglePotholeDetector:
     def __init__(self, img_height=224, img_width=224):
         self.img_height = img_height
         self.img_width = img_width
         self.model = None
+        self.screening_model = None
         self.class_names = ['no_pothole', 'pothole']
         
     def load_classification_data(self, dataset_path):
@@ -50,6 +55,30 @@ class KagglePotholeDetector:
         
         return np.array(images), np.array(labels)
     
+    def load_classification_shards(self, shard_path):
+        """
+        Open the packed classification dataset written by kaggle_dataset_loader.py
+
+        Returns a memory-mapped ClassificationShards and its labels, or
+        (None, None) if the shards do not match this model's input size or
+        classes. split_dataset() gathers the splits from it as float32.
+        """
+        shards = ClassificationShards(shard_path)
+        if shards.image_shape != (self.img_height, self.img_width, 3) or shards.class_names != self.class_names:
+            print(f"Shards in {shard_path} are {shards.image_shape} {shards.class_names}, "
+                  f"expected {(self.img_height, self.img_width, 3)} {self.class_names}")
+            return None, None
+        return shards, shards.labels
+    
+    def load_training_data(self, dataset_path, shard_path=None):
+        """Load from shards when they are available, otherwise decode the classification images"""
+        if shard_path and ClassificationShards.exists(shard_path):
+            X, y = self.load_classification_shards(shard_path)
+            if X is not None:
+                print(f"Using packed shards from {shard_path}")
+                return X, y
+        return self.load_classification_data(dataset_path)
+    
     def create_data_generators(self, X_train, y_train, X_val, y_val, batch_size=32):
         """Create data generators with augmentation"""
         # Data augmentation for training
@@ -354,6 +383,245 @@ class KagglePotholeDetector:
         
         print(f"Model saved to {model_path}")
         print(f"Metadata saved to {metadata_path}")
+        
+        # Publish a SavedModel version; serving workers pick it up without a restart
+        ModelRegistry(os.path.join(os.path.dirname(model_path), 'registry')).publish(self.model, metadata)
+
+    def create_screening_model(self, input_size=96):
+        """Create a tiny CNN used as the cheap first stage of the cascade"""
+        model = keras.Sequential([
+            layers.Input(shape=(self.img_height, self.img_width, 3)),
+            layers.Resizing(input_size, input_size),
+            layers.Conv2D(16, 3, strides=2, padding='same', activation='relu'),
+            layers.BatchNormalization(),
+            layers.SeparableConv2D(32, 3, strides=2, padding='same', activation='relu'),
+            layers.BatchNormalization(),
+            layers.SeparableConv2D(64, 3, strides=2, padding='same', activation='relu'),
+            layers.GlobalAveragePooling2D(),
+            layers.Dropout(0.2),
+            layers.Dense(len(self.class_names), activation='softmax')
+        ])
+        
+        model.compile(
+            optimizer=keras.optimizers.Adam(learning_rate=0.001),
+            loss='sparse_categorical_crossentropy',
+            metrics=['accuracy']
+        )
+        
+        self.screening_model = model
+        return model
+    
+    def train_screening(self, X_train, y_train, X_val, y_val, epochs=30, batch_size=32,
+                        model_path='models/kaggle_pothole_screener.h5'):
+        """Train the screening model with the same augmentation as the main model"""
+        if self.screening_model is None:
+            self.create_screening_model()
+        
+        train_gen, val_gen = self.create_data_generators(
+            X_train, y_train, X_val, y_val, batch_size
+        )
+        
+        os.makedirs(os.path.dirname(model_path), exist_ok=True)
+        callbacks = [
+            keras.callbacks.EarlyStopping(
+                patience=8,
+                restore_best_weights=True,
+                monitor='val_accuracy'
+            ),
+            keras.callbacks.ReduceLROnPlateau(
+                factor=0.3,
+                patience=4,
+                monitor='val_loss',
+                min_lr=1e-6
+            )
+        ]
+        
+        print("Training screening model...")
+        history = self.screening_model.fit(
+            train_gen,
+            steps_per_epoch=max(1, len(X_train) // batch_size),
+            epochs=epochs,
+            validation_data=val_gen,
+            validation_steps=max(1, len(X_val) // batch_size),
+            callbacks=callbacks,
+            verbose=1
+        )
+        
+        self.screening_model.save(model_path)
+        print(f"Screening model saved to {model_path}")
+        return history.history
+    
+    def evaluate_cascade(self, X_test, y_test, screening_band=(0.1, 0.9), batch_size=32):
+        """
+        Compare the screening -> full model cascade against the full model alone.
+        
+        Images whose screening pothole probability falls inside screening_band
+        are escalated to the full model; the report gives accuracy for both
+        setups, the escalation rate and the measured speedup.
+        """
+        if self.model is None or self.screening_model is None:
+            print("Both the full and the screening model are needed!")
+            return None
+        
+        low, high = screening_band
+        
+        # Warm both models so tracing does not skew the timings
+        self.model.predict(X_test[:1], verbose=0)
+        self.screening_model.predict(X_test[:1], verbose=0)
+        
+        started = time.perf_counter()
+        full_proba = np.concatenate([
+            self.model.predict(X_test[i:i+batch_size], verbose=0)
+            for i in range(0, len(X_test), batch_size)
+        ])
+        full_seconds = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        cascade_proba = np.concatenate([
+            self.screening_model.predict(X_test[i:i+batch_size], verbose=0)
+            for i in range(0, len(X_test), batch_size)
+        ])
+        screening_proba = cascade_proba.copy()
+        uncertain = (cascade_proba[:, 1] > low) & (cascade_proba[:, 1] < high)
+        escalated = np.flatnonzero(uncertain)
+        for i in range(0, len(escalated), batch_size):
+            indices = escalated[i:i+batch_size]
+            cascade_proba[indices] = self.model.predict(X_test[indices], verbose=0)
+        cascade_seconds = time.perf_counter() - started
+        
+        full_pred = np.argmax(full_proba, axis=1)
+        cascade_pred = np.argmax(cascade_proba, axis=1)
+        screened = ~uncertain
+        
+        report = {
+            'num_test_images': int(len(X_test)),
+            'screening_band': [float(low), float(high)],
+            'escalation_rate': float(np.mean(uncertain)),
+            'full_accuracy': float(np.mean(full_pred == y_test)),
+            'cascade_accuracy': float(np.mean(cascade_pred == y_test)),
+            'screening_only_accuracy': float(np.mean(np.argmax(screening_proba, axis=1) == y_test)),
+            'screened_stage_accuracy': float(np.mean(cascade_pred[screened] == y_test[screened]))
+                                       if np.any(screened) else None,
+            'agreement_with_full': float(np.mean(cascade_pred == full_pred)),
+            'full_seconds': full_seconds,
+            'cascade_seconds': cascade_seconds,
+            'speedup': full_seconds / cascade_seconds if cascade_seconds > 0 else None
+        }
+        report['accuracy_delta'] = report['cascade_accuracy'] - report['full_accuracy']
+        
+        print("Cascade Report:")
+        print(f"Escalated to full model: {report['escalation_rate']:.1%}")
+        print(f"Full accuracy: {report['full_accuracy']:.4f}")
+        print(f"Cascade accuracy: {report['cascade_accuracy']:.4f}")
+        print(f"Speedup: {report['speedup']:.2f}x")
+        
+        return report
+    
+    def export_tflite_int8(self, representative_images,
+                           output_path='models/kaggle_pothole_detector_int8.tflite',
+                           num_calibration_samples=200, seed=42):
+        """Export a full-integer INT8 TFLite model calibrated on representative images"""
+        if self.model is None:
+            print("No model to export!")
+            return None
+        
+        rng = np.random.default_rng(seed)
+        sample_size = min(num_calibration_samples, len(representative_images))
+        calibration = representative_images[rng.choice(len(representative_images), sample_size, replace=False)]
+        
+        def representative_dataset():
+            for img in calibration:
+                yield [np.expand_dims(img, axis=0).astype('float32')]
+        
+        converter = tf.lite.TFLiteConverter.from_keras_model(self.model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+        tflite_model = converter.convert()
+        
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, 'wb') as f:
+            f.write(tflite_model)
+        
+        print(f"INT8 model saved to {output_path} ({len(tflite_model) / 1e6:.1f} MB, "
+              f"calibrated on {sample_size} images)")
+        return output_path
+    
+    def quantization_parity_report(self, quantized_model, X_test, y_test, batch_size=32):
+        """Compare the quantized model against the float model on the held-out split"""
+        if self.model is None:
+            print("Model not trained yet!")
+            return None
+        
+        float_proba = []
+        quant_proba = []
+        for i in range(0, len(X_test), batch_size):
+            batch = X_test[i:i+batch_size]
+            float_proba.extend(self.model.predict(batch, verbose=0))
+            quant_proba.extend(quantized_model.predict(batch, verbose=0))
+        
+        float_proba = np.array(float_proba)
+        quant_proba = np.array(quant_proba)
+        float_pred = np.argmax(float_proba, axis=1)
+        quant_pred = np.argmax(quant_proba, axis=1)
+        float_severity = severity_buckets(float_proba)
+        quant_severity = severity_buckets(quant_proba)
+        
+        per_class_drift = {}
+        for class_idx, class_name in enumerate(self.class_names):
+            class_mask = y_test == class_idx
+            if np.any(class_mask):
+                drift = quant_proba[class_mask, class_idx] - float_proba[class_mask, class_idx]
+                per_class_drift[class_name] = {
+                    'mean_drift': float(np.mean(drift)),
+                    'mean_abs_drift': float(np.mean(np.abs(drift))),
+                    'max_abs_drift': float(np.max(np.abs(drift)))
+                }
+        
+        severity_confusion = np.zeros((6, 6), dtype=int)
+        np.add.at(severity_confusion, (float_severity, quant_severity), 1)
+        
+        report = {
+            'num_test_images': int(len(X_test)),
+            'float_accuracy': float(np.mean(float_pred == y_test)),
+            'quantized_accuracy': float(np.mean(quant_pred == y_test)),
+            'prediction_agreement': float(np.mean(float_pred == quant_pred)),
+            'per_class_confidence_drift': per_class_drift,
+            'severity_agreement': float(np.mean(float_severity == quant_severity)),
+            'severity_within_one': float(np.mean(np.abs(float_severity - quant_severity) <= 1)),
+            'severity_confusion_matrix': severity_confusion.tolist()
+        }
+        report['accuracy_delta'] = report['quantized_accuracy'] - report['float_accuracy']
+        
+        print("Quantization Parity Report:")
+        print(f"Float accuracy: {report['float_accuracy']:.4f}")
+        print(f"INT8 accuracy: {report['quantized_accuracy']:.4f}")
+        print(f"Prediction agreement: {report['prediction_agreement']:.4f}")
+        print(f"Severity agreement: {report['severity_agreement']:.4f}")
+        
+        return report
+
+def severity_buckets(probabilities):
+    """Base severity (0 for no pothole, else 1-5) under the live RULE_THRESHOLDS"""
+    return rescore(probabilities, confidence_threshold=0.0)['base_severity']
+
+def split_dataset(X, y):
+    """
+    Stratified 70/15/15 train/validation/test split used by training and export
+
+    The split is drawn over sample indices, so ClassificationShards gives
+    the same split as the decoded arrays and only gathers each part once.
+    """
+    train_idx, temp_idx, y_train, y_temp = train_test_split(
+        np.arange(len(y)), y, test_size=0.3, random_state=42, stratify=y
+    )
+    val_idx, test_idx, y_val, y_test = train_test_split(
+        temp_idx, y_temp, test_size=0.5, random_state=42, stratify=y_temp
+    )
+    take = X.take if isinstance(X, ClassificationShards) else X.__getitem__
+    return take(train_idx), take(val_idx), take(test_idx), y_train, y_val, y_test
 
 def main():
     # Set memory growth for GPU if available
@@ -370,14 +638,15 @@ def main():
     
     # Load processed classification dataset
     dataset_path = "data/kaggle_pothole_dataset/processed/classification"
+    shard_path = "data/kaggle_pothole_dataset/processed/shards"
     
-    if not os.path.exists(dataset_path):
+    if not os.path.exists(dataset_path) and not ClassificationShards.exists(shard_path):
         print("Processed dataset not found!")
         print("Please run 'python scripts/kaggle_dataset_loader.py' first")
         return
     
     print("Loading processed Kaggle dataset...")
-    X, y = detector.load_classification_data(dataset_path)
+    X, y = detector.load_training_data(dataset_path, shard_path)
     
     if len(X) == 0:
         print("No data loaded! Please check the processed dataset.")
@@ -387,12 +656,7 @@ def main():
     print(f"Class distribution: {np.bincount(y)}")
     
     # Split data with stratification
-    X_train, X_temp, y_train, y_temp = train_test_split(
-        X, y, test_size=0.3, random_state=42, stratify=y
-    )
-    X_val, X_test, y_val, y_test = train_test_split(
-        X_temp, y_temp, test_size=0.5, random_state=42, stratify=y_temp
-    )
+    X_train, X_val, X_test, y_train, y_val, y_test = split_dataset(X, y)
     
     print(f"Training set: {len(X_train)} images")
     print(f"Validation set: {len(X_val)} images")
@@ -0,0 +1,54 @@
+import os
+import json
+import argparse
+
+from train_pothole_model_kaggle import KagglePotholeDetector, split_dataset
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the cascade screening model and report its speedup")
+    parser.add_argument('--model', default='models/kaggle_pothole_detector.h5',
+                        help="Trained full model used as the second stage")
+    parser.add_argument('--dataset', default='data/kaggle_pothole_dataset/processed/classification')
+    parser.add_argument('--shards', default='data/kaggle_pothole_dataset/processed/shards',
+                        help="Packed dataset used instead of --dataset when present")
+    parser.add_argument('--output', default='models/kaggle_pothole_screener.h5')
+    parser.add_argument('--screening-band', type=float, nargs=2, default=(0.1, 0.9),
+                        metavar=('LOW', 'HIGH'),
+                        help="Screening pothole probabilities inside this band go to the full model")
+    parser.add_argument('--epochs', type=int, default=30)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.dataset) and not os.path.exists(args.shards):
+        print("Processed dataset not found!")
+        print("Please run 'python scripts/kaggle_dataset_loader.py' first")
+        return
+
+    detector = KagglePotholeDetector()
+    if not detector.load_model(args.model):
+        return
+
+    print("Loading processed Kaggle dataset...")
+    X, y = detector.load_training_data(args.dataset, args.shards)
+    if len(X) == 0:
+        print("No data loaded! Please check the processed dataset.")
+        return
+
+    # Same split as the full model, so the report uses its held-out test images
+    X_train, X_val, X_test, y_train, y_val, y_test = split_dataset(X, y)
+
+    detector.create_screening_model()
+    detector.screening_model.summary()
+    detector.train_screening(X_train, y_train, X_val, y_val, epochs=args.epochs, model_path=args.output)
+
+    report = detector.evaluate_cascade(X_test, y_test, screening_band=tuple(args.screening_band))
+    report['full_model'] = args.model
+    report['screening_model'] = args.output
+
+    report_path = args.output.replace('.h5', '_cascade_report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"Cascade report saved to {report_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+import os
+import sys
+import time
+import threading
+import contextlib
+import multiprocessing
+from concurrent.futures import Future, InvalidStateError
+
+import numpy as np
+
+def cpu_sets(num_workers, cpus_per_worker=None):
+    """Split the CPUs this process may use into one contiguous block per worker"""
+    if hasattr(os, 'sched_getaffinity'):
+        available = sorted(os.sched_getaffinity(0))
+    else:
+        available = list(range(os.cpu_count() or 1))
+    cpus_per_worker = cpus_per_worker or max(1, len(available) // num_workers)
+    return [
+        [available[(i * cpus_per_worker + j) % len(available)] for j in range(cpus_per_worker)]
+        for i in range(num_workers)
+    ]
+
+def worker_main(conn, options):
+    """
+    Body of one worker process: pin, size the thread pools, load the model,
+    then score batches of images sent by the pool until it receives None.
+
+    Everything queued on the pipe when a batch starts is scored together,
+    so a busy worker batches naturally without waiting for more work.
+    """
+    if options['cpus'] and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, options['cpus'])
+    threads = options['threads']
+    if threads:
+        # Read by TensorFlow and OpenMP when they initialise their pools;
+        # ONNX Runtime and TFLite are sized through num_threads instead
+        os.environ['TF_NUM_INTRAOP_THREADS'] = str(threads)
+        os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+        os.environ['OMP_NUM_THREADS'] = str(threads)
+
+    from predict_image_kaggle import KagglePotholeDetector
+    from model_registry import ModelRegistry
+
+    detector = KagglePotholeDetector(backend=options['backend'], num_threads=threads)
+    with contextlib.redirect_stdout(sys.stderr):
+        if options['registry']:
+            success = detector.load_from_registry(ModelRegistry(options['registry']),
+                                                  warmup_batch_sizes=options['warmup_batch_sizes'])
+        else:
+            success = detector.load_model(options['model_path'], options['warmup_batch_sizes'])
+        if success and options['screener']:
+            success = detector.load_screener(options['screener'], options['screening_band'])
+    if not success:
+        conn.send(('failed', "Failed to load model"))
+        return
+
+    conn.send(('ready', {
+        'pid': os.getpid(),
+        'cpus': options['cpus'],
+        'threads': threads,
+        'model_id': detector.model_id,
+        'screener_id': detector.screener_id,
+        'model_version': detector.model_version,
+        'img_height': detector.img_height,
+        'img_width': detector.img_width,
+        'class_names': detector.class_names,
+        'startup': detector.startup_timings
+    }))
+
+    max_batch_size = options['max_batch_size']
+    running = True
+    while running:
+        message = conn.recv()
+        if message is None:
+            break
+        batch = [message]
+        while len(batch) < max_batch_size and conn.poll():
+            message = conn.recv()
+            if message is None:
+                running = False
+                break
+            batch.append(message)
+
+        task_ids = [task_id for task_id, _ in batch]
+        try:
+            started = time.perf_counter()
+            probabilities, stages, model_version = detector.predict_probabilities([image for _, image in batch])
+            conn.send(('result', task_ids, np.asarray(probabilities, dtype=np.float32),
+                       None if stages is None else [str(stage) for stage in stages],
+                       model_version, time.perf_counter() - started))
+        except Exception as e:
+            conn.send(('error', task_ids, str(e)))
+
+class WorkerPoolBackend:
+    """Backend interface over a pool, so the detector's unscheduled paths also use the workers"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def predict(self, images, verbose=0):
+        futures = [self.pool.submit(image) for image in images]
+        return np.array([future.result()['raw_prediction'] for future in futures], dtype=np.float32)
+
+class InferenceWorker:
+    """Parent-side handle of one worker process"""
+
+    def __init__(self, index, process, conn):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        self.info = None
+        self.alive = True
+        self.restarts = 0
+        self.outstanding = 0
+        self.requests = 0
+        self.batches = 0
+        self.scored = 0
+        self.predict_time = 0.0
+        self.receiver = None
+
+class InferenceWorkerPool:
+    """
+    Several single-model inference processes behind the scheduler interface.
+
+    Each worker is pinned to its own block of CPUs with matching TF/ONNX
+    thread counts, so N workers use N blocks of cores instead of one
+    process's oversubscribed thread pools. Workers are forked before the
+    parent imports TensorFlow (TensorFlow does not survive a fork once it is
+    initialised), and each loads the model itself. A .tflite model is
+    memory-mapped by the interpreter, so its read-only weights are shared
+    through the page cache rather than copied per worker; Keras and
+    SavedModel workers each hold their own copy.
+
+    Decoding, caching and near-duplicate lookups stay in the parent; every
+    image goes to the worker with the fewest outstanding images. Like
+    MicroBatchScheduler, submit() returns a Future of the prediction dict;
+    WorkerPoolBackend wraps the pool as the detector's model.
+
+    A worker that dies fails the images it still held and is replaced in
+    the background, up to max_restarts times; until then the others take
+    its share.
+    """
+
+    def __init__(self, detector, model_path=None, registry=None, num_workers=2, threads_per_worker=None,
+                 pin_cpus=False, backend=None, screener=None, screening_band=(0.1, 0.9),
+                 max_batch_size=16, warmup_batch_sizes=None, max_restarts=3):
+        self.detector = detector
+        self.max_restarts = max_restarts
+        self.num_workers = max(1, int(num_workers))
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.metrics = None  # Optional LatencyMetrics, set by serve()
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.next_task_id = 0
+        self.closed = False
+
+        blocks = cpu_sets(self.num_workers)
+        self.options = [{
+            'model_path': model_path,
+            'registry': registry,
+            'backend': backend,
+            'screener': screener,
+            'screening_band': tuple(screening_band),
+            'cpus': blocks[i] if pin_cpus else None,
+            'threads': threads_per_worker or len(blocks[i]),
+            'max_batch_size': self.max_batch_size,
+            'warmup_batch_sizes': warmup_batch_sizes
+        } for i in range(self.num_workers)]
+        self.workers = []
+        self.model_info = None
+
+    def _spawn(self, index, context):
+        parent_conn, child_conn = context.Pipe()
+        process = context.Process(target=worker_main, args=(child_conn, self.options[index]),
+                                  name=f"inference-worker-{index}", daemon=True)
+        process.start()
+        child_conn.close()
+        return InferenceWorker(index, process, parent_conn)
+
+    def _wait_ready(self, worker):
+        """Wait for a worker's startup message, returning None when ready or the failure"""
+        try:
+            status, info = worker.conn.recv()
+        except (EOFError, OSError):
+            status, info = 'failed', "Worker exited during startup"
+        if status != 'ready':
+            return info
+        worker.info = info
+        return None
+
+    def _start_receiver(self, worker):
+        worker.receiver = threading.Thread(target=self._receive, args=(worker,),
+                                           name=f"inference-worker-{worker.index}-results", daemon=True)
+        worker.receiver.start()
+
+    def start(self):
+        """Start the workers and wait until every one has loaded the model"""
+        started = time.perf_counter()
+        if 'tensorflow' in sys.modules or 'fork' not in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('spawn')
+        else:
+            context = multiprocessing.get_context('fork')
+
+        for index in range(self.num_workers):
+            self.workers.append(self._spawn(index, context))
+
+        for worker in self.workers:
+            failure = self._wait_ready(worker)
+            if failure is not None:
+                self.close()
+                raise RuntimeError(f"Inference worker {worker.index}: {failure}")
+
+        self.model_info = dict(self.workers[0].info, startup_s=time.perf_counter() - started)
+        for worker in self.workers:
+            self._start_receiver(worker)
+        return self
+
+    def _restart(self, worker):
+        """Replace a dead worker; spawned, since this thread's process already runs many threads"""
+        print(f"Restarting inference worker {worker.index}", file=sys.stderr)
+        replacement = self._spawn(worker.index, multiprocessing.get_context('spawn'))
+        replacement.restarts = worker.restarts + 1
+        failure = self._wait_ready(replacement)
+        if failure is not None:
+            print(f"Inference worker {worker.index} failed to restart: {failure}", file=sys.stderr)
+            replacement.process.join(timeout=5)
+            replacement.conn.close()
+            return
+
+        with self.lock:
+            if self.closed:
+                replacement.conn.send(None)
+                return
+            self.workers[worker.index] = replacement
+        self._start_receiver(replacement)
+
+    def submit(self, image, confidence_threshold=0.7):
+        """Send one preprocessed image to the least-busy worker, returning a Future for its prediction dict"""
+        if self.closed:
+            raise RuntimeError("Worker pool is closed")
+
+        future = Future()
+        image = np.asarray(image, dtype=np.float32)
+        while True:
+            with self.lock:
+                alive = [w for w in self.workers if w.alive]
+                if not alive:
+                    raise RuntimeError("No inference worker is running")
+                worker = min(alive, key=lambda w: (w.outstanding, w.requests))
+                worker.outstanding += 1
+                worker.requests += 1
+                task_id = self.next_task_id
+                self.next_task_id += 1
+                self.pending[task_id] = (future, confidence_threshold, time.monotonic(), worker)
+
+            try:
+                with worker.send_lock:
+                    worker.conn.send((task_id, image))
+                return future
+            except (BrokenPipeError, EOFError, OSError):
+                # The worker died before its receiver noticed; try another one
+                with self.lock:
+                    if self.pending.pop(task_id, None) is not None:
+                        worker.outstanding -= 1
+                    worker.alive = False
+
+    def predict(self, image, confidence_threshold=0.7):
+        """Blocking convenience wrapper around submit()"""
+        return self.submit(image, confidence_threshold).result()
+
+    @staticmethod
+    def _resolve(future, result=None, exception=None):
+        """Complete a future unless its caller already cancelled it"""
+        try:
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            pass
+
+    def _receive(self, worker):
+        try:
+            while True:
+                try:
+                    message = worker.conn.recv()
+                except (EOFError, OSError):
+                    break
+
+                task_ids = message[1]
+                with self.lock:
+                    # None for a task already failed elsewhere, keeping rows aligned
+                    tasks = [self.pending.pop(task_id, None) for task_id in task_ids]
+                    worker.outstanding -= sum(task is not None for task in tasks)
+
+                try:
+                    self._handle_result(worker, message, tasks)
+                except Exception as e:
+                    # A bad result fails its own batch but keeps this worker's results flowing
+                    for task in tasks:
+                        if task is not None:
+                            self._resolve(task[0], exception=e)
+        finally:
+            # The worker exited (or this thread failed); fail whatever it still had
+            with self.lock:
+                worker.alive = False
+                orphaned = [task_id for task_id, task in self.pending.items() if task[3] is worker]
+                tasks = [self.pending.pop(task_id) for task_id in orphaned]
+                worker.outstanding = 0
+            for future, _, _, _ in tasks:
+                self._resolve(future, exception=RuntimeError(f"Inference worker {worker.index} exited"))
+
+        if not self.closed:
+            print(f"Inference worker {worker.index} exited", file=sys.stderr)
+            if worker.restarts < self.max_restarts:
+                try:
+                    self._restart(worker)
+                except Exception as e:
+                    print(f"Inference worker {worker.index} failed to restart: {e}", file=sys.stderr)
+
+    def _handle_result(self, worker, message, tasks):
+        if message[0] == 'error':
+            for task in tasks:
+                if task is not None:
+                    self._resolve(task[0], exception=RuntimeError(message[2]))
+            return
+
+        _, task_ids, probabilities, stages, model_version, seconds = message
+        now = time.monotonic()
+        for i, (task, row) in enumerate(zip(tasks, probabilities)):
+            if task is None:
+                continue
+            future, confidence_threshold, submitted, _ = task
+            prediction = self.detector.build_prediction(row, confidence_threshold, model_version)
+            if stages is not None:
+                prediction['stage'] = stages[i]
+            self._resolve(future, prediction)
+            if self.metrics is not None:
+                self.metrics.observe('worker_roundtrip', now - submitted)
+
+        with self.lock:
+            worker.batches += 1
+            worker.scored += len(task_ids)
+            worker.predict_time += seconds
+        if self.metrics is not None:
+            self.metrics.observe('batch_predict', seconds)
+
+    def stats(self):
+        """Per-worker load, for checking that work is spread across the cores"""
+        with self.lock:
+            return {
+                'workers': [{
+                    'pid': worker.info['pid'] if worker.info else None,
+                    'cpus': worker.info['cpus'] if worker.info else None,
+                    'threads': worker.info['threads'] if worker.info else None,
+                    'alive': worker.alive and worker.process.is_alive(),
+                    'restarts': worker.restarts,
+                    'outstanding': worker.outstanding,
+                    'requests': worker.requests,
+                    'batches': worker.batches,
+                    'mean_batch_size': worker.scored / worker.batches if worker.batches else 0.0,
+                    'mean_predict_ms': 1000.0 * worker.predict_time / worker.batches if worker.batches else 0.0
+                } for worker in self.workers],
+                'max_batch_size': self.max_batch_size,
+                'pending': len(self.pending)
+            }
+
+    def close(self):
+        """Let the workers finish queued images, then stop them"""
+        if self.closed:
+            return
+        self.closed = True
+        for worker in self.workers:
+            try:
+                with worker.send_lock:
+                    worker.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self.workers:
+            worker.process.join(timeout=30)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            if worker.receiver is not None:
+                worker.receiver.join(timeout=5)
+            worker.conn.close()
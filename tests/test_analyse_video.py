@@ -0,0 +1,30 @@
+import pytest
+
+from analyse_video import build_timeline
+
+def frames(probabilities, fps=2.0):
+    return [{'frame': i, 'time_s': i / fps, 'pothole_probability': p, 'scored': p is not None}
+            for i, p in enumerate(probabilities)]
+
+def test_runs_within_gap_merge_into_one_event():
+    # Positives at 0.5 s and 1.5 s are 1 s apart and merge; 3.5 s starts a new event
+    records = frames([0.1, 0.9, 0.2, 0.95, 0.1, 0.1, 0.1, 0.8])
+    _, events = build_timeline(records, threshold=0.7, max_gap_s=1.0)
+
+    assert [(event['start_s'], event['end_s'], event['frames']) for event in events] == [(0.5, 1.5, 2), (3.5, 3.5, 1)]
+    assert events[0]['peak_frame'] == 3 and events[0]['peak_probability'] == 0.95
+
+def test_gap_larger_than_limit_splits_events():
+    records = frames([0.9, 0.1, 0.1, 0.9])
+    _, events = build_timeline(records, threshold=0.7, max_gap_s=1.0)
+    assert len(events) == 2
+
+def test_segments_summarise_frames():
+    records = frames([0.9, None, 0.3, 0.1], fps=1.0)
+    timeline, _ = build_timeline(records, segment_seconds=2.0, threshold=0.7)
+
+    assert [(s['start_s'], s['frames'], s['scored_frames'], s['pothole_frames']) for s in timeline] == [
+        (0.0, 2, 1, 1), (2.0, 2, 2, 0)
+    ]
+    assert timeline[0]['mean_probability'] == pytest.approx(0.45)
+    assert timeline[0]['has_pothole'] and not timeline[1]['has_pothole']
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+from annotation_index import AnnotationIndex, dict_to_columns, window_overlap
+
+def reference_csv_parse(df, filename_column='filename'):
+    """The row-by-row dict building the columnar ingestion replaced"""
+    annotations = {}
+    for _, row in df.iterrows():
+        annotations.setdefault(row[filename_column], []).append({
+            'class': str(row['class']) if 'class' in df.columns else 'pothole',
+            'bbox': {name: int(row[name]) for name in ('xmin', 'ymin', 'xmax', 'ymax')}
+        })
+    return annotations
+
+def as_dict(index):
+    return {
+        filename: [{'class': index.class_names[class_id], 'bbox': dict(zip(('xmin', 'ymin', 'xmax', 'ymax'), box))}
+                   for class_id, box in zip(index.image_class_ids(i).tolist(), index.image_boxes(i).tolist())]
+        for i, filename in enumerate(index.filenames)
+    }
+
+def test_from_frame_matches_row_by_row_parse():
+    rng = np.random.default_rng(0)
+    n = 500
+    df = pd.DataFrame({
+        'filename': [f"img{i}.jpg" for i in rng.integers(0, 60, n)],
+        'class': rng.choice(['pothole', 'crack', 7], n),
+        'xmin': rng.uniform(-5, 100, n), 'ymin': rng.uniform(0, 100, n),
+        'xmax': rng.uniform(100, 300, n), 'ymax': rng.integers(100, 300, n)
+    })
+    assert as_dict(AnnotationIndex.from_frame(df)) == reference_csv_parse(df)
+
+def test_from_frame_without_class_column():
+    df = pd.DataFrame({'image_name': ['a.jpg'], 'xmin': [1], 'ymin': [2], 'xmax': [3], 'ymax': [4]})
+    index = AnnotationIndex.from_frame(df, filename_column='image_name')
+    assert as_dict(index) == {'a.jpg': [{'class': 'pothole', 'bbox': {'xmin': 1, 'ymin': 2, 'xmax': 3, 'ymax': 4}}]}
+
+def test_from_parts_keeps_the_last_part_per_filename():
+    box = {'xmin': 0, 'ymin': 0, 'xmax': 1, 'ymax': 1}
+    parts = [
+        {'a.jpg': [{'class': 'pothole', 'bbox': box}], 'b.jpg': [{'class': 'crack', 'bbox': box}]},
+        {'c.jpg': []},
+        {'a.jpg': [{'class': 'crack', 'bbox': dict(box, xmax=9)}, {'class': 'crack', 'bbox': box}]},
+    ]
+    expected = {}
+    for part in parts:
+        expected.update(part)
+
+    index = AnnotationIndex.from_parts([dict_to_columns(part) for part in parts])
+    assert as_dict(index) == {filename: expected[filename] for filename in index.filenames}
+    assert sorted(index.filenames) == sorted(expected)
+    assert index.num_boxes == 3 and index.class_counts() == {'crack': 3}
+
+def test_offsets_and_round_trip():
+    index = AnnotationIndex(['a', 'b', 'c'], ['pothole'], [2, 0, 2], [0, 0, 0], [[0, 0, 2, 2], [1, 1, 4, 5], [5, 5, 6, 6]])
+    assert index.offsets.tolist() == [0, 1, 1, 3]
+    assert index.image_boxes(1).shape == (0, 4)
+    assert index.areas().tolist() == [12, 4, 1]
+    assert as_dict(AnnotationIndex.concatenate([index])) == as_dict(index)
+
+def test_concatenate_matches_from_parts():
+    rng = np.random.default_rng(2)
+    parts = []
+    for _ in range(6):
+        part = {}
+        for i in rng.integers(0, 12, rng.integers(0, 6)).tolist():
+            part[f"img{i}.jpg"] = [{'class': str(rng.choice(['pothole', 'crack', 'patch'])),
+                                    'bbox': dict(zip(('xmin', 'ymin', 'xmax', 'ymax'), rng.integers(0, 99, 4).tolist()))}
+                                   for _ in range(rng.integers(0, 4))]
+        parts.append(dict_to_columns(part))
+
+    merged = AnnotationIndex.concatenate([AnnotationIndex.from_parts([part]) for part in parts])
+    expected = AnnotationIndex.from_parts(parts)
+    assert as_dict(merged) == as_dict(expected)
+    assert merged.filenames == expected.filenames
+    assert merged.class_names == expected.class_names
+    assert merged.class_ids.tolist() == expected.class_ids.tolist()
+
+def test_concatenate_without_boxes():
+    assert len(AnnotationIndex.concatenate([])) == 0
+    merged = AnnotationIndex.concatenate([AnnotationIndex(['a'], [], [], [], []), AnnotationIndex([], [], [], [], [])])
+    assert merged.filenames == ['a'] and merged.num_boxes == 0 and merged.class_names == []
+
+def test_window_overlap_matches_pairwise_loop():
+    rng = np.random.default_rng(1)
+    corners = rng.integers(0, 200, (50, 2))
+    windows = np.hstack([corners, corners + rng.integers(1, 60, (50, 2))])
+    corners = rng.integers(0, 200, (7, 2))
+    boxes = np.hstack([corners, corners + rng.integers(0, 80, (7, 2))])
+
+    expected = []
+    for wx0, wy0, wx1, wy1 in windows.tolist():
+        coverage = 0.0
+        for bx0, by0, bx1, by1 in boxes.tolist():
+            overlap = max(0, min(wx1, bx1) - max(wx0, bx0)) * max(0, min(wy1, by1) - max(wy0, by0))
+            coverage = max(coverage, overlap / ((wx1 - wx0) * (wy1 - wy0)))
+        expected.append(coverage)
+    assert np.allclose(window_overlap(windows, boxes), expected)
+
+def test_window_overlap_without_boxes():
+    assert window_overlap([[0, 0, 10, 10]], np.zeros((0, 4))).tolist() == [0.0]
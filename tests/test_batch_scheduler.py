@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from batch_scheduler import MicroBatchScheduler
+
+class FakeDetector:
+    """Scores each image by its mean, failing on images marked with NaN"""
+
+    def predict_probabilities(self, images):
+        return np.array([[1 - image.mean(), image.mean()] for image in images]), None, 'v1'
+
+    def build_prediction(self, probabilities, confidence_threshold=0.7, model_version=None):
+        if np.isnan(probabilities).any():
+            raise ValueError("bad row")
+        return {'confidence': float(probabilities[1]), 'model_version': model_version}
+
+def test_batches_concurrent_requests():
+    scheduler = MicroBatchScheduler(FakeDetector(), max_batch_size=4, max_wait_ms=50)
+    futures = [scheduler.submit(np.full(2, i / 10)) for i in range(8)]
+    assert [future.result(timeout=5)['confidence'] for future in futures] == pytest.approx([i / 10 for i in range(8)])
+    scheduler.close()
+    assert scheduler.stats()['requests'] == 8
+
+def test_failed_batch_keeps_scheduler_alive():
+    scheduler = MicroBatchScheduler(FakeDetector(), max_batch_size=2, max_wait_ms=50)
+    bad = [scheduler.submit(np.array([np.nan])), scheduler.submit(np.array([0.5]))]
+    for future in bad:
+        with pytest.raises(ValueError):
+            future.result(timeout=5)
+
+    assert scheduler.predict(np.array([0.25]))['confidence'] == pytest.approx(0.25)
+    scheduler.close()
+
+def test_cancelled_request_does_not_fail_its_batch():
+    scheduler = MicroBatchScheduler(FakeDetector(), max_batch_size=2, max_wait_ms=200)
+    cancelled = scheduler.submit(np.array([0.1]))
+    assert cancelled.cancel()
+    kept = scheduler.submit(np.array([0.9]))
+    assert kept.result(timeout=5)['confidence'] == pytest.approx(0.9)
+    scheduler.close()
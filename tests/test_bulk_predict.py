@@ -0,0 +1,122 @@
+import os
+import json
+from pathlib import Path
+
+from bulk_predict import BulkCheckpoint, NDJSONResultWriter, list_images, in_shard, source_root
+
+def test_manifest_paths_with_commas_and_comments(tmp_path):
+    manifest = tmp_path / 'manifest.csv'
+    manifest.write_text(
+        '# exported images\n'
+        '"roads/a, b.jpg",2024-01-01\n'
+        '\n'
+        '/data/c.png\n'
+    )
+    assert list_images(manifest) == [str(tmp_path / 'roads' / 'a, b.jpg'), '/data/c.png']
+
+def test_manifest_header_selects_path_column(tmp_path):
+    manifest = tmp_path / 'manifest.csv'
+    manifest.write_text('id,image_path\n1,x.jpg\n2,y.jpg\n')
+    assert list_images(manifest) == [str(tmp_path / 'x.jpg'), str(tmp_path / 'y.jpg')]
+
+def test_manifest_unknown_header_is_skipped(tmp_path):
+    manifest = tmp_path / 'manifest.csv'
+    manifest.write_text('source,taken_at\nx.jpg,2024-01-01\n')
+    assert list_images(manifest) == [str(tmp_path / 'x.jpg')]
+
+def test_directory_listing_is_sorted_and_filtered(tmp_path):
+    for name in ['b.JPG', 'a.png', 'notes.txt']:
+        (tmp_path / name).write_bytes(b'')
+    assert list_images(tmp_path) == [str(tmp_path / 'a.png'), str(tmp_path / 'b.JPG')]
+
+def test_shards_partition_images():
+    paths = [f"img_{i}.jpg" for i in range(200)]
+    assigned = [[path for path in paths if in_shard(path, index, 3)] for index in range(3)]
+    assert sorted(sum(assigned, [])) == sorted(paths)
+
+def partition(source, count=4):
+    """Each shard's images, as paths relative to the source root"""
+    root = source_root(source)
+    return [sorted(os.path.relpath(path, root) for path in list_images(source) if in_shard(path, index, count, root))
+            for index in range(count)]
+
+def make_tree(root):
+    for i in range(40):
+        path = root / f"street_{i % 3}" / f"img_{i}.jpg"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'')
+    (root / 'manifest.csv').write_text('image_path\n' + ''.join(f"street_{i % 3}/img_{i}.jpg\n" for i in range(40)))
+
+def test_shards_do_not_depend_on_where_the_source_is_mounted(tmp_path, monkeypatch):
+    make_tree(tmp_path / 'host_a' / 'mnt' / 'images')
+    make_tree(tmp_path / 'host_b' / 'images')
+    expected = partition(tmp_path / 'host_a' / 'mnt' / 'images')
+    assert all(expected) and sum(map(len, expected)) == 40
+
+    assert partition(tmp_path / 'host_b' / 'images') == expected
+    monkeypatch.chdir(tmp_path / 'host_b')
+    assert partition(Path('images')) == expected
+    assert partition(Path('images/../images/')) == expected
+
+def test_manifest_shards_hash_paths_relative_to_the_manifest(tmp_path):
+    make_tree(tmp_path / 'host_a')
+    make_tree(tmp_path / 'host_b' / 'deeper')
+    expected = partition(tmp_path / 'host_a' / 'manifest.csv')
+    assert all(expected)
+    assert partition(tmp_path / 'host_b' / 'deeper' / 'manifest.csv') == expected
+    # The directory and its manifest split the images the same way
+    assert partition(tmp_path / 'host_a') == expected
+
+def test_checkpoint_rolls_back_unrecorded_rows(tmp_path):
+    output = tmp_path / 'results.ndjson'
+    checkpoint_path = tmp_path / 'results.ndjson.checkpoint'
+
+    checkpoint = BulkCheckpoint(checkpoint_path)
+    writer = NDJSONResultWriter(output, checkpoint.position)
+    checkpoint.record(['a.jpg'], writer.write([{'image_path': 'a.jpg'}]))
+    # Crash after writing a batch but before recording it, leaving a torn line
+    writer.write([{'image_path': 'b.jpg'}])
+    writer.close()
+    with open(checkpoint_path, 'a') as f:
+        f.write('{"images": ["b.j')
+
+    checkpoint = BulkCheckpoint(checkpoint_path)
+    assert checkpoint.completed == {'a.jpg'}
+    writer = NDJSONResultWriter(output, checkpoint.position)
+    writer.write([{'image_path': 'b.jpg'}])
+    writer.close()
+
+    rows = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [row['image_path'] for row in rows] == ['a.jpg', 'b.jpg']
+
+def test_checkpoint_entries_after_torn_line_survive(tmp_path):
+    checkpoint_path = tmp_path / 'checkpoint'
+    BulkCheckpoint(checkpoint_path).record(['a.jpg'], 1)
+    with open(checkpoint_path, 'a') as f:
+        f.write('{"images": ["b.j')
+
+    BulkCheckpoint(checkpoint_path).record(['c.jpg'], 3)
+    checkpoint = BulkCheckpoint(checkpoint_path)
+    assert checkpoint.completed == {'a.jpg', 'c.jpg'}
+    assert checkpoint.position == 3
+
+def test_parquet_rows_keep_model_version_and_stage(tmp_path):
+    import pandas as pd
+    from bulk_predict import ParquetResultWriter
+
+    output = tmp_path / 'results.parquet'
+    writer = ParquetResultWriter(output)
+    writer.write([{'image_path': 'bad.jpg', 'error': 'Could not load image'}])
+    writer.write([{
+        'image_path': 'a.jpg',
+        'prediction': {'class': 'pothole', 'confidence': 0.9, 'is_pothole': True, 'is_reliable': True,
+                       'raw_prediction': [0.1, 0.9], 'confidence_threshold': 0.7,
+                       'model_version': 'v3', 'stage': 'full'},
+        'severity': 4, 'action_priority': 'High', 'estimated_size': 'Large'
+    }])
+
+    frame = pd.read_parquet(output).sort_values('image_path')
+    assert frame['model_version'].tolist()[0] == 'v3'
+    assert frame['stage'].tolist()[0] == 'full'
+    assert frame['severity'].tolist()[0] == 4
+    assert frame['error'].tolist()[1] == 'Could not load image'
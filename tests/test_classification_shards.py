@@ -0,0 +1,70 @@
+import cv2
+import numpy as np
+import pytest
+
+import classification_shards
+from classification_shards import ClassificationShards, decode_sample, write_shards
+
+def make_samples(directory, count):
+    rng = np.random.default_rng(0)
+    samples = []
+    for i in range(count):
+        path = directory / f"crop_{i:03d}.png"
+        cv2.imwrite(str(path), rng.integers(0, 256, (20 + i, 30, 3), dtype=np.uint8))
+        samples.append((path, i % 2))
+    return samples
+
+def test_take_matches_decoding_each_crop(tmp_path):
+    samples = make_samples(tmp_path, 11)
+    assert write_shards(samples, tmp_path / 'shards', image_size=(16, 12), shard_size=4) == 11
+
+    shards = ClassificationShards(tmp_path / 'shards')
+    assert len(shards) == 11 and len(shards.shards) == 3
+    indices = [10, 0, 5, 5, 3]
+    expected = np.stack([decode_sample(samples[i][0], (16, 12)) for i in indices]).astype(np.float32) / 255.0
+    assert np.array_equal(shards.take(indices, chunk_size=2), expected)
+    assert shards.labels.tolist() == [i % 2 for i in range(11)]
+
+def test_unreadable_crops_are_skipped_and_stale_shards_removed(tmp_path):
+    samples = make_samples(tmp_path, 6)
+    write_shards(samples, tmp_path / 'shards', image_size=(8, 8), shard_size=2)
+    assert len(list((tmp_path / 'shards').glob('*/images-*.npy'))) == 3
+
+    samples[1][0].write_bytes(b'not an image')
+    write_shards(samples[:4], tmp_path / 'shards', image_size=(8, 8), shard_size=4)
+    shards = ClassificationShards(tmp_path / 'shards')
+    assert len(shards) == 3 and shards.labels.tolist() == [0, 0, 1]
+    assert [path.name for path in (tmp_path / 'shards').glob('*/images-*.npy')] == ['images-00000.npy']
+
+def test_interrupted_rebuild_leaves_the_previous_dataset_readable(tmp_path, monkeypatch):
+    samples = make_samples(tmp_path, 6)
+    write_shards(samples, tmp_path / 'shards', image_size=(8, 8), shard_size=2)
+    before = ClassificationShards(tmp_path / 'shards')
+    expected = before.take(range(6))
+
+    decoded = []
+    def failing_decode(path, image_size):
+        if len(decoded) == 3:
+            raise RuntimeError("killed mid-rebuild")
+        decoded.append(path)
+        return np.zeros(image_size[::-1] + (3,), dtype=np.uint8)
+    monkeypatch.setattr(classification_shards, 'decode_sample', failing_decode)
+    with pytest.raises(RuntimeError):
+        write_shards(samples[::-1], tmp_path / 'shards', image_size=(8, 8), shard_size=2, workers=1)
+
+    # Neither the open reader nor a fresh one sees the partial rebuild
+    assert np.array_equal(before.take(range(6)), expected)
+    after = ClassificationShards(tmp_path / 'shards')
+    assert np.array_equal(after.take(range(6)), expected) and after.labels.tolist() == before.labels.tolist()
+    assert len(list((tmp_path / 'shards').glob('generation-*'))) == 1
+
+    monkeypatch.undo()
+    write_shards(samples[:2], tmp_path / 'shards', image_size=(8, 8))
+    assert len(ClassificationShards(tmp_path / 'shards')) == 2
+    assert np.array_equal(before.take(range(6)), expected)
+    assert len(list((tmp_path / 'shards').glob('generation-*'))) == 1
+
+def test_exists_rejects_other_format_versions(tmp_path):
+    (tmp_path / 'index.json').write_text('{"version": 1}')
+    assert not ClassificationShards.exists(tmp_path)
+    assert not ClassificationShards.exists(tmp_path / 'missing')
@@ -0,0 +1,78 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+from coco_stream import JsonStream, iter_top_level_arrays, parse_coco
+
+DOCUMENT = json.dumps({
+    "info": {"year": 2024, "version": "1.0", "ratio": 12.5e-3},
+    "scale": 123456.789,
+    "exponent": -3.25e+10,
+    "numbers": [1.25, -3e+10, 0, 12.0, 7, 1e-7, 123456789012, -0.5],
+    "mixed": [True, None, False, "x\"y\\z", "é中", {"k": [1.5, 2]}, [], {}],
+    "nested": [[1, 2], [3.75, [4e2]]],
+    "empty": [],
+    "last": 99.5
+}, indent=1)
+
+def read_document(stream):
+    """Rebuild the top-level object through JsonStream's value() and elements()"""
+    document = {}
+    stream.expect('{')
+    while True:
+        key = stream.value()
+        stream.expect(':')
+        document[key] = list(stream.elements()) if stream.peek() == '[' else stream.value()
+        if stream.expect(',', '}') == '}':
+            return document
+
+@pytest.mark.parametrize('chunk_size', range(1, 65))
+def test_every_chunk_size_reads_the_same_document(chunk_size):
+    assert read_document(JsonStream(io.StringIO(DOCUMENT), chunk_size)) == json.loads(DOCUMENT)
+
+@pytest.mark.parametrize('chunk_size', range(1, 65))
+def test_every_chunk_size_yields_the_same_array_elements(tmp_path, chunk_size):
+    path = tmp_path / 'document.json'
+    path.write_text(DOCUMENT, encoding='utf-8')
+    expected = json.loads(DOCUMENT)
+    found = set()
+    elements = list(iter_top_level_arrays(path, {'numbers', 'mixed', 'nested'}, found, chunk_size))
+    assert elements == [(key, element) for key in ('numbers', 'mixed', 'nested') for element in expected[key]]
+    assert found == set(expected)
+
+@pytest.mark.parametrize('text', ['{"a": [1, 2', '{"a": [1 2]}', '{"a": 12.}', '{"a": [1.]}'])
+def test_invalid_documents_raise(tmp_path, text):
+    path = tmp_path / 'bad.json'
+    path.write_text(text)
+    with pytest.raises(ValueError):
+        list(iter_top_level_arrays(path, {'a'}, chunk_size=3))
+
+def coco_document():
+    rng = np.random.default_rng(0)
+    return {
+        "categories": [{"id": 7, "name": "pothole"}, {"id": 3, "name": "crack"}],
+        "images": [{"id": 100 + i, "file_name": f"dir/{i}.jpg", "width": 640, "height": 480} for i in range(20)],
+        "annotations": [{"id": i, "image_id": int(100 + rng.integers(20)), "category_id": int(rng.choice([7, 3])),
+                         "bbox": [float(v) for v in np.round(rng.uniform(0, 300, 4), 2)], "area": 1.5}
+                        for i in range(200)]
+    }
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64, 1 << 20])
+def test_parse_coco_matches_json_load(tmp_path, chunk_size):
+    document = coco_document()
+    path = tmp_path / 'coco.json'
+    path.write_text(json.dumps(document))
+
+    coco = parse_coco(path, chunk_size)
+    assert coco['images'] == {image['id']: image['file_name'] for image in document['images']}
+    assert coco['categories'] == {7: 'pothole', 3: 'crack'}
+    assert coco['image_ids'].tolist() == [a['image_id'] for a in document['annotations']]
+    assert coco['category_ids'].tolist() == [a['category_id'] for a in document['annotations']]
+    assert coco['bbox'].tolist() == [a['bbox'] for a in document['annotations']]
+
+def test_parse_coco_without_annotations_section(tmp_path):
+    path = tmp_path / 'other.json'
+    path.write_text('{"images": [], "labels": [1, 2]}')
+    assert parse_coco(path) is None
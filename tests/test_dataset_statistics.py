@@ -0,0 +1,70 @@
+import cv2
+import numpy as np
+import pytest
+
+from annotation_index import AnnotationIndex
+from dataset_statistics import FixedHistogram, box_statistics, image_statistics, read_image_sizes
+
+def rounded(value):
+    """Nested report with floats rounded, since chunked sums differ in the last bits"""
+    if isinstance(value, dict):
+        return {key: rounded(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [rounded(item) for item in value]
+    if isinstance(value, float):
+        return float(f"{value:.9g}")
+    return value
+
+def test_histogram_accumulates_chunks_like_one_pass():
+    values = np.random.default_rng(0).lognormal(8, 2, 10000)
+    edges = [100, 1000, 10000, 100000]
+    chunked = FixedHistogram(edges)
+    for start in range(0, len(values), 777):
+        chunked.add(values[start:start + 777])
+
+    counts = np.bincount(np.searchsorted(edges, values, side='right'), minlength=5)
+    result = chunked.as_dict()
+    assert [b['count'] for b in result['bins']] == counts.tolist()
+    assert result['mean'] == pytest.approx(values.mean())
+    assert (result['min'], result['max']) == (values.min(), values.max())
+    assert result['bins'][0]['min'] is None and result['bins'][-1]['max'] is None
+
+def test_empty_histogram():
+    histogram = FixedHistogram([1, 2])
+    histogram.add([np.nan, np.inf])
+    assert histogram.as_dict()['count'] == 0 and histogram.as_dict()['mean'] is None
+
+def test_box_statistics_independent_of_chunk_size():
+    rng = np.random.default_rng(1)
+    corners = rng.integers(-10, 500, (5000, 2))
+    boxes = np.hstack([corners, corners + rng.integers(-5, 300, (5000, 2))])
+    annotations = AnnotationIndex([f"{i}.jpg" for i in range(100)], ['pothole'],
+                                  rng.integers(0, 100, 5000), np.zeros(5000), boxes)
+    image_sizes = rng.integers(200, 800, (100, 2)).astype(np.int32)
+    image_sizes[:5] = -1
+
+    whole = box_statistics(annotations, image_sizes, chunk_size=1 << 20)
+    assert rounded(box_statistics(annotations, image_sizes, chunk_size=333)) == rounded(whole)
+
+    boxes = annotations.boxes  # Sorted by image, like image_ids
+    width, height = boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]
+    valid = (width > 0) & (height > 0)
+    assert whole['degenerate_boxes'] == int(np.sum(~valid))
+    assert whole['area_px']['count'] == int(np.sum(valid))
+    known = valid & (image_sizes[annotations.image_ids, 0] > 0)
+    assert sum(whole['relative_size_classes'].values()) == int(np.sum(known))
+
+def test_image_sizes_from_headers(tmp_path):
+    paths = []
+    for i, (width, height) in enumerate([(64, 48), (64, 48), (30, 20)]):
+        paths.append(tmp_path / f"{i}.png")
+        cv2.imwrite(str(paths[-1]), np.zeros((height, width, 3), dtype=np.uint8))
+    paths.append(tmp_path / 'missing.jpg')
+
+    sizes = read_image_sizes(paths, workers=2)
+    assert sizes.tolist() == [[64, 48], [64, 48], [30, 20], [-1, -1]]
+
+    report = image_statistics(sizes, np.array([1, 0, 3, 2]))
+    assert report['unreadable_headers'] == 1
+    assert report['resolutions'][0] == {'width': 64, 'height': 48, 'images': 2}
+    assert report['boxes_per_image']['count'] == 4
@@ -0,0 +1,57 @@
+import struct
+
+import cv2
+import numpy as np
+import pytest
+
+from image_headers import image_format, read_image_size, read_image_size_from_file, read_jpeg_orientation
+
+def encode(extension, width, height, params=()):
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    return cv2.imencode(extension, image, list(params))[1].tobytes()
+
+def with_orientation(data, orientation, byte_order='>'):
+    """Insert an EXIF APP1 segment holding only the orientation tag"""
+    tiff = ({'>': b'MM', '<': b'II'}[byte_order] + struct.pack(byte_order + 'HI', 42, 8)
+            + struct.pack(byte_order + 'HHHIHH', 1, 0x0112, 3, 1, orientation, 0) + struct.pack(byte_order + 'I', 0))
+    payload = b'Exif\x00\x00' + tiff
+    return data[:2] + b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload + data[2:]
+
+@pytest.mark.parametrize('params', [(), (cv2.IMWRITE_JPEG_PROGRESSIVE, 1)])
+def test_jpeg_size(params):
+    data = encode('.jpg', 123, 45, params)
+    assert image_format(data) == 'jpeg'
+    assert read_image_size(data) == (123, 45)
+
+def test_png_size():
+    data = encode('.png', 640, 1)
+    assert image_format(data) == 'png'
+    assert read_image_size(data) == (640, 1)
+
+def test_unknown_and_truncated_headers():
+    assert read_image_size(b'GIF89a' + bytes(20)) is None
+    assert read_image_size(encode('.png', 8, 8)[:20]) is None
+    data = encode('.jpg', 8, 8)
+    assert read_image_size(data[:data.index(b'\xff\xc0') + 6]) is None
+
+def test_large_exif_segment_pushes_frame_header_past_first_chunk(tmp_path):
+    data = encode('.jpg', 300, 200)
+    payload = b'Exif\x00\x00' + bytes(60000)
+    app1 = b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload
+    path = tmp_path / 'exif.jpg'
+    path.write_bytes(data[:2] + app1 * 2 + data[2:])
+
+    assert read_image_size(path.read_bytes()[:65536]) is None
+    assert read_image_size_from_file(path) == (300, 200)
+
+@pytest.mark.parametrize('byte_order', ['>', '<'])
+@pytest.mark.parametrize('orientation', [1, 3, 6, 8])
+def test_jpeg_orientation(orientation, byte_order):
+    data = with_orientation(encode('.jpg', 60, 30), orientation, byte_order)
+    assert read_jpeg_orientation(data) == orientation
+    assert read_image_size(data) == (60, 30)
+
+def test_missing_orientation_defaults_to_upright():
+    assert read_jpeg_orientation(encode('.jpg', 8, 8)) == 1
+    assert read_jpeg_orientation(encode('.png', 8, 8)) == 1
+    assert read_jpeg_orientation(with_orientation(encode('.jpg', 8, 8), 6)[:30]) == 1
@@ -0,0 +1,31 @@
+import sys
+import types
+
+import pytest
+
+from inference_backends import create_backend
+
+class FakeSession:
+    def __init__(self, path, options, providers):
+        self.options = options
+
+    def get_inputs(self):
+        return [types.SimpleNamespace(name='input')]
+
+@pytest.fixture
+def fake_onnxruntime(monkeypatch):
+    module = types.SimpleNamespace(
+        SessionOptions=types.SimpleNamespace,
+        GraphOptimizationLevel=types.SimpleNamespace(ORT_ENABLE_ALL='all'),
+        InferenceSession=FakeSession
+    )
+    monkeypatch.setitem(sys.modules, 'onnxruntime', module)
+    return module
+
+def test_onnx_session_uses_the_requested_threads(fake_onnxruntime):
+    options = create_backend('onnx', 'model.onnx', num_threads=3).session.options
+    assert options.intra_op_num_threads == 3 and options.inter_op_num_threads == 1
+
+def test_onnx_session_keeps_its_default_pool_without_a_thread_count(fake_onnxruntime):
+    options = create_backend(None, 'model.onnx').session.options
+    assert not hasattr(options, 'intra_op_num_threads')
@@ -0,0 +1,243 @@
+import os
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+import kaggle_dataset_loader
+from annotation_index import AnnotationIndex, window_overlap
+from kaggle_dataset_loader import KagglePotholeDatasetLoader, sample_filename
+
+def write_voc(path, filename, boxes, class_name='pothole'):
+    objects = ''.join(
+        f"<object><name>{class_name}</name><bndbox><xmin>{xmin}</xmin><ymin>{ymin}</ymin>"
+        f"<xmax>{xmax}</xmax><ymax>{ymax}</ymax></bndbox></object>"
+        for xmin, ymin, xmax, ymax in boxes
+    )
+    path.write_text(f"<annotation><filename>{filename}</filename>{objects}</annotation>")
+
+def write_image(path, width=320, height=240, seed=0):
+    image = np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    cv2.imwrite(str(path), image)
+
+@pytest.fixture
+def loader(tmp_path):
+    loader = KagglePotholeDatasetLoader(str(tmp_path / 'dataset'))
+    loader.images_path.mkdir()
+    loader.annotations_path.mkdir()
+    return loader
+
+def annotations_as_dict(index):
+    return {
+        filename: [(index.class_names[class_id], box)
+                   for class_id, box in zip(index.image_class_ids(i).tolist(), index.image_boxes(i).tolist())]
+        for i, filename in enumerate(index.filenames)
+    }
+
+def test_parses_voc_and_yolo_labels(loader):
+    write_voc(loader.annotations_path / 'a.xml', 'a.jpg', [(10, 20, 50, 60), (0, 0, 5, 5)])
+    write_image(loader.images_path / 'b.png', width=200, height=100)
+    (loader.annotations_path / 'classes.txt').write_text('pothole\ncrack\n')
+    (loader.annotations_path / 'b.txt').write_text('1 0.5 0.5 0.2 0.4\n\n0 0.05 0.05 0.2 0.2\n')
+
+    annotations = annotations_as_dict(loader.parse_annotations(workers=1))
+    assert annotations == {
+        'a.jpg': [('pothole', [10, 20, 50, 60]), ('pothole', [0, 0, 5, 5])],
+        # YOLO boxes are scaled by the PNG header size and clipped to the image
+        'b.png': [('crack', [80, 30, 120, 70]), ('pothole', [0, 0, 30, 15])]
+    }
+
+def test_cache_reparses_only_changed_files(loader, monkeypatch):
+    for i in range(3):
+        write_voc(loader.annotations_path / f"{i}.xml", f"{i}.jpg", [(i, i, 10 + i, 10 + i)])
+    first = loader.parse_annotations(workers=1)
+
+    parsed = []
+    original = KagglePotholeDatasetLoader.parse_annotation_file
+    monkeypatch.setattr(KagglePotholeDatasetLoader, 'parse_annotation_file',
+                        lambda self, path: parsed.append(path.name) or original(self, path))
+
+    assert annotations_as_dict(loader.parse_annotations(workers=1)) == annotations_as_dict(first)
+    assert parsed == []
+
+    changed = loader.annotations_path / '1.xml'
+    write_voc(changed, '1.jpg', [(1, 1, 99, 99)])
+    os.utime(changed, ns=(0, changed.stat().st_mtime_ns + 10 ** 9))
+    (loader.annotations_path / '2.xml').unlink()
+    annotations = annotations_as_dict(loader.parse_annotations(workers=1))
+    assert parsed == ['1.xml']
+    assert annotations == {'0.jpg': [('pothole', [0, 0, 10, 10])], '1.jpg': [('pothole', [1, 1, 99, 99])]}
+
+def test_cache_round_trip_keeps_every_file(loader, monkeypatch):
+    write_voc(loader.annotations_path / 'a.xml', 'a.jpg', [(1, 2, 3, 4), (5, 6, 7, 8)], class_name='crack')
+    write_voc(loader.annotations_path / 'empty.xml', 'empty.jpg', [])
+    (loader.annotations_path / 'coco.json').write_text(json.dumps({
+        'images': [{'id': 1, 'file_name': 'b.jpg'}, {'id': 2, 'file_name': 'a.jpg'}],
+        'categories': [{'id': 5, 'name': 'pothole'}],
+        'annotations': [{'image_id': 1, 'category_id': 5, 'bbox': [10, 10, 5, 5]},
+                        {'image_id': 2, 'category_id': 5, 'bbox': [0, 0, 1, 1]}]
+    }))
+    (loader.processed_path / 'annotation_index.json').write_text('{}')
+    first = loader.parse_annotations(workers=1)
+    assert loader.annotation_index_path.exists()
+    assert not (loader.processed_path / 'annotation_index.json').exists()
+
+    monkeypatch.setattr(KagglePotholeDatasetLoader, 'parse_annotation_file',
+                        lambda self, path: pytest.fail(f"{path.name} was parsed again"))
+    cached = loader.parse_annotations(workers=1)
+    assert annotations_as_dict(cached) == annotations_as_dict(first)
+    assert cached.filenames == first.filenames and cached.class_names == first.class_names
+    assert cached.class_ids.tolist() == first.class_ids.tolist()
+
+def test_yolo_class_file_change_invalidates_cache(loader):
+    write_image(loader.images_path / 'a.jpg', width=100, height=100)
+    (loader.annotations_path / 'a.txt').write_text('0 0.5 0.5 0.2 0.2\n')
+    assert loader.parse_annotations(workers=1).class_names == ['pothole']
+
+    (loader.annotations_path / 'obj.names').write_text('hole\n')
+    loader = KagglePotholeDatasetLoader(str(loader.dataset_path))
+    assert loader.parse_annotations(workers=1).class_names == ['hole']
+
+def test_process_pool_matches_serial_parse(loader, monkeypatch):
+    monkeypatch.setattr(kaggle_dataset_loader, 'MIN_FILES_PER_POOL', 4)
+    rng = np.random.default_rng(0)
+    for i in range(40):
+        boxes = [tuple(int(v) for v in rng.integers(0, 100, 4)) for _ in range(i % 4)]
+        write_voc(loader.annotations_path / f"{i:02d}.xml", f"{i:02d}.jpg", boxes)
+
+    serial = loader.parse_annotations(workers=1, use_cache=False)
+    pooled = loader.parse_annotations(workers=2, use_cache=False)
+    assert annotations_as_dict(pooled) == annotations_as_dict(serial)
+    assert pooled.filenames == serial.filenames
+
+def crop_contents(loader):
+    classification_path = loader.processed_path / 'classification'
+    return {
+        path.relative_to(classification_path).as_posix(): path.read_bytes()
+        for path in sorted(classification_path.rglob('*')) if path.is_file()
+    }
+
+def nested_annotations(loader):
+    filenames = ['a/x.jpg', 'b/x.jpg', 'x.png']
+    for i, filename in enumerate(filenames):
+        (loader.images_path / filename).parent.mkdir(parents=True, exist_ok=True)
+        write_image(loader.images_path / filename, width=640, height=480, seed=i)
+    return AnnotationIndex(filenames, ['pothole'], [0, 1, 2, 2], [0, 0, 0, 0],
+                           [[10, 10, 60, 60], [20, 20, 80, 70], [100, 100, 150, 140], [300, 200, 360, 260]])
+
+def test_crops_of_same_named_sources_do_not_collide(loader):
+    loader.create_classification_dataset(nested_annotations(loader), output_size=(32, 32), workers=1)
+
+    crops = crop_contents(loader)
+    assert len([name for name in crops if name.startswith('pothole/')]) == 4
+    assert len([name for name in crops if name.startswith('no_pothole/')]) == 8
+    assert len({sample_filename('pothole', name, 0) for name in ['a/x.jpg', 'b/x.jpg', 'x.jpg', 'x.png']}) == 4
+
+def test_process_pool_writes_the_same_crops(loader, tmp_path):
+    annotations = nested_annotations(loader)
+    loader.create_classification_dataset(annotations, output_size=(32, 32), workers=1)
+    serial = crop_contents(loader)
+
+    pooled_loader = KagglePotholeDatasetLoader(str(tmp_path / 'pooled'))
+    pooled_loader.images_path = loader.images_path
+    pooled_loader.create_classification_dataset(annotations, output_size=(32, 32), workers=2)
+    assert crop_contents(pooled_loader) == serial
+
+def test_free_windows_stay_inside_the_image_and_clear_of_boxes(loader):
+    boxes = np.array([[50, 50, 200, 150], [300, 20, 420, 300]])
+    rng = np.random.default_rng(0)
+    windows = loader.free_windows((320, 480), boxes, (96, 64), rng, threshold=0.1)
+
+    assert len(windows) > 0
+    assert np.all(windows[:, 2] - windows[:, 0] == 96) and np.all(windows[:, 3] - windows[:, 1] == 64)
+    assert windows[:, :2].min() >= 0 and windows[:, 2].max() <= 480 and windows[:, 3].max() <= 320
+    assert window_overlap(windows, boxes).max() <= 0.1
+    assert len({tuple(window) for window in windows.tolist()}) == len(windows)
+
+def test_free_windows_larger_than_image_fall_back_to_origin(loader):
+    windows = loader.free_windows((50, 50), np.zeros((0, 4), dtype=np.int32), (50, 50), np.random.default_rng(0))
+    assert windows.tolist() == [[0, 0, 50, 50]]
+
+def test_negative_samples_fill_crowded_images_across_scales(loader, tmp_path):
+    image = np.zeros((480, 640, 3), dtype=np.uint8)
+    # Twelve boxes leave few windows at the large scale; the small scale makes up the difference
+    boxes = np.array([[x, y, x + 60, y + 60] for x in range(0, 640, 160) for y in range(0, 480, 160)])
+    output = tmp_path / 'negatives'
+    output.mkdir()
+
+    created = loader.create_negative_samples(image, boxes, output, 'img.jpg', (64, 64),
+                                             np.random.default_rng(0), scales=(1.0, 4.0), negatives_per_box=4)
+    assert created == 48
+    assert len(list(output.iterdir())) == 48
+
+def test_negative_samples_are_reproducible_for_a_seed(loader, tmp_path):
+    image = np.random.default_rng(3).integers(0, 256, (300, 400, 3), dtype=np.uint8)
+    boxes = np.array([[100, 100, 160, 150]])
+    contents = []
+    for run in range(2):
+        output = tmp_path / f"run{run}"
+        output.mkdir()
+        loader.create_negative_samples(image, boxes, output, 'img.jpg', (32, 32), np.random.default_rng(7))
+        contents.append({path.name: path.read_bytes() for path in output.iterdir()})
+    assert contents[0] == contents[1] and len(contents[0]) == 2
+
+def build(loader, annotations, **kwargs):
+    loader.create_classification_dataset(annotations, output_size=(32, 32), workers=1, **kwargs)
+    return loader.build_summary
+
+def crop_mtimes(loader):
+    classification_path = loader.processed_path / 'classification'
+    return {path.name: path.stat().st_mtime_ns for path in classification_path.rglob('*') if path.is_file()}
+
+def test_first_manifest_build_removes_legacy_crops(loader):
+    annotations = nested_annotations(loader)
+    for class_name in ('pothole', 'no_pothole'):
+        legacy = loader.processed_path / 'classification' / class_name
+        legacy.mkdir(parents=True)
+        (legacy / f"{class_name}_x_000.jpg").write_bytes(b'old')
+
+    summary = build(loader, annotations)
+    assert summary['stray_crops_removed'] == 2
+    assert not any('_x_000' in name for name in crop_contents(loader))
+
+def test_incremental_rebuilds_only_what_changed(loader):
+    annotations = nested_annotations(loader)
+    assert build(loader, annotations)['added'] == 3
+    first = crop_contents(loader)
+    mtimes = crop_mtimes(loader)
+
+    summary = build(loader, annotations)
+    assert (summary['unchanged'], summary['added'], summary['rebuilt'], summary['removed']) == (3, 0, 0, 0)
+    assert crop_mtimes(loader) == mtimes
+
+    # Touching a file without changing its bytes keeps its crops
+    touched = loader.images_path / 'x.png'
+    os.utime(touched, ns=(0, touched.stat().st_mtime_ns + 10 ** 9))
+    assert build(loader, annotations)['unchanged'] == 3
+    assert crop_mtimes(loader) == mtimes
+
+    write_image(loader.images_path / 'a' / 'x.jpg', width=640, height=480, seed=99)
+    summary = build(loader, annotations)
+    assert (summary['unchanged'], summary['rebuilt']) == (2, 1)
+    changed = {name for name, data in crop_contents(loader).items() if first.get(name) != data}
+    assert changed and all(sample_filename('', 'a/x.jpg', 0)[1:-8] in name for name in changed)
+
+def test_changed_boxes_and_removed_images(loader):
+    annotations = nested_annotations(loader)
+    build(loader, annotations)
+
+    # b/x.jpg loses its annotations and a/x.jpg gets a different box
+    moved = AnnotationIndex(['a/x.jpg', 'x.png'], ['pothole'], [0, 1, 1], [0, 0, 0],
+                            [[30, 30, 90, 90], [100, 100, 150, 140], [300, 200, 360, 260]])
+    summary = build(loader, moved)
+    assert (summary['unchanged'], summary['rebuilt'], summary['removed']) == (1, 1, 1)
+    assert not any(sample_filename('', 'b/x.jpg', 0)[1:-8] in name for name in crop_contents(loader))
+    assert summary['pothole'] == 3 and len(list((loader.processed_path / 'classification' / 'pothole').iterdir())) == 3
+
+def test_changed_settings_rebuild_everything(loader):
+    annotations = nested_annotations(loader)
+    build(loader, annotations)
+    summary = build(loader, annotations, negatives_per_box=1)
+    assert (summary['rebuilt'], summary['no_pothole']) == (3, 4)
+    assert len(list((loader.processed_path / 'classification' / 'no_pothole').iterdir())) == 4
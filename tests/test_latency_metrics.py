@@ -0,0 +1,95 @@
+import re
+
+import pytest
+
+from latency_metrics import LatencyHistogram, LatencyMetrics, StageTimings
+
+def test_percentiles_interpolate_within_buckets():
+    histogram = LatencyHistogram(buckets=(1.0, 2.0, 3.0))
+    for seconds in (0.5, 1.5, 1.5, 2.5):
+        histogram.observe(seconds)
+
+    assert histogram.counts == [1, 2, 1, 0]
+    # Rank 2 of 4 is halfway through the two samples of (1, 2]
+    assert histogram.percentile(50) == pytest.approx(1.5)
+    assert histogram.percentile(25) == pytest.approx(1.0)
+    assert histogram.percentile(10) == pytest.approx(0.4)
+    # The top bucket is capped at the largest sample seen
+    assert histogram.percentile(100) == pytest.approx(2.5)
+    assert histogram.percentile(90) == pytest.approx(2.3)
+
+def test_overflow_bucket_interpolates_up_to_the_maximum():
+    histogram = LatencyHistogram(buckets=(1.0,))
+    for seconds in (0.5, 4.0, 9.0):
+        histogram.observe(seconds)
+    assert histogram.counts == [1, 2]
+    assert histogram.percentile(100) == pytest.approx(9.0)
+    assert histogram.percentile(50) == pytest.approx(1.0 + 8.0 * 0.5 / 2)
+
+def test_empty_histogram():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(99) == 0.0
+    assert histogram.snapshot() == {'count': 0, 'mean_ms': 0.0, 'p50_ms': 0.0, 'p90_ms': 0.0,
+                                    'p99_ms': 0.0, 'max_ms': 0.0}
+
+def test_stage_timings_accumulate_repeated_stages():
+    timings = StageTimings()
+    timings.add('inference', 0.010)
+    timings.add('inference', 0.015)
+    with timings.stage('decode'):
+        pass
+    timings.add('decode', 0.002)
+
+    assert timings.stages['inference'] == pytest.approx(0.025)
+    assert timings.stages['decode'] >= 0.002
+    block = timings.as_dict()
+    assert block['inference_ms'] == pytest.approx(25.0)
+    assert set(block) == {'inference_ms', 'decode_ms', 'total_ms'}
+    assert block['total_ms'] >= 0
+
+def test_metrics_keep_one_histogram_per_stage():
+    metrics = LatencyMetrics(buckets=(0.01, 0.1))
+    for inference in (0.005, 0.05, 0.5):
+        timings = StageTimings()
+        timings.add('inference', inference)
+        timings.add('decode', 0.001)
+        metrics.observe_timings(timings)
+
+    snapshot = metrics.snapshot()
+    assert list(snapshot) == ['decode', 'inference', 'total']
+    assert snapshot['inference']['count'] == 3 and snapshot['decode']['count'] == 3
+    assert snapshot['inference']['mean_ms'] == pytest.approx(1000 * 0.555 / 3)
+    assert snapshot['inference']['max_ms'] == pytest.approx(500.0)
+    assert metrics.histograms['inference'].counts == [1, 1, 1]
+
+def parse_prometheus(text):
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith('#'):
+            continue
+        match = re.fullmatch(r'(\w+)\{([^}]*)\} (\S+)', line)
+        assert match, line
+        labels = tuple(sorted(re.findall(r'(\w+)="([^"]*)"', match.group(2))))
+        samples[(match.group(1), labels)] = float(match.group(3))
+    return samples
+
+def test_prometheus_text_is_cumulative_and_consistent():
+    name = 'stage_seconds'
+    metrics = LatencyMetrics(buckets=(0.001, 0.01, 0.1))
+    observed = {'decode': [0.0005, 0.001, 0.002, 0.2], 'inference': [0.05, 0.05, 5.0]}
+    for stage, values in observed.items():
+        for seconds in values:
+            metrics.observe(stage, seconds)
+
+    text = metrics.prometheus_text(name)
+    assert text.startswith(f"# HELP {name} ") and f"# TYPE {name} histogram\n" in text
+    samples = parse_prometheus(text)
+
+    for stage, values in observed.items():
+        buckets = [samples[(f'{name}_bucket', (('le', le), ('stage', stage)))]
+                   for le in ('0.001', '0.01', '0.1', '+Inf')]
+        # An observation equal to a bound is counted in that bucket
+        assert buckets == [sum(value <= bound for value in values) for bound in (0.001, 0.01, 0.1, float('inf'))]
+        assert buckets == sorted(buckets)
+        assert buckets[-1] == samples[(f'{name}_count', (('stage', stage),))] == len(values)
+        assert samples[(f'{name}_sum', (('stage', stage),))] == pytest.approx(sum(values))
@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import sqlite3
+
+import numpy as np
+import pytest
+
+from near_duplicate_index import NearDuplicateIndex, IndexSaver, dhash, popcount64
+
+def brute_force(hashes, query, max_distance):
+    distances = popcount64(hashes ^ np.uint64(query))
+    best = int(np.argmin(distances))
+    return best if distances[best] <= max_distance else None
+
+def test_lookup_matches_brute_force():
+    rng = np.random.default_rng(0)
+    hashes = rng.integers(0, 2 ** 63, size=5000, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    index = NearDuplicateIndex(max_distance=6)
+    for i, hash_value in enumerate(hashes.tolist()):
+        index.add(hash_value, [0.5, 0.5], 'm', record_id=i)
+
+    for trial in range(500):
+        # Queries at every distance around the limit from a random entry
+        query = int(hashes[rng.integers(len(hashes))])
+        for bit in rng.choice(64, size=trial % 9, replace=False):
+            query ^= 1 << int(bit)
+        expected = brute_force(hashes, query, 6)
+        match = index.lookup(query, 'm')
+        if expected is None:
+            assert match is None
+        else:
+            assert match['distance'] == int(popcount64(hashes[expected:expected + 1] ^ np.uint64(query))[0])
+
+def test_lookup_is_per_model():
+    index = NearDuplicateIndex()
+    index.add(0b1011, [0.2, 0.8], 'model-a', record_id='r1')
+    assert index.lookup(0b1011, 'model-b') is None
+    assert index.lookup(0b1010, 'model-a')['record_id'] == 'r1'
+
+def test_dhash_survives_resizing():
+    rng = np.random.default_rng(1)
+    image = (rng.random((64, 64, 3)) * 255).astype(np.uint8)
+    image = np.kron(image[:16, :16], np.ones((8, 8, 1), dtype=np.uint8))
+    import cv2
+    resized = cv2.resize(image, (100, 100), interpolation=cv2.INTER_AREA)
+    distance = popcount64(np.array([dhash(image) ^ dhash(resized)], dtype=np.uint64))[0]
+    assert distance <= 6
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / 'index')
+    index = NearDuplicateIndex()
+    for i in range(3000):
+        index.add(i * 2654435761 % 2 ** 64, [i / 3000, 1 - i / 3000], 'm', record_id=f"r{i}")
+    index.save(path)
+    assert index.unsaved == 0
+
+    loaded = NearDuplicateIndex.load(path)
+    assert loaded.size == 3000
+    match = loaded.lookup(1234 * 2654435761 % 2 ** 64, 'm')
+    assert match['record_id'] == 'r1234' and match['distance'] == 0
+
+def test_saves_append_only_the_new_entries(tmp_path):
+    path = str(tmp_path / 'index')
+    rng = np.random.default_rng(2)
+    hashes = rng.integers(0, 2 ** 63, size=250, dtype=np.uint64).tolist()
+    index = NearDuplicateIndex()
+    for batch in range(3):
+        for i in range(batch * 100, min(250, (batch + 1) * 100)):
+            index.add(hashes[i], [i / 250, 1 - i / 250], f"model-{i % 2}", record_id=i if i % 3 else f"r{i}")
+        index.save(path)
+    index.save(path)  # Nothing new: no empty segment
+
+    with sqlite3.connect(path + '.db') as db:
+        segments = db.execute("SELECT first_entry, count FROM segments ORDER BY first_entry").fetchall()
+    assert segments == [(0, 100), (100, 100), (200, 50)]
+
+    loaded = NearDuplicateIndex.load(path)
+    assert loaded.size == 250 and loaded.unsaved == 0
+    assert loaded.record_ids == index.record_ids and loaded.model_ids == index.model_ids
+    assert np.array_equal(loaded.probabilities[:250], index.probabilities[:250])
+    assert loaded.tables == index.tables
+    match = loaded.lookup(hashes[202], 'model-0')
+    assert match['record_id'] == 202 and match['probabilities'] == pytest.approx([202 / 250, 1 - 202 / 250])
+
+    # Entries added after a load land in a new segment after the loaded ones
+    loaded.add(7, [0.0, 1.0], 'model-2', record_id='new')
+    loaded.save(path)
+    reloaded = NearDuplicateIndex.load(path)
+    assert reloaded.size == 251 and reloaded.lookup(7, 'model-2')['record_id'] == 'new'
+
+def test_legacy_npz_index_is_migrated(tmp_path):
+    path = str(tmp_path / 'index')
+    np.savez(path + '.npz', hashes=np.array([1, 2 ** 63 + 5], dtype=np.uint64),
+             probabilities=np.array([[0.0, 1.0], [0.5, 0.5]], dtype=np.float32),
+             model_indices=np.array([0, 0], dtype=np.int32))
+    # A sidecar ahead of the arrays, as an interrupted legacy save could leave
+    with open(path + '.json', 'w') as f:
+        json.dump({'max_distance': 6, 'num_blocks': 4, 'model_ids': ['m'], 'record_ids': ['a', 'b', 'c']}, f)
+
+    legacy = NearDuplicateIndex.load(path)
+    assert legacy.size == 2 and legacy.record_ids == ['a', 'b'] and legacy.unsaved == 2
+    assert legacy.lookup(2 ** 63 + 4, 'm')['record_id'] == 'b'
+    legacy.save(path)
+    assert not os.path.exists(path + '.npz') and not os.path.exists(path + '.json')
+
+    migrated = NearDuplicateIndex.load(path)
+    assert migrated.record_ids == ['a', 'b'] and migrated.lookup(1, 'm')['record_id'] == 'a'
+    assert migrated.tables == legacy.tables
+
+def test_saver_writes_after_enough_inserts(tmp_path):
+    path = str(tmp_path / 'index')
+    index = NearDuplicateIndex()
+    saver = IndexSaver(index, path, every_inserts=3, interval=3600, poll_interval=0.01).start()
+    for i in range(3):
+        index.add(i, [0.0, 1.0], 'm', record_id=i)
+
+    deadline = time.monotonic() + 5
+    while index.unsaved and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert NearDuplicateIndex.load(path).size == 3
+
+    index.add(99, [0.0, 1.0], 'm', record_id=99)
+    saver.stop()
+    assert NearDuplicateIndex.load(path).size == 4
+
+def test_saving_an_unrelated_index_over_a_file_is_refused(tmp_path):
+    path = str(tmp_path / 'index')
+    first = NearDuplicateIndex()
+    first.add(1, [0.0, 1.0], 'm', record_id='a')
+    first.save(path)
+
+    other = NearDuplicateIndex()
+    other.add(2, [0.0, 1.0], 'm', record_id='b')
+    with pytest.raises(ValueError):
+        other.save(path)
+    assert NearDuplicateIndex.load(path).record_ids == ['a'] and other.unsaved == 1
+
+def test_empty_index_round_trip(tmp_path):
+    path = str(tmp_path / 'index')
+    NearDuplicateIndex(max_distance=4).save(path)
+    loaded = NearDuplicateIndex.load(path)
+    assert loaded.size == 0 and loaded.max_distance == 4 and loaded.lookup(1, 'm') is None
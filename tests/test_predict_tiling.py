@@ -0,0 +1,40 @@
+import cv2
+import numpy as np
+
+from predict_image_kaggle import KagglePotholeDetector
+from test_image_headers import with_orientation
+
+class BrightTileModel:
+    """Scores an input as a pothole when it is mostly white"""
+    def predict(self, batch, verbose=0):
+        scores = (batch.mean(axis=(1, 2, 3)) > 0.5).astype(np.float32)
+        return np.stack([1 - scores, scores], axis=1)
+
+def landscape_jpeg():
+    # 600x300 as stored, white on the left; orientation 6 shows it as 300x600, white on top
+    image = np.zeros((300, 600, 3), dtype=np.uint8)
+    image[:, :240] = 255
+    return with_orientation(cv2.imencode('.jpg', image)[1].tobytes(), 6)
+
+def test_exif_rotated_jpeg_reports_the_displayed_size():
+    detector = KagglePotholeDetector()
+    img, original_size = detector.decode_for_tiling(landscape_jpeg(), max_side=896)
+    assert img.shape[:2] == (600, 300)
+    assert original_size == (300, 600)
+
+    # Decoded at 1/2 scale as 150x300, then scaled up to one tile wide
+    img, original_size = detector.decode_for_tiling(landscape_jpeg(), max_side=300)
+    assert img.shape[:2] == (448, 224)
+    assert original_size == (300, 600)
+
+def test_tiled_bounding_box_of_exif_rotated_jpeg():
+    detector = KagglePotholeDetector()
+    detector.model = BrightTileModel()
+    prediction = detector.predict_tiled(landscape_jpeg(), max_side=896)
+
+    tiled = prediction['tiled']
+    assert tiled['original_size'] == [300, 600]
+    box = tiled['bounding_box']
+    # The white band runs across the top of the displayed image
+    assert box['xmin'] == 0 and box['ymin'] == 0
+    assert box['xmax'] <= 300 and box['ymax'] <= 300
@@ -0,0 +1,115 @@
+import time
+import threading
+
+from prediction_cache import PredictionCache
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+def test_lru_evicts_the_least_recently_used_entry():
+    cache = PredictionCache(max_entries=2)
+    cache.put('a', {'value': 1})
+    cache.put('b', {'value': 2})
+    assert cache.get('a') == {'value': 1}
+    cache.put('c', {'value': 3})
+
+    assert cache.get('b') is None
+    assert cache.get('a') == {'value': 1} and cache.get('c') == {'value': 3}
+    assert cache.stats()['memory_entries'] == 2
+
+def test_returned_predictions_are_copies():
+    cache = PredictionCache()
+    cache.put('a', {'value': 1})
+    cache.get('a')['value'] = 99
+    assert cache.get('a') == {'value': 1}
+
+def test_disk_tier_survives_close_and_reopen(tmp_path):
+    path = str(tmp_path / 'cache' / 'predictions.db')
+    cache = PredictionCache(max_entries=1, disk_path=path)
+    cache.put('a', {'is_pothole': True, 'confidence': 0.9})
+    cache.put('b', {'is_pothole': False, 'confidence': 0.2})
+    # 'a' left memory but is still on disk
+    assert cache.get('a') == {'is_pothole': True, 'confidence': 0.9}
+    cache.close()
+
+    reopened = PredictionCache(disk_path=path)
+    assert reopened.get('b') == {'is_pothole': False, 'confidence': 0.2}
+    assert reopened.get('b') == {'is_pothole': False, 'confidence': 0.2}
+    stats = reopened.stats()
+    assert stats['disk_hits'] == 1 and stats['memory_hits'] == 1 and stats['disk_tier']
+    reopened.close()
+
+def test_keys_differ_by_model_and_threshold():
+    image = b'same upload'
+    key = PredictionCache.make_key(image, 'model-a', 0.7)
+    assert PredictionCache.make_key(image, 'model-a', 0.70) == key
+    assert PredictionCache.make_key(b'other upload', 'model-a', 0.7) != key
+
+    cache = PredictionCache()
+    cache.put(key, {'model': 'a'})
+    assert cache.get(PredictionCache.make_key(image, 'model-b', 0.7)) is None
+    assert cache.get(PredictionCache.make_key(image, 'model-a', 0.9)) is None
+    assert cache.get(key) == {'model': 'a'}
+
+def run_concurrently(cache, key, compute, count):
+    results = [None] * count
+
+    def call(i):
+        try:
+            results[i] = cache.get_or_compute(key, compute)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+def test_concurrent_identical_requests_compute_once():
+    cache = PredictionCache()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return {'confidence': 0.8}
+
+    threads, results = run_concurrently(cache, 'key', compute, 8)
+    wait_for(lambda: cache.stats()['coalesced'] == 7)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{'confidence': 0.8}] * 8
+    assert cache.get('key') == {'confidence': 0.8}
+
+def test_failed_computation_reaches_every_waiter_and_is_not_cached():
+    cache = PredictionCache()
+    release = threading.Event()
+    calls = []
+
+    def failing():
+        calls.append(1)
+        release.wait(5)
+        raise RuntimeError("model crashed")
+
+    threads, results = run_concurrently(cache, 'key', failing, 5)
+    wait_for(lambda: cache.stats()['coalesced'] == 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert all(isinstance(result, RuntimeError) and str(result) == "model crashed" for result in results)
+    assert cache.get('key') is None
+    assert cache.get_or_compute('key', lambda: {'confidence': 0.1}) == {'confidence': 0.1}
+
+def test_none_results_are_shared_but_not_cached():
+    cache = PredictionCache()
+    assert cache.get_or_compute('key', lambda: None) is None
+    assert cache.get('key') is None
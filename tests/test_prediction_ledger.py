@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from predict_image_kaggle import KagglePotholeDetector, RULE_THRESHOLDS, analyse_prediction
+from prediction_ledger import PredictionLedger, recommendation_table, rescore
+
+def probability_rows():
+    rng = np.random.default_rng(0)
+    pothole = np.concatenate([
+        rng.random(2000),
+        # Values on and around every bound the rules compare against
+        np.array([0.5, 0.55, 0.65, 0.75, 0.8, 0.85, 0.9, 0.95, 1.0, 0.0, 0.35, 0.25, 0.15, 0.05]),
+        np.nextafter(np.array([0.65, 0.75, 0.85, 0.95]), 1.0),
+    ])
+    return np.stack([1 - pothole, pothole], axis=1).astype(np.float32)
+
+def scalar_results(probabilities, confidence_threshold):
+    detector = KagglePotholeDetector()
+    return [analyse_prediction(detector.build_prediction(row, confidence_threshold)) for row in probabilities]
+
+@pytest.mark.parametrize('confidence_threshold', [0.7, 0.9])
+def test_rescore_matches_scalar_rules(confidence_threshold):
+    probabilities = probability_rows()
+    expected = scalar_results(probabilities, confidence_threshold)
+    scores = rescore(probabilities, confidence_threshold)
+    table = recommendation_table()
+
+    for i, result in enumerate(expected):
+        prediction = result['prediction']
+        assert scores['is_pothole'][i] == prediction['is_pothole']
+        assert scores['is_reliable'][i] == prediction['is_reliable']
+        assert scores['base_severity'][i] == prediction['severity']
+        assert scores['severity'][i] == result['severity']
+        assert scores['confidence_level'][i] == result['confidence_level']
+        assert scores['action_priority'][i] == result['action_priority']
+        assert scores['estimated_size'][i] == result['estimated_size']
+        assert table[scores['recommendation'][i]] == result['recommendations']
+
+def test_rescore_keeps_tiled_sizes_for_potholes():
+    probabilities = np.array([[0.1, 0.9], [0.9, 0.1]])
+    scores = rescore(probabilities, 0.7, tiled_estimated_size=np.array(['Medium', 'Large'], dtype=object))
+    assert scores['estimated_size'].tolist() == ['Medium', 'N/A']
+
+def test_rule_overrides_change_the_result():
+    probabilities = np.array([[0.2, 0.8]])
+    assert rescore(probabilities, 0.7)['base_severity'][0] == 3
+    bounds = [0.5, 0.6, 0.7, 0.79]
+    assert rescore(probabilities, 0.7, rules={'severity_bounds': bounds})['base_severity'][0] == 5
+    assert RULE_THRESHOLDS['severity_bounds'] != bounds
+
+def test_ledger_round_trip_rescores_stored_predictions(tmp_path):
+    detector = KagglePotholeDetector()
+    probabilities = probability_rows()[:300]
+    ledger = PredictionLedger(str(tmp_path / 'ledger.db'), batch_size=64, flush_interval=0)
+    for i, row in enumerate(probabilities):
+        prediction = detector.build_prediction(row, 0.7, model_version='v1' if i % 2 else 'v2')
+        ledger.record(f"sha{i}", prediction, record_id=i,
+                      action_priority=analyse_prediction(prediction)['action_priority'])
+
+    arrays = ledger.load_arrays(model_version='v1', identifiers=True)
+    ledger.close()
+    assert arrays['model_version'].tolist() == ['v1'] * 150
+    assert arrays['image_sha256'].tolist() == [f"sha{i}" for i in range(1, 300, 2)]
+
+    scores = rescore(arrays['probabilities'], arrays['confidence_threshold'], arrays['tiled_estimated_size'])
+    assert np.array_equal(scores['base_severity'], arrays['severity'])
+    assert np.array_equal(scores['action_priority'], arrays['action_priority'])
@@ -0,0 +1,106 @@
+import threading
+import multiprocessing
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+from worker_pool import InferenceWorker, InferenceWorkerPool, cpu_sets
+
+class FakeDetector:
+    def build_prediction(self, probabilities, confidence_threshold=0.7, model_version=None):
+        if probabilities[1] < 0:
+            raise ValueError("bad row")
+        return {'confidence': float(probabilities[1]), 'model_version': model_version}
+
+class BrokenConn:
+    """A pipe whose writes fail, as after the worker died but before its receiver noticed"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def recv(self):
+        return self.conn.recv()
+
+    def send(self, message):
+        raise BrokenPipeError(32, "Broken pipe")
+
+class FakeProcess:
+    def is_alive(self):
+        return True
+
+    def join(self, timeout=None):
+        pass
+
+def fake_worker(conn):
+    """Answer each image with its mean as the pothole probability; a NaN image makes it exit"""
+    while True:
+        message = conn.recv()
+        if message is None:
+            return
+        task_id, image = message
+        mean = float(image.mean())
+        if np.isnan(mean):
+            conn.close()
+            return
+        conn.send(('result', [task_id], np.array([[1 - mean, mean]], dtype=np.float32), None, 'v1', 0.0))
+
+def kill_worker(pool, index):
+    pool.workers[index].conn.send((-1, np.array([np.nan])))
+    pool.workers[index].receiver.join(timeout=5)
+
+def make_pool(num_workers=2):
+    pool = InferenceWorkerPool(FakeDetector(), num_workers=num_workers, max_restarts=0)
+    for index in range(num_workers):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        pool.workers.append(InferenceWorker(index, FakeProcess(), parent_conn))
+        threading.Thread(target=fake_worker, args=(child_conn,), daemon=True).start()
+    for worker in pool.workers:
+        pool._start_receiver(worker)
+    return pool
+
+def test_results_reach_their_futures():
+    pool = make_pool()
+    futures = [pool.submit(np.full(4, i / 10)) for i in range(10)]
+    assert [f.result(timeout=5)['confidence'] for f in futures] == pytest.approx([i / 10 for i in range(10)])
+    assert all(worker.requests for worker in pool.workers)
+
+def test_failed_result_keeps_receiver_running():
+    pool = make_pool(num_workers=1)
+    with pytest.raises(ValueError):
+        pool.submit(np.full(4, -1.0)).result(timeout=5)
+    assert pool.submit(np.full(4, 0.5)).result(timeout=5)['confidence'] == pytest.approx(0.5)
+
+def test_dead_worker_is_skipped_and_its_tasks_fail():
+    pool = make_pool()
+    # An image the worker took but never answered
+    orphan = Future()
+    pool.pending[-2] = (orphan, 0.7, 0.0, pool.workers[0])
+    pool.workers[0].outstanding += 1
+    kill_worker(pool, 0)
+
+    with pytest.raises(RuntimeError):
+        orphan.result(timeout=5)
+    assert not pool.workers[0].alive
+    futures = [pool.submit(np.full(4, 0.25)) for _ in range(5)]
+    assert all(f.result(timeout=5)['confidence'] == pytest.approx(0.25) for f in futures)
+    assert pool.workers[0].outstanding == 0 and pool.workers[1].requests == 5
+
+def test_send_to_unnoticed_dead_worker_falls_back():
+    pool = make_pool()
+    pool.workers[0].conn = BrokenConn(pool.workers[0].conn)
+    pool.workers[0].requests = -1  # Make it the preferred worker
+    assert pool.submit(np.full(4, 0.75)).result(timeout=5)['confidence'] == pytest.approx(0.75)
+    assert not pool.workers[0].alive
+    assert all(task[3] is not pool.workers[0] for task in pool.pending.values())
+    assert pool.workers[0].outstanding == 0
+
+def test_no_live_worker_fails_fast():
+    pool = make_pool(num_workers=1)
+    kill_worker(pool, 0)
+    with pytest.raises(RuntimeError):
+        pool.submit(np.zeros(4))
+
+def test_cpu_sets_cover_requested_workers():
+    blocks = cpu_sets(3)
+    assert len(blocks) == 3 and all(blocks)